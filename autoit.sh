@@ -17,13 +17,15 @@ echo "=== STAGE 0 ==="
   ../flex/autoit/stage0/
 
 ./py/simplify.py \
-  ../flex/autoit/stage0/G.gpickle \
+  ../flex/autoit/stage0/G.rdfa \
   ../flex/autoit/out/
 
 echo "=== STAGE 1 ==="
 
-echo "SCALA"
-parallel -j 12 echo print {} ';' ./scala/jreflex.sh print "{}.regexp" "{}" ::: ../flex/autoit/out/*.dfa
+echo "REGEXPS"
+./py/dfa2re.py -j 12 ../flex/autoit/out/*.dfa
+#echo "SCALA"
+#parallel -j 12 echo print {} ';' ./scala/jreflex.sh print "{}.regexp" "{}" ::: ../flex/autoit/out/*.dfa
 #for f in ../flex/autoit/out/*.dfa;
 #do
   #echo "SCALA $f"
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import argparse
+import shlex
+import sys
+
+import reflex.fuzzer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='copy the smallest subset of a queue that covers the same bitmap',
+        usage='%(prog)s [options] queue/ out-queue/ -- target [args, @@ for the input file]',
+    )
+    parser.add_argument('queue', metavar='queue/', type=str, help='e.g. sync-dir/bbz/queue')
+    parser.add_argument('out_queue', metavar='out-queue/', type=str)
+    parser.add_argument('-f', '--file', type=str, help='file the target reads the input from (default: @@)')
+    parser.add_argument('--executor', type=str, choices=reflex.fuzzer.EXECUTORS, default='forkserver')
+    ours = sys.argv[1:]
+    argv = []
+    if '--' in ours:
+        i = ours.index('--')
+        ours, argv = ours[:i], ours[i + 1:]
+    args = parser.parse_args(ours)
+
+    if not argv:
+        parser.error('missing the target command line')
+    if args.file is None and '@@' not in argv:
+        parser.error('the target needs either -f or @@')
+
+    reflex.fuzzer.cmin(args.queue, args.out_queue, shlex.join(argv), args.file or '', args.executor)
+
+
+if __name__ == '__main__':
+    main()
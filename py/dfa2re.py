@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+
+import reflex.dfa2re
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', metavar='N_M.dfa', type=str, nargs='+')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--bundle', metavar='regexps.rregex', type=str,
+                        help='also pack all the regexps into one file for the fuzzer')
+    args = parser.parse_args()
+
+    files = [os.path.abspath(f) for f in args.files]
+    reflex.dfa2re.main(files, args.jobs, args.bundle)
+
+
+if __name__ == '__main__':
+    main()
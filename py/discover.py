@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import reflex.discover
+
+
+def main():
+    parser = argparse.ArgumentParser(description='look for flex tables in a binary')
+    parser.add_argument('target', type=str, nargs=1)
+    parser.add_argument('--endianness', type=str, choices=('little', 'big'), default=None,
+                        help='default: the one of the binary, or both for raw files')
+    parser.add_argument('-n', '--count', type=int, default=1, help='how many layouts to print')
+    args = parser.parse_args()
+
+    layouts = reflex.discover.discover(args.target[0], args.endianness)
+    if not layouts:
+        parser.exit(1, 'no flex tables found\n')
+
+    for layout in layouts[:args.count]:
+        print('# score {:.2f}'.format(layout.score))
+        print(reflex.discover.to_args(layout))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import argparse
+import shlex
+import sys
+
+import reflex.fuzzer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='token-aware fuzzer, AFL sync dir compatible',
+        usage='%(prog)s [options] sync-dir regexps/ -- target [args, @@ for the input file]',
+    )
+    parser.add_argument('sync_dir', metavar='sync-dir', type=str)
+    parser.add_argument('regexps', metavar='regexps/', type=str,
+                        help='N_M.dfa.regexp files, a bundle of them, or the N_M.dfa files / G.rdfa themselves')
+    parser.add_argument('-f', '--file', type=str, help='file the target reads the input from (default: @@)')
+    parser.add_argument('-n', '--name', type=str, default='bbz', help='instance name (prefix with --workers)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='fuzzer processes sharing one coverage map')
+    parser.add_argument('--executor', type=str, choices=reflex.fuzzer.EXECUTORS, default='forkserver')
+    ours = sys.argv[1:]
+    argv = []
+    if '--' in ours:
+        i = ours.index('--')
+        ours, argv = ours[:i], ours[i + 1:]
+    args = parser.parse_args(ours)
+
+    if not argv:
+        parser.error('missing the target command line')
+    if args.file is None and '@@' not in argv:
+        parser.error('the target needs either -f or @@')
+    if args.workers > 1 and '@@' not in argv:
+        parser.error('--workers needs @@ in the target command line')
+
+    reflex.fuzzer.main(args.sync_dir, args.file or '', shlex.join(argv), args.regexps, args.executor,
+                       args.workers, args.name)
+
+
+if __name__ == '__main__':
+    main()
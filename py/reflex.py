@@ -3,7 +3,9 @@
 import argparse
 import os
 
+import reflex.batch
 import reflex.reflex
+import reflex.stats
 from reflex.reflex import SizedOffset
 
 
@@ -14,28 +16,66 @@ def s2i(s):
         return int(s)
 
 
+TABLE_HELP = 'offset size [count]'
+
+
+def sized_offset(parser, name, args):
+    if len(args) not in {2, 3}:
+        parser.error('--{} expects {}'.format(name, TABLE_HELP))
+    return SizedOffset(*args)
+
+
+TABLE_ARGS = ('accept', 'base', 'chk', 'def', 'ec', 'meta', 'nxt')
+
+
+def outputs(parser, value):
+    names = tuple(n for n in value.split(',') if n)
+    unknown = set(names) - set(reflex.reflex.OUTPUTS)
+    if unknown:
+        parser.error('--outputs: unknown {} (choose from {})'.format(
+            ', '.join(sorted(unknown)), ', '.join(reflex.reflex.OUTPUTS)))
+    return names
+
+
 def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('target', type=str, nargs=1)
-    parser.add_argument('out_path', metavar="out-path/", type=str, nargs=1)
-    parser.add_argument('--accept', metavar=('offset', 'size'), type=s2i, nargs=2, required=1)
-    parser.add_argument('--base', metavar=('offset', 'size'), type=s2i, nargs=2, required=1)
-    parser.add_argument('--chk', metavar=('offset', 'size'), type=s2i, nargs=2, required=1)
-    parser.add_argument('--def', metavar=('offset', 'size'), type=s2i, nargs=2, required=1)
-    parser.add_argument('--ec', metavar=('offset', 'size'), type=s2i, nargs=2, required=1)
-    parser.add_argument('--meta', metavar=('offset', 'size'), type=s2i, nargs=2, required=1)
-    parser.add_argument('--nxt', metavar=('offset', 'size'), type=s2i, nargs=2, required=1)
-    parser.add_argument('--max-state', type=s2i, nargs=1, required=1)
-    parser.add_argument('--endianness', type=str, nargs=1, default='little')
+    parser = argparse.ArgumentParser(epilog='or: %(prog)s --batch manifest.{json,toml} [-j N]')
+    parser.add_argument('target', type=str, nargs='?')
+    parser.add_argument('out_path', metavar="out-path/", type=str, nargs='?')
+    for name in TABLE_ARGS:
+        parser.add_argument('--' + name, metavar='N', type=s2i, nargs='+', help=TABLE_HELP)
+    parser.add_argument('--max-state', type=s2i, nargs=1)
+    parser.add_argument('--endianness', type=str, choices=('little', 'big'), default='little')
     parser.add_argument('--strip-nulls', type=bool, nargs=1, default=True)
+    parser.add_argument('--decompress', type=str, choices=('vector', 'memo'), default='vector')
+    parser.add_argument('--minimize', action='store_true', help='merge equivalent states before writing anything')
+    parser.add_argument('--outputs', metavar='a,b,...', type=str,
+                        help='what to write, among {} (default: {})'.format(
+                            ', '.join(reflex.reflex.OUTPUTS), ','.join(reflex.reflex.DEFAULT_OUTPUTS)))
+    parser.add_argument('--batch', metavar='manifest', type=str, help='extract every lexer listed in a manifest')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='worker processes for --batch')
+    parser.add_argument('--report', metavar='report.json', type=str, help='write phase timings and counters')
+    parser.add_argument('--profile', type=str, choices=reflex.stats.PROFILERS,
+                        help='profile the run into out-path/profile.*')
     args = parser.parse_args()
+    selected = None if args.outputs is None else outputs(parser, args.outputs)
+
+    if args.batch:
+        configs = reflex.batch.load_manifest(args.batch)
+        if selected is not None:
+            configs = [c._replace(outputs=selected) for c in configs]
+        failed = reflex.batch.batch(configs, args.jobs, args.report)
+        for out_path in failed:
+            print('FAILED', out_path)
+        parser.exit(1 if failed else 0)
 
-    assert args.endianness in {'little', 'big'}
+    missing = [name for name in ('target', 'out_path', 'max_state') + TABLE_ARGS if getattr(args, name) is None]
+    if missing:
+        parser.error('the following arguments are required: {}'.format(', '.join(missing)))
 
-    target = args.target[0]
+    target = args.target
     target = os.path.abspath(target)
 
-    out_path = args.out_path[0]
+    out_path = args.out_path
     out_path = os.path.abspath(out_path)
     os.makedirs(out_path, exist_ok=True)
 
@@ -46,16 +86,22 @@ def main():
         args.strip_nulls,
         set(),
         args.endianness,
-        SizedOffset(args.accept[0], args.accept[1]),
-        SizedOffset(args.base[0]  , args.base[1]),
-        SizedOffset(args.chk[0]   , args.chk[1]),
-        SizedOffset(getattr(args, 'def')[0], getattr(args, 'def')[1]),
-        SizedOffset(args.ec[0]    , args.ec[1]),
-        SizedOffset(args.meta[0]  , args.meta[1]),
-        SizedOffset(args.nxt[0]   , args.nxt[1]),
+        sized_offset(parser, 'accept', args.accept),
+        sized_offset(parser, 'base', args.base),
+        sized_offset(parser, 'chk', args.chk),
+        sized_offset(parser, 'def', getattr(args, 'def')),
+        sized_offset(parser, 'ec', args.ec),
+        sized_offset(parser, 'meta', args.meta),
+        sized_offset(parser, 'nxt', args.nxt),
+        args.decompress,
+        args.minimize,
+        selected,
     )
 
-    reflex.reflex.reflex(config)
+    with reflex.stats.profiled(args.profile, reflex.stats.profile_path(args.profile, out_path)):
+        stats = reflex.reflex.reflex(config)
+    if args.report:
+        stats.dump(args.report)
     # reflex.reflex.reflex(SYMBOLS, SLEIGH, '../data/', MAX_STATE)
 
 
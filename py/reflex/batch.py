@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import json
+import mmap
+import multiprocessing
+import os
+import traceback
+
+from .reflex import OUTPUTS
+from .reflex import TABLES
+from .reflex import Config
+from .reflex import SizedOffset
+from .reflex import reflex
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+
+# A manifest lists the lexers to extract, e.g.
+#
+#   {
+#     "defaults": {"endianness": "little"},
+#     "lexers": [
+#       {
+#         "target": "firmware/bin/sleigh",
+#         "out": "workdir/sleigh",
+#         "max_state": 522,
+#         "tables": {"accept": ["0x74760", 2], "base": ["0x75100", 2], ...}
+#       }
+#     ]
+#   }
+#
+# (or the same thing in TOML with [[lexers]]). Numbers may be written as
+# "0x..." strings, tables take an optional count like the command line and
+# relative paths are relative to the manifest.
+KEYS = {
+    'target',
+    'out',
+    'max_state',
+    'tables',
+    'endianness',
+    'strip_nulls',
+    'strip_states',
+    'decompress',
+    'minimize',
+    'outputs',
+}
+
+
+def to_int(v):
+    if isinstance(v, str):
+        return int(v, 0)
+    return v
+
+
+def outputs(where, value):
+    # A list of names or a comma-separated string, like --outputs
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [n for n in value.split(',') if n]
+    unknown = set(value) - set(OUTPUTS)
+    if unknown:
+        raise ValueError('{}: unknown outputs {}'.format(where, ', '.join(sorted(unknown))))
+    return tuple(value)
+
+
+def load_manifest(path):
+    with open(path, 'rb') as f:
+        if path.endswith('.toml'):
+            if tomllib is None:
+                raise ValueError('{}: TOML manifests need python 3.11+'.format(path))
+            manifest = tomllib.load(f)
+        else:
+            manifest = json.load(f)
+
+    root = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults', {})
+    configs = []
+    for i, lexer in enumerate(manifest['lexers']):
+        entry = dict(defaults, **lexer)
+        where = '{}: lexer #{}'.format(path, i)
+        unknown = set(entry) - KEYS
+        if unknown:
+            raise ValueError('{}: unknown keys {}'.format(where, ', '.join(sorted(unknown))))
+        missing = [k for k in ('target', 'out', 'max_state', 'tables') if k not in entry]
+        if missing:
+            raise ValueError('{}: missing {}'.format(where, ', '.join(missing)))
+
+        tables = []
+        for name in TABLES:
+            t = entry['tables'].get(name[3:])
+            if t is None or len(t) not in {2, 3}:
+                raise ValueError('{}: {} expects offset size [count]'.format(where, name[3:]))
+            tables.append(SizedOffset(*(to_int(x) for x in t)))
+
+        configs.append(Config(
+            os.path.join(root, entry['target']),
+            os.path.join(root, entry['out']),
+            to_int(entry['max_state']),
+            entry.get('strip_nulls', True),
+            set(entry.get('strip_states', ())),
+            entry.get('endianness', 'little'),
+            *tables,
+            entry.get('decompress', 'vector'),
+            entry.get('minimize', False),
+            outputs(where, entry.get('outputs')),
+        ))
+
+    outs = [c.out_path for c in configs]
+    if len(set(outs)) != len(outs):
+        raise ValueError('{}: several lexers write to the same out directory'.format(path))
+    return configs
+
+
+# Every process maps each binary once, however many lexers it holds
+_mapped = {}
+
+
+def mapped(path):
+    m = _mapped.get(path)
+    if m is None:
+        with open(path, 'rb') as f:
+            m = _mapped[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return m
+
+
+def run(config):
+    # Returns (out directory, report of the run or None if it failed)
+    print('== {} -> {}'.format(config.target, config.out_path))
+    try:
+        os.makedirs(config.out_path, exist_ok=True)
+        stats = reflex(config, mapped(config.target))
+    except Exception:
+        traceback.print_exc()
+        return config.out_path, None
+    return config.out_path, stats.report()
+
+
+def batch(configs, jobs=1, report=None):
+    # Returns the out directories of the lexers that failed. `report` is the
+    # path of a JSON file with the report of every lexer.
+
+    # Lexers of the same binary next to each other so that chunks of them
+    # land on the same worker
+    configs = sorted(configs, key=lambda c: c.target)
+    if jobs <= 1:
+        results = [run(c) for c in configs]
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(run, configs, chunksize=max(1, len(configs) // (jobs * 4)))
+
+    if report is not None:
+        with open(report, 'w') as f:
+            json.dump(dict(results), f, indent=2, sort_keys=True)
+    return [out for out, r in results if r is None]
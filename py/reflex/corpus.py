@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+
+import numpy as np
+
+from .executor import MAP_SIZE
+
+
+# A queue is a directory of AFL-named entries (id:000042,src:...) holding the
+# flat bytes the target reads. .tokens/<entry> keeps where the tokens of an
+# entry start and end (as little-endian uint32 lengths), so that resumed or
+# synced entries can be mutated token-wise again. afl-fuzz skips both.
+TOKENS_DIR = '.tokens'
+# Like afl-fuzz: .synced/<instance> holds the id of the next entry to import
+# from that instance
+SYNCED_DIR = '.synced'
+
+
+def entry_id(fn):
+    # id:000042,src:000007 -> 42, None for anything that is not an entry
+    if not fn.startswith('id:'):
+        return None
+    try:
+        return int(fn[3:].split(',')[0])
+    except ValueError:
+        return None
+
+
+def entries(queue):
+    # [(id, file name)] sorted by id
+    ret = []
+    for fn in os.listdir(queue):
+        i = entry_id(fn)
+        if i is not None and os.path.isfile(os.path.join(queue, fn)):
+            ret.append((i, fn))
+    return sorted(ret)
+
+
+def write_entry(queue, fn, tokens):
+    tokens = [bytes(t) for t in tokens]
+    os.makedirs(os.path.join(queue, TOKENS_DIR), exist_ok=True)
+    # The boundaries go first: whoever lists the queue finds them in place
+    np.array([len(t) for t in tokens], dtype='<u4').tofile(os.path.join(queue, TOKENS_DIR, fn))
+    with open(os.path.join(queue, fn), 'wb') as f:
+        f.write(b''.join(tokens))
+
+
+def read_entry(queue, fn):
+    # The tokens of an entry, or its whole content as one token when nobody
+    # recorded them (e.g. entries of afl-fuzz)
+    with open(os.path.join(queue, fn), 'rb') as f:
+        buff = f.read()
+    try:
+        lengths = np.fromfile(os.path.join(queue, TOKENS_DIR, fn), dtype='<u4').astype(np.int64)
+    except FileNotFoundError:
+        return [buff]
+    if int(lengths.sum()) != len(buff):
+        return [buff]
+    ends = np.cumsum(lengths)
+    return [buff[s:e] for s, e in zip((ends - lengths).tolist(), ends.tolist())]
+
+
+def read_synced(instance_dir):
+    # {instance: id of the next entry to import}
+    path = os.path.join(instance_dir, SYNCED_DIR)
+    ret = {}
+    if not os.path.isdir(path):
+        return ret
+    for name in os.listdir(path):
+        with open(os.path.join(path, name), 'rb') as f:
+            data = f.read(4)
+        if len(data) == 4:
+            ret[name] = struct.unpack('I', data)[0]
+    return ret
+
+
+def write_synced(instance_dir, name, next_id):
+    path = os.path.join(instance_dir, SYNCED_DIR)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, name), 'wb') as f:
+        f.write(struct.pack('I', next_id))
+
+
+def cmin(traces, sizes, map_size=MAP_SIZE):
+    # afl-cmin on sparse classified traces (see coverage.sparse): for every
+    # bit set by some trace, keeps the smallest testcase setting it. Walking
+    # from the smallest testcase up, that is whoever sets a bit none of the
+    # kept ones did. Returns the kept indices, in order.
+    covered = np.zeros(map_size, dtype=np.uint8)
+    keep = []
+    for i in sorted(range(len(traces)), key=lambda i: (sizes[i], i)):
+        idx, values = traces[i]
+        if (values & ~covered[idx]).any():
+            covered[idx] |= values
+            keep.append(i)
+    return sorted(keep)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import hashlib
+
+import numpy as np
+
+from .executor import MAP_SIZE
+
+
+# AFL's hit-count buckets: 1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+
+COUNT_CLASS = np.zeros(256, dtype=np.uint8)
+COUNT_CLASS[1] = 1
+COUNT_CLASS[2] = 2
+COUNT_CLASS[3] = 4
+COUNT_CLASS[4:8] = 8
+COUNT_CLASS[8:16] = 16
+COUNT_CLASS[16:32] = 32
+COUNT_CLASS[32:128] = 64
+COUNT_CLASS[128:] = 128
+
+# has_new_bits() results, like AFL's
+NO_NEW_BITS = 0
+NEW_HIT_COUNT = 1
+NEW_TUPLE = 2
+
+
+def classify(trace):
+    # Buckets the hit counts of a raw trace in place (only the non-zero
+    # 64-bit words are looked at) and returns it
+    words = trace.view(np.uint64)
+    nz = np.flatnonzero(words)
+    if nz.size:
+        sub = trace.reshape(-1, 8)[nz]
+        trace.reshape(-1, 8)[nz] = COUNT_CLASS[sub]
+    return trace
+
+
+def coverage_hash(trace):
+    # 64-bit digest of a classified trace, to tell testcases apart
+    return int.from_bytes(hashlib.blake2b(trace, digest_size=8).digest(), 'little')
+
+
+def sparse(trace):
+    # (indices, values) of the non-zero bytes of a trace: what is worth
+    # keeping around for every testcase
+    idx = np.flatnonzero(trace).astype(np.uint32)
+    return idx, trace[idx]
+
+
+class VirginMap(object):
+    # The bits no classified trace has set yet, starting all ones like AFL's
+    # virgin_bits
+
+    def __init__(self, size=MAP_SIZE, buffer=None):
+        # With `buffer` (e.g. the .buf of a multiprocessing SharedMemory) the
+        # map lives there, already initialized by whoever created it
+        if buffer is None:
+            self.bits = np.full(size, 0xff, dtype=np.uint8)
+        else:
+            self.bits = np.frombuffer(buffer, dtype=np.uint8, count=size)
+        self._words = self.bits.view(np.uint64)
+        self._scratch = np.empty_like(self._words)
+
+    def has_new_bits(self, trace):
+        # NO_NEW_BITS, NEW_HIT_COUNT or NEW_TUPLE (a byte never hit before),
+        # clearing the new bits from the map
+        np.bitwise_and(trace.view(np.uint64), self._words, out=self._scratch)
+        if not self._scratch.any():
+            return NO_NEW_BITS
+
+        nz = np.flatnonzero(self._scratch)
+        t = trace.reshape(-1, 8)[nz]
+        v = self.bits.reshape(-1, 8)[nz]
+        ret = NEW_TUPLE if ((t != 0) & (v == 0xff)).any() else NEW_HIT_COUNT
+        self.bits.reshape(-1, 8)[nz] = v & ~t
+        return ret
+
+    def coverage(self):
+        # Fraction of the map touched so far
+        return float(np.count_nonzero(self.bits != 0xff)) / len(self.bits)
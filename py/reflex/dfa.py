@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+import mmap
+import struct
+
+import numpy as np
+
+
+# On-disk container: a header, one descriptor per array and the raw arrays,
+# each aligned so that they can be used straight out of an mmap.
+HEADER = struct.Struct('<8sII')
+DESCRIPTOR = struct.Struct('<16s8sIQQQ')
+ALIGN = 64
+
+DFA_MAGIC = b'RFLXDFA\0'
+DFA_VERSION = 1
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_arrays(path, magic, version, arrays):
+    # Everything is stored little-endian
+    arrays = [(name, np.ascontiguousarray(a, dtype=a.dtype.newbyteorder('<'))) for name, a in arrays.items()]
+    offset = _align(HEADER.size + DESCRIPTOR.size * len(arrays))
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(magic, version, len(arrays)))
+        for name, a in arrays:
+            assert a.ndim <= 2
+            shape = a.shape + (0,) * (2 - a.ndim)
+            f.write(DESCRIPTOR.pack(name.encode(), a.dtype.str.encode(), a.ndim, shape[0], shape[1], offset))
+            offset = _align(offset + a.nbytes)
+
+        for name, a in arrays:
+            f.seek(_align(f.tell()))
+            f.write(a.tobytes())
+        # Up to the end of the last array, even when it is empty
+        f.truncate(offset)
+
+
+def read_arrays(path, magic, version):
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    file_magic, file_version, count = HEADER.unpack_from(data, 0)
+    if file_magic != magic:
+        raise ValueError('{} is not a {!r} file'.format(path, magic))
+    if file_version != version:
+        raise ValueError('{} has version {}, expected {}'.format(path, file_version, version))
+
+    arrays = {}
+    for i in range(count):
+        name, dtype, ndim, rows, cols, offset = DESCRIPTOR.unpack_from(data, HEADER.size + i * DESCRIPTOR.size)
+        shape = (rows, cols)[:ndim]
+        dtype = np.dtype(dtype.rstrip(b'\0').decode())
+        count = int(np.prod(shape))
+        if count == 0:
+            # Files written before the padding end before their empty arrays
+            a = np.zeros(shape, dtype=dtype)
+        else:
+            a = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        arrays[name.rstrip(b'\0').decode()] = a.reshape(shape)
+    return arrays
+
+
+def pack_alphabets(masks):
+    # m x 256 bool masks -> m x 4 uint64, bit i of the mask being bit i % 64
+    # of word i // 64
+    masks = np.ascontiguousarray(masks, dtype=bool).reshape(-1, 256)
+    return np.packbits(masks, axis=1, bitorder='little').view('<u8')
+
+
+def unpack_alphabets(words):
+    words = np.ascontiguousarray(words, dtype='<u8').reshape(-1, 4)
+    return np.unpackbits(words.view(np.uint8), axis=1, bitorder='little').astype(bool)
+
+
+def to_ranges(alphabets):
+    # m x 256 bool masks -> for every row, a list of inclusive (lo, hi) ranges
+    padded = np.zeros((alphabets.shape[0], 258), dtype=np.int8)
+    padded[:, 1:257] = alphabets
+    d = np.diff(padded, axis=1)
+    rows, lo = np.nonzero(d == 1)
+    _, hi = np.nonzero(d == -1)
+    bounds = np.searchsorted(rows, np.arange(alphabets.shape[0] + 1))
+    lo = lo.tolist()
+    hi = (hi - 1).tolist()
+    return [list(zip(lo[b:e], hi[b:e])) for b, e in zip(bounds[:-1], bounds[1:])]
+
+
+def format_ranges(ranges):
+    return ' '.join(str(lo) if lo == hi else '{}-{}'.format(lo, hi) for lo, hi in ranges)
+
+
+class DFA(object):
+    # Array-backed DFA over flex's equivalence classes:
+    #  - transitions: n_states x n_classes matrix of next states (`none` = no edge)
+    #  - accepts: accept code of every state (0 = not accepting)
+    #  - classes: n_classes x 256 boolean matrix with the bytes of every class
+    __slots__ = (
+        'transitions',
+        'accepts',
+        'classes',
+        '_succ',
+        '_pred',
+    )
+
+    def __init__(self, transitions, accepts, classes):
+        self.transitions = transitions
+        self.accepts = accepts
+        self.classes = classes
+        self._succ = None
+        self._pred = None
+
+    @classmethod
+    def from_table(clazz, table, accepts, classes):
+        # `table` uses -1 (or anything out of range) for missing transitions
+        n_states = table.shape[0]
+        dtype = np.uint16 if n_states < 0xFFFF else np.uint32
+        none = np.iinfo(dtype).max
+        transitions = np.where((table >= 0) & (table < n_states), table, none).astype(dtype)
+        return clazz(
+            transitions,
+            np.asarray(accepts, dtype=np.uint32),
+            np.asarray(classes, dtype=bool),
+        )
+
+    def save(self, path):
+        write_arrays(path, DFA_MAGIC, DFA_VERSION, {
+            'transitions': self.transitions,
+            'accepts': self.accepts,
+            'classes': self.classes,
+        })
+
+    @classmethod
+    def load(clazz, path):
+        # The arrays are read-only views of the mmap'd file
+        arrays = read_arrays(path, DFA_MAGIC, DFA_VERSION)
+        return clazz(arrays['transitions'], arrays['accepts'], arrays['classes'])
+
+    @property
+    def none(self):
+        return np.iinfo(self.transitions.dtype).max
+
+    @property
+    def n_states(self):
+        return self.transitions.shape[0]
+
+    @property
+    def n_classes(self):
+        return self.transitions.shape[1]
+
+    def alphabet(self, classes):
+        # Bytes matched by any of the given classes, as a 256-entry bool mask
+        return self.classes[classes].any(axis=0)
+
+    def out_alphabets(self, states):
+        # For every state, the union of the alphabets of the edges leaving it,
+        # packed like pack_alphabets()
+        states = np.asarray(states, dtype=np.int64)
+        defined = self.transitions[states] != self.none
+        words = pack_alphabets(self.classes)
+        ret = np.zeros((len(states), 4), dtype=np.uint64)
+        for c in np.flatnonzero(defined.any(axis=0)):
+            ret[defined[:, c]] |= words[c]
+        return ret
+
+    def edges(self, state):
+        row = self.transitions[state]
+        for v in np.unique(row[row != self.none]):
+            yield int(v), self.alphabet(row == v)
+
+    def edge_list(self, nodes):
+        # All the edges leaving `nodes` at once, sorted by (u, v):
+        # (sources, targets, one 256-entry alphabet mask per edge)
+        nodes = np.asarray(nodes, dtype=np.int64)
+        sub = self.transitions[nodes]
+        rows, cols = np.nonzero(sub != self.none)
+        u = nodes[rows]
+        v = sub[rows, cols].astype(np.int64)
+        order = np.lexsort((cols, v, u))
+        u, v, cols = u[order], v[order], cols[order]
+        if u.size == 0:
+            return u, v, np.zeros((0, 256), dtype=bool)
+        starts = np.flatnonzero(np.concatenate(([True], (u[1:] != u[:-1]) | (v[1:] != v[:-1]))))
+        alphabets = np.logical_or.reduceat(self.classes[cols], starts, axis=0)
+        return u[starts], v[starts], alphabets
+
+    def _adjacency(self):
+        if self._succ is not None:
+            return
+        n, k = self.transitions.shape
+        u = np.repeat(np.arange(n, dtype=np.int64), k)
+        v = self.transitions.ravel().astype(np.int64)
+        keep = v != self.none
+        pairs = np.unique(u[keep] * n + v[keep])
+        u, v = pairs // n, pairs % n
+        bounds = np.arange(n + 1)
+        self._succ = (np.searchsorted(u, bounds), v)
+        order = np.argsort(v, kind='stable')
+        self._pred = (np.searchsorted(v[order], bounds), u[order])
+
+    def n_edges(self):
+        # Distinct (state, next state) pairs
+        self._adjacency()
+        return len(self._succ[1])
+
+    def successors(self, state):
+        self._adjacency()
+        indptr, indices = self._succ
+        return indices[indptr[state]:indptr[state + 1]]
+
+    def predecessors(self, state):
+        self._adjacency()
+        indptr, indices = self._pred
+        return indices[indptr[state]:indptr[state + 1]]
+
+    def reachable_from(self, state, within=None):
+        # Sorted array of the states reachable from `state`, `state` included.
+        # `within` is an optional boolean mask of the states we may go through.
+        seen = np.zeros(self.n_states, dtype=bool)
+        if within is not None:
+            seen |= ~within
+        seen[state] = True
+        frontier = np.array([state])
+        while frontier.size:
+            nxt = self.transitions[frontier].ravel()
+            nxt = np.unique(nxt[nxt != self.none])
+            frontier = nxt[~seen[nxt]]
+            seen[frontier] = True
+        if within is not None:
+            seen &= within
+            seen[state] = True
+        return np.flatnonzero(seen)
+
+    def sccs(self):
+        # Tarjan's algorithm without recursion. Components come out in reverse
+        # topological order: a component is emitted after everything it reaches.
+        n = self.n_states
+        index = np.full(n, -1, dtype=np.int64)
+        low = np.zeros(n, dtype=np.int64)
+        on_stack = np.zeros(n, dtype=bool)
+        stack = []
+        out = []
+        counter = 0
+
+        for root in range(n):
+            if index[root] >= 0:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, i = work.pop()
+                if i == 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                succ = self.successors(v)
+                while i < len(succ):
+                    w = int(succ[i])
+                    i += 1
+                    if index[w] < 0:
+                        work.append((v, i))
+                        work.append((w, 0))
+                        break
+                    elif on_stack[w]:
+                        low[v] = min(low[v], index[w])
+                else:
+                    if low[v] == index[v]:
+                        component = []
+                        while True:
+                            w = stack.pop()
+                            on_stack[w] = False
+                            component.append(w)
+                            if w == v:
+                                break
+                        out.append(np.array(component))
+                    if work:
+                        u = work[-1][0]
+                        low[u] = min(low[u], low[v])
+        return out
+
+    def to_networkx(self, states=None):
+        import networkx as nx
+
+        if states is None:
+            states = range(self.n_states)
+        states = sorted(int(s) for s in states)
+        inside = set(states)
+
+        G = nx.DiGraph()
+        for n in states:
+            accepts = int(self.accepts[n])
+            if accepts:
+                G.add_node(n, label='|{}|/{}'.format(n, accepts), accepts=accepts, shape='doublecircle')
+            else:
+                G.add_node(n, label='|{}|'.format(n), accepts=accepts)
+
+        for u in states:
+            for v, alphabet in self.edges(u):
+                if v not in inside:
+                    continue
+                alphabet = set(chr(c) for c in np.flatnonzero(alphabet))
+
+                label = repr(''.join(sorted(alphabet))) if alphabet else '•'
+                label = label.replace('\\', '\\\\')
+                if len(alphabet) >= 255:
+                    label = 'all'
+                elif len(alphabet) > 50:
+                    label = 'long'
+
+                G.add_edge(u, v, alphabet=alphabet, label=label)
+        return G
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import json
+
+from . import re as R
+from .simplify import read_dfa
+
+
+# Regexes are plain tuples so that equal subexpressions compare (and hash)
+# equal and the rules below can spot them:
+#   ('eps',)             empty string
+#   ('set', frozenset)   one byte out of a set
+#   ('then', r1, r2...)  concatenation
+#   ('or', r1, r2...)    alternation (never contains 'eps', see mk_opt)
+#   ('star', r) ('plus', r) ('opt', r)
+EPS = ('eps',)
+
+
+def mk_set(ranges):
+    return ('set', frozenset(c for lo, hi in ranges for c in range(lo, hi + 1)))
+
+
+def mk_opt(r):
+    if r == EPS or r[0] in {'opt', 'star'}:
+        return r
+    if r[0] == 'plus':
+        return ('star', r[1])
+    return ('opt', r)
+
+
+def mk_star(r):
+    if r == EPS:
+        return EPS
+    if r[0] in {'star', 'plus', 'opt'}:
+        r = r[1]
+    if r[0] == 'or':
+        # (a|b*)* => (a|b)*
+        r = mk_or(*(a[1] if a[0] in {'star', 'plus', 'opt'} else a for a in r[1:]))
+        if r[0] in {'star', 'opt'}:
+            r = r[1]
+    return ('star', r)
+
+
+def mk_or(*rr):
+    alts = []
+    optional = False
+    chars = None
+    for r in rr:
+        if r is None:
+            continue
+        parts = r[1:] if r[0] == 'or' else (r,)
+        for p in parts:
+            if p == EPS:
+                optional = True
+            elif p[0] == 'opt':
+                optional = True
+                alts.append(p[1])
+            elif p[0] == 'set':
+                chars = p[1] if chars is None else chars | p[1]
+            else:
+                alts.append(p)
+
+    if chars is not None:
+        alts.insert(0, ('set', chars))
+    unique = []
+    for a in alts:
+        if a not in unique:
+            unique.append(a)
+
+    if not unique:
+        return EPS if optional else None
+    r = unique[0] if len(unique) == 1 else ('or',) + tuple(unique)
+    return mk_opt(r) if optional else r
+
+
+def mk_then(*rr):
+    parts = []
+    for r in rr:
+        for p in (r[1:] if r[0] == 'then' else (r,)):
+            if p == EPS:
+                continue
+            if parts and p[0] == 'star' and p[1] == parts[-1]:
+                # r r* => r+
+                parts[-1] = ('plus', p[1])
+            elif parts and parts[-1][0] == 'star' and parts[-1][1] == p:
+                # r* r => r+
+                parts[-1] = ('plus', p)
+            else:
+                parts.append(p)
+    if not parts:
+        return EPS
+    if len(parts) == 1:
+        return parts[0]
+    return ('then',) + tuple(parts)
+
+
+def dfa_to_regex(start, accepting, edges):
+    # State elimination over a generalized NFA with a fresh initial (None)
+    # and final ('final') state. Returns None for the empty language.
+    out = {}
+    inc = {}
+
+    def add(u, v, r):
+        old = out.setdefault(u, {}).get(v)
+        out[u][v] = mk_or(old, r)
+        inc.setdefault(v, set()).add(u)
+        out.setdefault(v, {})
+        inc.setdefault(u, set())
+
+    add(None, start, EPS)
+    for u, v, ranges in edges:
+        add(u, v, mk_set(ranges))
+    for n, a in accepting.items():
+        if a:
+            add(n, 'final', EPS)
+
+    # Only keep states that are both reachable and co-reachable
+    def closure(root, adj):
+        seen = {root}
+        todo = [root]
+        while todo:
+            for m in adj.get(todo.pop(), ()):
+                if m not in seen:
+                    seen.add(m)
+                    todo.append(m)
+        return seen
+
+    alive = closure(None, out) & closure('final', inc)
+    if 'final' not in alive:
+        return None
+    for n in list(out):
+        if n not in alive:
+            for m in out.pop(n):
+                inc.get(m, set()).discard(n)
+            for m in inc.pop(n, ()):
+                out.get(m, {}).pop(n, None)
+
+    states = set(n for n in out if n is not None and n != 'final')
+    while states:
+        # Cheapest first: the fewest new (in x out) edges
+        def cost(n):
+            i = len(inc[n]) - (n in inc[n])
+            o = len(out[n]) - (n in out[n])
+            return (i * o, n)
+        q = min(states, key=cost)
+        states.remove(q)
+
+        loop = out[q].pop(q, None)
+        inc[q].discard(q)
+        middle = mk_star(loop) if loop is not None else EPS
+
+        for p in inc.pop(q):
+            head = out[p].pop(q)
+            for r, tail in out[q].items():
+                new = mk_then(head, middle, tail)
+                out[p][r] = mk_or(out[p].get(r), new)
+                inc[r].add(p)
+        for r in out.pop(q):
+            inc[r].discard(q)
+
+    return out[None].get('final')
+
+
+def to_json(r):
+    # JSON layout read by reflex.re.Regexp.from_json
+    tag = r[0]
+    if tag == 'set':
+        if len(r[1]) == 1:
+            return {'tag': 'Literal', 'contents': next(iter(r[1]))}
+        return {'tag': 'RESet', 'contents': sorted(r[1])}
+    elif tag == 'then' or tag == 'or':
+        # Right-nested binary nodes, like DfaToRegex.mkThen/mkOr
+        ret = to_json(r[-1])
+        for p in reversed(r[1:-1]):
+            ret = {'tag': 'Then' if tag == 'then' else 'Or', 'contents': [to_json(p), ret]}
+        return ret
+    elif tag == 'star':
+        return {'tag': 'Star', 'contents': to_json(r[1])}
+    elif tag == 'plus':
+        return {'tag': 'OneOrMore', 'contents': to_json(r[1])}
+    elif tag == 'opt':
+        return {'tag': 'Optional', 'contents': to_json(r[1])}
+    raise ValueError('cannot encode {}'.format(tag))
+
+
+def convert(fp, out_fp):
+    d = read_dfa(fp)
+    r = dfa_to_regex(d.start, d.accepting, d.edges)
+    if r is None or r == EPS:
+        print('EMPTY', fp)
+        return False
+    with open(out_fp, 'w') as f:
+        json.dump(to_json(r), f)
+    return True
+
+
+def _convert(fp):
+    return convert(fp, fp + '.regexp')
+
+
+def main(files, jobs=1, bundle=None):
+    # With `bundle`, the regexps also end up in one file for the fuzzer
+    if jobs <= 1:
+        converted = [_convert(fp) for fp in files]
+    else:
+        import multiprocessing
+        with multiprocessing.Pool(jobs) as pool:
+            converted = pool.map(_convert, files, chunksize=32)
+
+    if bundle is not None:
+        interner = R.Interner()
+        entries = []
+        for fp, ok in zip(files, converted):
+            if ok:
+                with open(fp + '.regexp', 'r') as f:
+                    entries.append((R.parse_file_name(fp), R.load_regexp(f.read(), interner)))
+        R.save_bundle(bundle, sorted(entries, key=lambda e: e[0]))
+    return converted
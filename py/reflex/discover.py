@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+
+from collections import namedtuple
+
+import lief
+import numpy as np
+
+from .reflex import SIZE_TO_FORMAT
+from .reflex import TABLES
+from .reflex import SizedOffset
+from .reflex import decompress
+
+
+# The other tables are looked for this many bytes around each yy_ec candidate
+CLUSTER = 0x100000
+# How many candidates of every table survive the cheap filters
+MAX_CANDIDATES = 8
+# yy_base/yy_chk/yy_def/yy_nxt are flex_int16_t or flex_int32_t
+MAX_VALUE = {2: 0x7fff, 4: 0xffffff}
+
+
+Layout = namedtuple(
+    'Layout',
+    [
+        'score',
+        'endianness',
+        'max_state',
+        'tables',
+    ]
+)
+
+
+View = namedtuple(
+    'View',
+    [
+        'offset',
+        'width',
+        'values',
+    ]
+)
+
+
+def regions(path):
+    # (file offset, bytes) of every section with file contents and the
+    # endianness of the binary (None if lief does not understand the file).
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    binary = lief.parse(path)
+    if binary is None:
+        return [(0, data)], None
+
+    big = binary.abstract.header.endianness == lief.Header.ENDIANNESS.BIG
+    endianness = 'big' if big else 'little'
+    out = []
+    for section in binary.sections:
+        size = len(section.content)
+        if size < 256 or section.offset + size > len(data):
+            continue
+        out.append((section.offset, data[section.offset:section.offset + size]))
+    return out or [(0, data)], endianness
+
+
+def view(data, offset, width, endianness):
+    # Element view of data[...] starting at the first offset aligned to `width`
+    skip = -offset % width
+    count = (len(data) - skip) // width
+    dtype = np.dtype(('<' if endianness == 'little' else '>') + SIZE_TO_FORMAT[width])
+    values = np.frombuffer(data, dtype=dtype, count=max(count, 0), offset=skip).astype(np.int64)
+    return View(offset + skip, width, values)
+
+
+def windows_within(values, length, lo, hi):
+    # Start of every `length`-long window whose values are all in [lo, hi]
+    n = len(values) - length + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    bad = np.concatenate(([0], np.cumsum((values < lo) | (values > hi))))
+    return np.flatnonzero(bad[length:length + n] - bad[:n] == 0)
+
+
+def find_ec(v):
+    # yy_ec: 256 entries, yy_ec[0] == 0 and every class 1..numecs used
+    starts = windows_within(v.values[1:], 255, 1, 255)
+    out = []
+    for i in starts[v.values[starts] == 0]:
+        w = v.values[i + 1:i + 256]
+        numecs = int(w.max())
+        if numecs >= 2 and len(np.unique(w)) == numecs:
+            out.append((int(i), numecs))
+    return out
+
+
+def find_meta(v, numecs):
+    # yy_meta: numecs + 1 entries, yy_meta[0] == 0, the rest in [1, numecs]
+    starts = windows_within(v.values[1:], numecs, 1, numecs)
+    return [int(i) for i in starts if v.values[i] == 0]
+
+
+def chk_runs(values, numecs, limit):
+    # All the occurrences of a state in yy_chk are less than numecs apart
+    # (they are yy_base[state] + class). For every start K compute how far a
+    # yy_chk starting there could extend and return the earliest start of
+    # every such extent as (start, end).
+    n = len(values)
+    pos = np.arange(n)
+    breaks = np.full(n, -1, dtype=np.int64)
+    bad = (values < 0) | (values > limit)
+    breaks[bad] = pos[bad]
+
+    nz = np.flatnonzero((values > 0) & ~bad)
+    order = nz[np.argsort(values[nz], kind='stable')]
+    v = values[order]
+    key = v * (2 * n + 1) + order
+    k = np.searchsorted(key, v * (2 * n + 1) + order - numecs, side='right') - 1
+    ok = (k >= 0) & (v[np.maximum(k, 0)] == v)
+    # A start K <= breaks[i] cannot extend past i
+    breaks[order[ok]] = order[k[ok]]
+
+    first_break = np.full(n + 1, n, dtype=np.int64)
+    hit = breaks >= 0
+    np.minimum.at(first_break, breaks[hit], pos[hit])
+    end = np.minimum.accumulate(first_break[::-1])[::-1][:n]
+    starts = np.flatnonzero(np.concatenate(([True], end[1:] != end[:-1])))
+    return [(int(k), int(end[k])) for k in starts]
+
+
+def find_chk(v, numecs):
+    out = []
+    for start, end in chk_runs(v.values, numecs, MAX_VALUE[v.width]):
+        seg = v.values[start:end]
+        used = seg[seg > 0]
+        if len(seg) < 2 * numecs or len(used) < numecs:
+            continue
+        # States usually own several entries, unlike e.g. yy_base
+        multiplicity = len(used) / len(np.unique(used))
+        if multiplicity >= 1.5:
+            out.append((len(seg), start, end))
+    out.sort(reverse=True)
+    return [(start, end) for _, start, end in out[:MAX_CANDIDATES]]
+
+
+def match_base(chk, b, numecs):
+    # Given yy_chk values and a candidate yy_base, find the shift t (the
+    # real start of yy_chk) such that every state's entries are in
+    # [yy_base[s] + 1, yy_base[s] + numecs]. Returns (score, t, matches).
+    states = np.unique(chk[chk > 0])
+    states = states[states < len(b)]
+    if len(states) == 0:
+        return 0.0, 0, 0
+    idx = np.searchsorted(states, chk)
+    hit = (chk > 0) & (idx < len(states)) & (states[np.minimum(idx, len(states) - 1)] == chk)
+    pos = np.flatnonzero(hit)
+    first = np.full(len(states), len(chk))
+    last = np.full(len(states), -1)
+    np.minimum.at(first, idx[pos], pos)
+    np.maximum.at(last, idx[pos], pos)
+    hi = first - b[states] - 1
+    lo = last - b[states] - numecs
+
+    # The shift most states agree on
+    t = int(np.median(hi))
+    matches = int(np.sum((lo <= t) & (t <= hi)))
+    for candidate in (int(lo.max()), int(hi.min())):
+        m = int(np.sum((lo <= candidate) & (candidate <= hi)))
+        if m > matches or (m == matches and candidate < t):
+            matches, t = m, candidate
+    return matches / float(len(states)), max(t, 0), matches
+
+
+def n_states(chk):
+    # Whatever follows yy_chk may still look like it, but its values are
+    # sparse where the state numbers are dense (if not every state owns
+    # entries). Returns a few guesses for the number of states and
+    # templates, largest first.
+    values = np.unique(chk[chk > 0])
+    rank = np.arange(1, len(values) + 1)
+    guesses = set()
+    for density in (2, 4):
+        dense = np.flatnonzero(values <= density * rank)
+        if len(dense) == 0:
+            continue
+        guesses.add(dense[-1])
+        gaps = np.diff(values[:dense[-1] + 1])
+        guesses.update(np.argsort(-gaps, kind='stable')[:2].tolist())
+    return sorted((int(values[k]) + 1 for k in guesses), reverse=True)
+
+
+def find_base(views, chk, numecs):
+    out = []
+    for n in n_states(chk):
+        if n < 3:
+            continue
+        values, first = np.unique(chk, return_index=True)
+        keep = (values > 0) & (values < n)
+        states, first = values[keep], first[keep]
+
+        for v in views:
+            starts = windows_within(v.values, n, 0, len(chk))
+            if len(starts) == 0:
+                continue
+            # Cheap filter first: how many of a sample of states agree on
+            # where yy_chk starts
+            sample = np.linspace(0, len(states) - 1, min(len(states), 64)).astype(np.int64)
+            windows = np.lib.stride_tricks.sliding_window_view(v.values, n)
+            spread = np.empty(len(starts))
+            for lo in range(0, len(starts), 1024):
+                d = first[sample] - windows[starts[lo:lo + 1024]][:, states[sample]]
+                spread[lo:lo + 1024] = np.mean(np.abs(d - np.median(d, axis=1)[:, None]) <= numecs, axis=1)
+            for i in np.argsort(-spread, kind='stable')[:MAX_CANDIDATES]:
+                score, t, matches = match_base(chk, v.values[starts[i]:starts[i] + n], numecs)
+                out.append((matches, score, v, int(starts[i]), t, n))
+    # The guess that explains the most states wins, not the one that
+    # explains a few of them best
+    out.sort(key=lambda x: -x[0])
+    return [x[1:] for x in out[:MAX_CANDIDATES]]
+
+
+def overlaps(a, b):
+    return a[0] < b[1] and b[0] < a[1]
+
+
+def span(v, i, count):
+    return (v.offset + i * v.width, v.offset + (i + count) * v.width)
+
+
+def candidates(views, length, lo, hi, taken, near):
+    # Windows of every width whose values fit, closest to `near` first
+    out = []
+    for v in views:
+        for i in windows_within(v.values, length, lo, hi):
+            s = span(v, i, length)
+            if not any(overlaps(s, t) for t in taken):
+                out.append((abs(s[0] - near), v, int(i)))
+    out.sort(key=lambda x: x[0])
+    return [(v, i) for _, v, i in out]
+
+
+def find_nxt(views, chk, n, taken, near):
+    # Used yy_chk entries never lead to state 0
+    used = np.flatnonzero(chk > 0)
+    out = []
+    for v, i in candidates(views, len(chk), 0, n, taken, near):
+        if (v.values[i + used] > 0).all():
+            out.append((v, i))
+            if len(out) == MAX_CANDIDATES:
+                break
+    return out
+
+
+def find_def(views, base, chk, n, max_state, numecs, taken, near):
+    # Following yy_def from any state has to end up in a template or in a
+    # state that has its own entry for every class. flex only ever picks an
+    # earlier state, a template or the jam state as the default, which tells
+    # the real table apart from shifted views of it.
+    idx = base[:max_state, None] + np.arange(1, numecs + 1)
+    idx = np.minimum(idx, len(chk) - 1)
+    complete = (chk[idx] == np.arange(max_state)[:, None]).all(axis=1)
+    stop = np.concatenate((complete, np.ones(n - max_state, dtype=bool)))
+
+    states = np.arange(1, max_state - 1)
+    scored = []
+    for v, i in candidates(views, n, 0, n - 1, taken, near):
+        order = v.values[i + states]
+        scored.append((float(np.mean((order > 0) & ((order < states) | (order >= max_state - 1)))), v, i))
+    scored.sort(key=lambda x: -x[0])
+
+    out = []
+    for score, v, i in scored:
+        # Follow every chain at once by repeated squaring
+        chain = np.where(stop, np.arange(n), v.values[i:i + n])
+        for _ in range(int(n).bit_length()):
+            chain = chain[chain]
+        if stop[chain[1:max_state]].all():
+            out.append((score, v, i))
+            if len(out) == MAX_CANDIDATES:
+                break
+    return out
+
+
+class _Tables(object):
+    # Stand-in for reflex.reflex.Target over candidate arrays
+    def __init__(self, tables):
+        self.tables = tables
+
+
+def evaluate(tables, max_state, numecs):
+    # Decompress with the candidate tables and check the result looks like a
+    # lexer: every pair resolves and, as flex numbers states in the order it
+    # finds them, (nearly) every state is entered from an earlier one.
+    try:
+        t = decompress(_Tables(tables), max_state, range(1, numecs + 1))
+    except (IndexError, ValueError):
+        return 0.0, None
+    rows = t[1:, 1:]
+    if rows.min() < 1 or rows.max() >= max_state:
+        return 0.0, None
+
+    earliest = np.full(max_state, max_state)
+    np.minimum.at(earliest, rows.ravel(), np.repeat(np.arange(1, max_state), numecs))
+    states = np.arange(2, max_state - 1)
+    return float(np.mean(earliest[states] < states)), t
+
+
+def score_accept(accepts, t, max_state):
+    # States (past the start state) that can only jam must be accepting, the
+    # start state matching the empty string is unlikely and rules are
+    # numbered from 1
+    jam = max_state - 1
+    accepting = accepts[1:jam] > 0
+    if not accepting.any() or accepting.all():
+        return 0.0
+    dead_ends = np.flatnonzero((t[2:jam, 1:] == jam).all(axis=1)) + 2
+    score = float(np.mean(accepts[dead_ends] > 0)) if len(dead_ends) else 0.5
+    score += 0.5 if accepts[1] == 0 else 0.0
+    rules = np.unique(accepts[accepts > 0])
+    return score + len(rules) / float(rules.max())
+
+
+def find_accept(views, t, max_state, taken, near):
+    best = None
+    for v, i in candidates(views, max_state, 0, MAX_VALUE[2], taken, near):
+        if v.values[i] != 0:
+            continue
+        # A narrow view of a wide table often scores as well, so prefer wide
+        score = (score_accept(v.values[i:i + max_state], t, max_state), v.width)
+        if best is None or score > best[0]:
+            best = (score, v, i)
+    return best
+
+
+def discover_in(data, offset, endianness, ec_view, ec_index, numecs):
+    near = ec_view.offset + ec_index * ec_view.width
+    lo = max(0, near - offset - CLUSTER)
+    cluster = data[lo:near - offset + CLUSTER]
+    views = {w: view(cluster, offset + lo, w, endianness) for w in (1, 2, 4)}
+    wide = [views[2], views[4]]
+
+    found = {'yy_ec': (ec_view, ec_index, 256)}
+    best = None
+    for cv in wide:
+        for start, end in find_chk(cv, numecs):
+            for base_score, bv, b, shift, n in find_base(wide, cv.values[start:end], numecs):
+                if base_score < 0.9:
+                    continue
+                chk = cv.values[start + shift:end]
+                base = bv.values[b:b + n]
+                chk = chk[:int(base.max()) + numecs + 1]
+                tables = dict(found)
+                tables['yy_chk'] = (cv, start + shift, len(chk))
+                tables['yy_base'] = (bv, b, n)
+                taken = [span(*x) for x in tables.values()]
+
+                for nv, ni in find_nxt(wide, chk, n, taken, near):
+                    nxt = nv.values[ni:ni + len(chk)]
+                    max_state = int(nxt[chk > 0].max()) + 1
+                    # At least a start state, another state and the jam state
+                    if max_state < 4 or max_state > n:
+                        continue
+                    taken_nxt = taken + [span(nv, ni, len(chk))]
+                    metas = [(v, i) for v in views.values() for i in find_meta(v, numecs)
+                             if not any(overlaps(span(v, i, numecs + 1), t) for t in taken_nxt)]
+                    metas.sort(key=lambda x: abs(span(*x, 1)[0] - near))
+                    for mv, mi in metas[:MAX_CANDIDATES]:
+                        taken_meta = taken_nxt + [span(mv, mi, numecs + 1)]
+                        for def_score, dv, di in find_def(wide, base, chk, n, max_state, numecs, taken_meta, near):
+                            entered, t = evaluate({
+                                'yy_base': base,
+                                'yy_chk': chk,
+                                'yy_def': dv.values[di:di + n],
+                                'yy_meta': mv.values[mi:mi + numecs + 1],
+                                'yy_nxt': nxt,
+                            }, max_state, numecs)
+                            score = base_score + entered + def_score
+                            if t is not None and (best is None or score > best[0]):
+                                best = (score, max_state, t, dict(
+                                    tables,
+                                    yy_nxt=(nv, ni, len(chk)),
+                                    yy_def=(dv, di, n),
+                                    yy_meta=(mv, mi, numecs + 1),
+                                ))
+
+    if best is None:
+        return None
+    score, max_state, t, tables = best
+    accept = find_accept(wide, t, max_state, [span(*x) for x in tables.values()], near)
+    if accept is None:
+        return None
+    tables['yy_accept'] = (accept[1], accept[2], max_state)
+
+    return Layout(score + accept[0][0], endianness, max_state, {
+        name: SizedOffset(v.offset + i * v.width, v.width) for name, (v, i, _) in tables.items()
+    })
+
+
+def discover(path, endianness=None):
+    # Every plausible set of flex tables in `path`, best first
+    out = []
+    sections, detected = regions(path)
+    endiannesses = [endianness or detected] if (endianness or detected) else ['little', 'big']
+    for e in endiannesses:
+        for offset, data in sections:
+            for w in (1, 2, 4):
+                v = view(data, offset, w, e)
+                for i, numecs in find_ec(v):
+                    layout = discover_in(data, offset, e, v, i, numecs)
+                    if layout is not None:
+                        out.append(layout)
+    out.sort(key=lambda l: -l.score)
+    return out
+
+
+def to_args(layout):
+    args = []
+    for name in TABLES:
+        t = layout.tables[name]
+        args.append('--{} 0x{:X} {}'.format(name[3:], t.offset, t.size))
+    args.append('--max-state {}'.format(layout.max_state))
+    if layout.endianness != 'little':
+        args.append('--endianness {}'.format(layout.endianness))
+    return ' '.join(args)
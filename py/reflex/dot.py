@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from .dfa import format_ranges
+from .dfa import to_ranges
+
+
+# DOT and GraphML straight from the DFA arrays, one line per node/edge,
+# without building a networkx graph (or a pygraphviz AGraph) first. The
+# attributes are the ones DFA.to_networkx() sets.
+
+
+def edge_label(alphabet):
+    n = int(alphabet.sum())
+    if n >= 255:
+        return 'all'
+    elif n > 50:
+        return 'long'
+    elif n == 0:
+        return '•'
+    return repr(''.join(chr(c) for c in np.flatnonzero(alphabet)))
+
+
+def _graph(dfa, states, rule):
+    # Yields ('node', n, accepts, label, shape) and then
+    # ('edge', u, v, label, ranges), edges sorted by (source, target).
+    # With `rule`, the states accepting any other rule are drawn as
+    # non-accepting.
+    if states is None:
+        states = np.arange(dfa.n_states)
+    states = np.unique(np.asarray(states, dtype=np.int64))
+
+    for n, accepts in zip(states.tolist(), dfa.accepts[states].tolist()):
+        if accepts and rule is not None and accepts != rule:
+            yield 'node', n, 0, '|{}|/None'.format(n), None
+        elif accepts:
+            yield 'node', n, accepts, '|{}|/{}'.format(n, accepts), 'doublecircle'
+        else:
+            yield 'node', n, accepts, '|{}|'.format(n), None
+
+    inside = np.zeros(dfa.n_states, dtype=bool)
+    inside[states] = True
+    u, v, alphabets = dfa.edge_list(states)
+    keep = inside[v]
+    u, v, alphabets = u[keep], v[keep], alphabets[keep]
+    for a, b, alphabet, ranges in zip(u.tolist(), v.tolist(), alphabets, to_ranges(alphabets)):
+        yield 'edge', a, b, edge_label(alphabet), format_ranges(ranges)
+
+
+def _quote(s):
+    return '"{}"'.format(s.replace('"', '\\"'))
+
+
+def write_dot(path, dfa, states=None, rule=None):
+    # Returns the number of edges written
+    edges = 0
+    with open(path, 'w') as f:
+        f.write('strict digraph {\n')
+        for kind, a, b, label, extra in _graph(dfa, states, rule):
+            if kind == 'node':
+                shape = ', shape=doublecircle' if extra else ''
+                f.write('\t{}\t[accepts={}, label={}{}];\n'.format(a, b, _quote(label), shape))
+            else:
+                # Double the backslashes so that graphviz shows the repr()
+                label = _quote(label.replace('\\', '\\\\'))
+                f.write('\t{} -> {}\t[alphabet={}, label={}];\n'.format(a, b, _quote(extra), label))
+                edges += 1
+        f.write('}\n')
+    return edges
+
+
+def write_graphml(path, dfa, states=None, rule=None):
+    # Returns the number of edges written
+    edges = 0
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        f.write('  <key id="label" for="all" attr.name="label" attr.type="string"/>\n')
+        f.write('  <key id="accepts" for="node" attr.name="accepts" attr.type="int"/>\n')
+        f.write('  <key id="alphabet" for="edge" attr.name="alphabet" attr.type="string"/>\n')
+        f.write('  <graph edgedefault="directed">\n')
+        for kind, a, b, label, extra in _graph(dfa, states, rule):
+            if kind == 'node':
+                f.write('    <node id="{}"><data key="label">{}</data><data key="accepts">{}</data></node>\n'.format(
+                    a, escape(label), b))
+            else:
+                f.write('    <edge source="{}" target="{}"><data key="label">{}</data><data key="alphabet">{}</data>'
+                        '</edge>\n'.format(a, b, escape(label), escape(extra)))
+                edges += 1
+        f.write('  </graph>\n')
+        f.write('</graphml>\n')
+    return edges
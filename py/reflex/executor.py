@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import ctypes
+import os
+import select
+import shlex
+import signal
+import struct
+import subprocess
+
+import numpy as np
+
+
+MAP_SIZE = 1 << 16
+
+# AFL's forkserver protocol: the target reads 4-byte commands from FORKSRV_FD
+# and writes 4-byte answers (hello, child pid, waitpid status) to
+# FORKSRV_FD + 1
+FORKSRV_FD = 198
+SHM_ENV_VAR = '__AFL_SHM_ID'
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_EXCL = 0o2000
+IPC_RMID = 0
+
+
+def _libc():
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.shmget.argtypes = (ctypes.c_int, ctypes.c_size_t, ctypes.c_int)
+    libc.shmget.restype = ctypes.c_int
+    libc.shmat.argtypes = (ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+    libc.shmat.restype = ctypes.c_void_p
+    libc.shmdt.argtypes = (ctypes.c_void_p,)
+    libc.shmdt.restype = ctypes.c_int
+    libc.shmctl.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_void_p)
+    libc.shmctl.restype = ctypes.c_int
+    return libc
+
+
+class SharedMap(object):
+    # A SysV shared memory segment seen as a numpy uint8 array, like the one
+    # afl-fuzz hands to its targets through __AFL_SHM_ID
+
+    def __init__(self, size=MAP_SIZE):
+        self._libc = _libc()
+        self.size = size
+        self.id = self._libc.shmget(IPC_PRIVATE, size, IPC_CREAT | IPC_EXCL | 0o600)
+        if self.id < 0:
+            raise OSError(ctypes.get_errno(), 'shmget failed')
+        self._addr = self._libc.shmat(self.id, None, 0)
+        if self._addr in (None, ctypes.c_void_p(-1).value):
+            err = ctypes.get_errno()
+            self._libc.shmctl(self.id, IPC_RMID, None)
+            raise OSError(err, 'shmat failed')
+        self.array = np.ctypeslib.as_array((ctypes.c_uint8 * size).from_address(self._addr))
+
+    def close(self):
+        if self._addr is None:
+            return
+        self.array = None
+        self._libc.shmdt(self._addr)
+        self._libc.shmctl(self.id, IPC_RMID, None)
+        self._addr = None
+
+    def __del__(self):
+        self.close()
+
+
+class Executor(object):
+    # Runs one testcase in the target: run(test) -> (exit code, raw coverage
+    # map). The exit code is negative (minus the signal number) when the
+    # target crashed and None when it hung; the map is None in both cases.
+    # The map may be reused by the next run.
+
+    def run(self, test):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def afl_showmap(argv, file_path, coverage_path, test):
+    # Raw hit counts (-r), reflex.coverage does the bucketing
+    CMD = 'afl-showmap -Q -b -r -o {coverage} -- {argv}'
+    cmd = CMD.format(argv=argv, coverage=coverage_path)
+    # print(cmd)
+    with open(file_path, 'wb') as f:
+        f.write(test)
+
+    # print(test)
+
+    ret = subprocess.run(
+            shlex.split(cmd),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+    )
+
+    if ret.returncode < 0:
+        return ret.returncode, None
+
+    cov = None
+    with open(coverage_path, 'rb') as f:
+        cov = np.fromfile(coverage_path, dtype=np.uint8)
+    return ret.returncode, cov
+
+
+class ShowmapExecutor(Executor):
+    # One afl-showmap (QEMU mode) process per testcase. Slow, but it needs
+    # nothing but afl-showmap.
+
+    def __init__(self, argv, file_path, coverage_path):
+        self.argv = argv
+        self.file_path = file_path
+        self.coverage_path = coverage_path
+
+    def run(self, test):
+        return afl_showmap(self.argv, self.file_path, self.coverage_path, test)
+
+
+class ForkserverExecutor(Executor):
+    # Starts the target once (under afl-qemu-trace unless qemu=False) and
+    # asks its forkserver for a fresh child per testcase. The testcase is
+    # written to `file_path`, which is also the stdin of the target; the
+    # coverage comes back through SysV shared memory.
+
+    def __init__(self, argv, file_path, qemu=True, timeout=1.0, map_size=MAP_SIZE, env=None):
+        if isinstance(argv, str):
+            argv = shlex.split(argv)
+        argv = [file_path if a == '@@' else a for a in argv]
+        if qemu:
+            argv = ['afl-qemu-trace', '--'] + argv
+        self.file_path = file_path
+        self.timeout = timeout
+        self.map = SharedMap(map_size)
+
+        env = dict(os.environ if env is None else env)
+        env[SHM_ENV_VAR] = str(self.map.id)
+        # AFL++ speaks the classic protocol when asked to
+        env.setdefault('AFL_OLD_FORKSERVER', '1')
+
+        self._input = open(file_path, 'w+b')
+        ctl_r, self._ctl = os.pipe()
+        self._st, st_w = os.pipe()
+
+        def setup():
+            os.dup2(ctl_r, FORKSRV_FD)
+            os.dup2(st_w, FORKSRV_FD + 1)
+
+        self._proc = None
+        try:
+            self._proc = subprocess.Popen(
+                argv,
+                stdin=self._input,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
+                close_fds=False,
+                preexec_fn=setup,
+            )
+        except OSError:
+            self.close()
+            raise
+        finally:
+            os.close(ctl_r)
+            os.close(st_w)
+
+        try:
+            hello = self._read(timeout=max(timeout, 10.0))
+        except RuntimeError:
+            hello = None
+        if hello is None:
+            self.close()
+            raise RuntimeError('{} did not start a forkserver'.format(argv[0]))
+
+    def _read(self, timeout=None):
+        if timeout is not None and not select.select([self._st], [], [], timeout)[0]:
+            return None
+        data = b''
+        while len(data) < 4:
+            chunk = os.read(self._st, 4 - len(data))
+            if not chunk:
+                raise RuntimeError('the forkserver went away')
+            data += chunk
+        return struct.unpack('I', data)[0]
+
+    def run(self, test):
+        self._input.seek(0)
+        self._input.truncate()
+        self._input.write(test)
+        self._input.flush()
+        self._input.seek(0)
+        self.map.array[:] = 0
+
+        os.write(self._ctl, struct.pack('I', 0))
+        pid = self._read()
+        status = self._read(self.timeout)
+        if status is None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._read()
+            return None, None
+
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status), None
+        return os.WEXITSTATUS(status), self.map.array
+
+    def close(self):
+        if self._ctl is not None:
+            if self._proc is not None:
+                self._proc.kill()
+                self._proc.wait()
+                self._proc = None
+            os.close(self._ctl)
+            os.close(self._st)
+            self._ctl = self._st = None
+        if self._input is not None:
+            self._input.close()
+            self._input = None
+        self.map.close()
+
+
+# forkserver: QEMU mode, native: targets built with afl-gcc/afl-clang
+EXECUTORS = ('forkserver', 'native', 'showmap')
+
+
+def make_executor(kind, argv, file_path, coverage_path):
+    if kind == 'forkserver':
+        return ForkserverExecutor(argv, file_path)
+    elif kind == 'native':
+        return ForkserverExecutor(argv, file_path, qemu=False)
+    elif kind == 'showmap':
+        return ShowmapExecutor(argv, file_path, coverage_path)
+    raise ValueError('unknown executor {}'.format(kind))
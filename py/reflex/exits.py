@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from .dfa import pack_alphabets
+from .dfa import read_arrays
+from .dfa import unpack_alphabets
+from .dfa import write_arrays
+
+
+EXITS_MAGIC = b'RFLXEXIT'
+EXITS_VERSION = 1
+
+# Byte 0 is never an exit
+ALL_BUT_NUL = pack_alphabets(np.arange(256) > 0)[0]
+
+
+class Exits(object):
+    # The bytes that make every accepting state stop matching: those that no
+    # edge leaving the state matches. Stored as 256-bit masks (4 uint64 each)
+    # next to the sorted states they belong to.
+    __slots__ = (
+        'states',
+        'words',
+    )
+
+    def __init__(self, states, words):
+        self.states = states
+        self.words = words
+
+    @classmethod
+    def from_dfa(clazz, dfa):
+        states = np.flatnonzero(dfa.accepts).astype(np.uint32)
+        words = ~dfa.out_alphabets(states) & ALL_BUT_NUL
+        return clazz(states, words)
+
+    def save(self, path):
+        write_arrays(path, EXITS_MAGIC, EXITS_VERSION, {
+            'states': self.states,
+            'words': self.words,
+        })
+
+    @classmethod
+    def load(clazz, path):
+        arrays = read_arrays(path, EXITS_MAGIC, EXITS_VERSION)
+        return clazz(arrays['states'], arrays['words'])
+
+    def __len__(self):
+        return len(self.states)
+
+    def __iter__(self):
+        return iter(self.states.tolist())
+
+    def _index(self, state):
+        i = int(np.searchsorted(self.states, state))
+        if i == len(self.states) or self.states[i] != state:
+            raise KeyError(state)
+        return i
+
+    def __contains__(self, state):
+        i = int(np.searchsorted(self.states, state))
+        return i < len(self.states) and self.states[i] == state
+
+    def mask(self, state):
+        # 256-entry bool mask of the exit bytes of an accepting state
+        return unpack_alphabets(self.words[self._index(state)])[0]
+
+    def bytes(self, state):
+        return bytes(np.flatnonzero(self.mask(state)).tolist())
+
+    def exits_on(self, state, byte):
+        word = self.words[self._index(state), byte >> 6]
+        return bool((int(word) >> (byte & 63)) & 1)
+
+    def states_on(self, byte):
+        # The accepting states that stop matching on `byte`
+        bit = np.uint64(1 << (byte & 63))
+        return self.states[(self.words[:, byte >> 6] & bit) != 0]
+
+    def to_dict(self):
+        # {state: exit bytes}, e.g. for JSON
+        masks = unpack_alphabets(self.words)
+        return {int(s): bytes(np.flatnonzero(m).tolist()) for s, m in zip(self.states, masks)}
@@ -1,89 +1,91 @@
 #!/usr/bin/env python3
 
-import collections
 import glob
 import itertools
 import json
+import multiprocessing
 import os
 import pickle
 import random
 import shlex
-import subprocess
+import signal
+import sys
+import time
+
+from multiprocessing import shared_memory
 
 import numpy as np
 
+from . import corpus
 from . import re
+from .coverage import NEW_TUPLE
+from .coverage import NO_NEW_BITS
+from .coverage import VirginMap
+from .coverage import classify
+from .coverage import coverage_hash
+from .coverage import sparse
+from .executor import EXECUTORS
+from .executor import MAP_SIZE
+from .executor import afl_showmap
+from .executor import make_executor
+from .re import RS
+from .re import parse_file_name
+from .sampler import Sampler
+from .schedule import Bandit
+from .stats import AflStats
+from .tokens import TokenPool
+from .tokens import load_automata
 
 
 MIN_TOKENS = 5
 MAX_TOKENS = 10
 MAX_TEST_LEN = 10
 
+# Tokens sampled at once by mk_generate_one()
+TOKEN_BATCH = 256
 
-RS = collections.namedtuple('RS', ('rule', 'state'))
-
-
-def parse_file_name(fn):
-    _, fn = os.path.split(fn)
-    fn = fn.split('.')[0]
-    rule, state = fn.split('_')
-    return RS(int(rule), int(state))
-
-
-def solve_regex(re):
-    if re.is_re_set():
-        return random.choice(re.contents),
-    elif re.is_literal():
-        return re.contents
-    elif re.is_then():
-        return itertools.chain(solve_regex(re.contents[0]), solve_regex(re.contents[1]))
-    elif re.is_or():
-        return solve_regex(random.choice(re.contents))
-    elif re.is_optional():
-        if random.random() >= 0.5:
-            return solve_regex(random.choice(re.contents))
-        else:
-            return []
-    elif re.is_star():
-        ret = []
-        while random.random() >= 0.3:
-            ret = itertools.chain(ret, solve_regex(re.contents[0]))
-        return ret
-    elif re.is_plus():
-        ret = solve_regex(re.contents[0])
-        while random.random() >= 0.3:
-            ret = itertools.chain(ret, solve_regex(re.contents[0]))
-        return ret
-    else:
-        print(re.__class__.__name__)
-        return []
+# Seconds between two looks at the other instances in the sync dir
+SYNC_INTERVAL = 30.0
+# Tests in memory before the first cmin of them
+CULL_AT = 1024
 
 
 class Testcase(object):
-    def __init__(self, tokens, coverage=None):
+    def __init__(self, tokens, coverage=None, cksum=None):
         self.tokens = list(tokens)
+        # sparse() classified trace and its coverage_hash()
         self.coverage = coverage
+        self.cksum = cksum
 
 
-def mk_generate(rm):
-    states = list(rm.keys())
+def _sampler(rm):
+    # A {state: [Regexp]} map, or anything with a tokens(n) like a TokenPool
+    return rm if hasattr(rm, 'tokens') else Sampler(rm)
+
+
+def mk_generate(rm, sources=None):
+    # `sources` is a Bandit over the sampler's names picking where every
+    # token comes from, instead of a uniform pick
+    sampler = _sampler(rm)
     def gen():
-        tokens = []
-        for i in range(random.randint(MIN_TOKENS, MAX_TOKENS)):
-            state = random.choice(states)
-            re = random.choice(rm[state])
-            token = solve_regex(re)
-            tokens.append(list(token))
-        return Testcase(tokens)
+        n = random.randint(MIN_TOKENS, MAX_TOKENS)
+        return Testcase(sampler.tokens(n, None if sources is None else sources.pick(n)))
     return gen
 
 
-def mk_generate_one(rm):
-    states = list(rm.keys())
+def mk_generate_one(rm, sources=None, drawn=None):
+    # Tokens come TOKEN_BATCH at a time. The source of every token handed out
+    # goes to `drawn`, when picked by `sources`.
+    sampler = _sampler(rm)
+    pool = []
     def gen():
-        state = random.choice(states)
-        re = random.choice(rm[state])
-        token = solve_regex(re)
+        if not pool:
+            picked = None if sources is None else sources.pick(TOKEN_BATCH)
+            tokens = sampler.tokens(TOKEN_BATCH, picked)
+            pool.extend(zip(tokens, itertools.repeat(None) if picked is None else picked))
+        token, source = pool.pop()
+        if drawn is not None and source is not None:
+            drawn.append(source)
         return token
     return gen
 
@@ -206,65 +208,73 @@ def get_transforms():
     return transforms1, transforms2
 
 
-def afl_showmap(argv, file_path, coverage_path, test):
-    CMD = 'afl-showmap -Q -b -o {coverage} -- {argv}'
-    cmd = CMD.format(argv=argv, coverage=coverage_path)
-    # print(cmd)
-    with open(file_path, 'wb') as f:
-        f.write(test)
-
-    # print(test)
-
-    ret = subprocess.run(
-            shlex.split(cmd),
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-    )
-
-    if ret.returncode < 0:
-        return ret.returncode, None
-
-    cov = None
-    with open(coverage_path, 'rb') as f:
-        cov = np.fromfile(coverage_path, dtype=np.uint8)
-    return ret.returncode, cov
-
-
 class Fuzzer(object):
-    def __init__(self, out_dir, regmap, argv, file_path, name='bbz'):
+    # One fuzzer instance of an AFL-style sync dir: it writes what it finds
+    # to sync_dir/<name>/queue and picks up the queues of the others.
+    # `siblings` are the names of the instances sharing its `virgin` map,
+    # whose entries need no run to be imported.
+    def __init__(self, out_dir, regmap, argv, file_path, name='bbz', executor='forkserver', virgin=None,
+                 siblings=(), sync_interval=SYNC_INTERVAL):
+        self.name = name
         self.sync_dir = out_dir
         self.my_dir = os.path.join(out_dir, name)
         self.my_queue = os.path.join(self.my_dir, 'queue')
+        self.my_crashes = os.path.join(self.my_dir, 'crashes')
         self.my_coverage = os.path.join(self.my_dir, 'coverage.bin')
 
         self.regmap = regmap
         self.argv = argv
         self.fp = file_path
         self.tests = []
-        self.global_coverage = np.zeros(65536, dtype=np.uint8)
+        self.cksums = set()
+        self.virgin = VirginMap() if virgin is None else virgin
+        self.siblings = set(siblings)
+        self.sync_interval = sync_interval
+        self.last_sync = time.monotonic()
+        # Last queue id imported from every other instance
+        self.synced = {}
+        self.queued = 0
+        self.cull_at = CULL_AT
 
         self.init_path()
         self.transforms = get_transforms()
+        # What the transforms and the token sources found, and at what cost.
+        # The sources come with the sampler, in fuzz().
+        self.trans1 = Bandit(t.__name__ for t in self.transforms[0])
+        self.trans2 = Bandit(t.__name__ for t in self.transforms[1])
+        self.sources = None
+        self.drawn = []
+        self.stats = AflStats(self.my_dir, name, argv)
+        if isinstance(executor, str):
+            executor = make_executor(executor, argv, file_path, self.my_coverage)
+        self.executor = executor
 
     def init_path(self):
         os.makedirs(self.sync_dir, exist_ok=True)
         os.makedirs(self.my_dir, exist_ok=True)
         os.makedirs(self.my_queue, exist_ok=True)
+        os.makedirs(self.my_crashes, exist_ok=True)
 
     def fuzz(self):
-        generate = mk_generate(self.regmap)
-        self.generate_one = mk_generate_one(self.regmap)
+        sampler = _sampler(self.regmap)
+        if sampler.names:
+            self.sources = Bandit(sampler.names)
+        generate = mk_generate(sampler, self.sources)
+        self.generate_one = mk_generate_one(sampler, self.sources, self.drawn)
         while True:
             print('Creating a new test and fuzzing it...')
             test = generate()
             self.fuzz_one(test, times=max(1, 100 - len(self.tests) // 2))
 
+            self.maybe_sync()
+            self.maybe_cull()
+
             print('Iterating on old tests...')
-            for i in range(100):
+            for i in range(100 if self.tests else 0):
                 test = random.choice(self.tests)
                 print('Old {}...'.format(i))
                 self.fuzz_one(test, times=10)
+                self.maybe_sync()
 
     def fuzz_one(self, test, times):
         for i in range(times):
@@ -273,9 +283,10 @@ class Fuzzer(object):
 
             # TODO: do we really need a copy?
             new_test = test.tokens[:]
-            for j in range(1 << random.randint(1, 4)):
-                transform = random.choice(self.transforms[0])
-                new_test = list(transform(self.generate_one, new_test))
+            del self.drawn[:]
+            picked = self.trans1.pick(1 << random.randint(1, 4))
+            for j in picked:
+                new_test = list(self.transforms[0][j](self.generate_one, new_test))
 
             if len(new_test) > MAX_TEST_LEN:
                 new_test = new_test[:MAX_TEST_LEN]
@@ -284,61 +295,248 @@ class Fuzzer(object):
             if not new_test:
                 continue
 
-            new_test = Testcase(new_test)
-            buff = b''.join(bytes(t) for t in new_test.tokens)
-
-            # Get the coverage
-            exitcode, cov = afl_showmap(self.argv, self.fp, self.my_coverage, buff)
-            if exitcode < 0:
-                print('CRASH!!!')
-                exit()
-            cov = (cov > 0).astype(np.uint8)
-            new_test.coverage = cov
-
-            new_global_coverage = cov | self.global_coverage
-            if np.any(new_global_coverage != self.global_coverage):
-                print('Increased coverage :D')
-                print(buff)
-                self.global_coverage = new_global_coverage
-                self.tests.append(new_test)
+            start = time.perf_counter()
+            kept = self.run_one(Testcase(new_test), 'Increased coverage :D', 'op:token')
+            seconds = time.perf_counter() - start
+            self.trans1.reward(picked, kept, seconds)
+            if self.sources is not None and self.drawn:
+                self.sources.reward(self.drawn, kept, seconds)
 
         SPLICE_ROUNDS = len(self.tests)
         for i in range(SPLICE_ROUNDS):
             other = random.choice(self.tests)
-            new_test = random.choice(self.transforms[1])(test.tokens[:], other.tokens[:])
-
-            new_test = Testcase(new_test)
-            buff = b''.join(bytes(t) for t in new_test.tokens)
-
-            # Get the coverage
-            exitcode, cov = afl_showmap(self.argv, self.fp, self.my_coverage, buff)
-            if exitcode < 0:
-                print('CRASH!!!')
-                exit()
-            cov = (cov > 0).astype(np.uint8)
-            new_test.coverage = cov
-
-            new_global_coverage = cov | self.global_coverage
-            if np.any(new_global_coverage != self.global_coverage):
-                print('Splice increased coverage :D')
-                print(buff)
-                self.global_coverage = new_global_coverage
-                self.tests.append(new_test)
-            
-
-def main(out_dir, file_path, argv, regexps_path):
+            k = self.trans2.pick()
+            new_test = self.transforms[1][k](test.tokens[:], other.tokens[:])
+
+            start = time.perf_counter()
+            kept = self.run_one(Testcase(new_test), 'Splice increased coverage :D', 'op:splice')
+            self.trans2.reward([k], kept, time.perf_counter() - start)
+
+    def run_one(self, test, message, how):
+        # Runs a testcase and keeps it if it hits new tuples or new hit-count
+        # buckets. Returns whether it was kept.
+        exitcode, cov = self.execute(test)
+        if exitcode is None:
+            return False
+        if exitcode < 0:
+            print('CRASH!!!')
+            i = len(corpus.entries(self.my_crashes))
+            corpus.write_entry(self.my_crashes, 'id:{:06d},sig:{:02d},{}'.format(i, -exitcode, how), test.tokens)
+            self.stats.crash()
+            self.write_stats(force=True)
+            exit()
+
+        new_bits = self.virgin.has_new_bits(cov)
+        if new_bits == NO_NEW_BITS:
+            return False
+        cksum = coverage_hash(cov)
+        if cksum in self.cksums:
+            return False
+        print(message)
+        print(b''.join(test.tokens))
+        test.coverage = sparse(cov)
+        test.cksum = cksum
+        self.keep(test, how + (',+cov' if new_bits == NEW_TUPLE else ''))
+        return True
+
+    def execute(self, test):
+        # (exit code, classified trace or None). Turns the tokens into bytes
+        # on the way: the transforms leave all sorts of iterables around.
+        test.tokens = [bytes(t) for t in test.tokens]
+        exitcode, cov = self.executor.run(b''.join(test.tokens))
+        self.stats.execs += 1
+        if exitcode is None:
+            self.stats.hang()
+        self.write_stats()
+        if exitcode is None or exitcode < 0:
+            return exitcode, None
+        return exitcode, classify(cov)
+
+    def keep(self, test, how, write=True):
+        if test.cksum is not None:
+            self.cksums.add(test.cksum)
+        self.tests.append(test)
+        if write:
+            # AFL's file names, e.g. queue/id:000042,sync:bbz1,src:000007
+            corpus.write_entry(self.my_queue, 'id:{:06d},{}'.format(self.queued, how), test.tokens)
+            self.queued += 1
+            self.stats.path(imported=how.startswith('sync:'))
+
+    def write_stats(self, force=False):
+        # fuzzer_stats and plot_data when due, and the yield of every
+        # transform and token source along with fuzzer_stats
+        if not self.stats.update(self.queued, self.virgin.coverage, force):
+            return
+        report = {
+            'trans1': self.trans1.report(),
+            'trans2': self.trans2.report(),
+            'sources': self.sources.report() if self.sources is not None else {},
+        }
+        with open(os.path.join(self.my_dir, 'reflex_stats.json'), 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    def resume(self):
+        # Picks up a previous run of this instance: reruns its queue to get
+        # the coverage (and the virgin map) back, then carries on with the
+        # next queue id and from where the syncs stopped
+        for name, i in corpus.read_synced(self.my_dir).items():
+            # Siblings are imported for free anyway
+            if name not in self.siblings:
+                self.synced[name] = i - 1
+        for i, fn in corpus.entries(self.my_queue):
+            self.queued = i + 1
+            test = Testcase(corpus.read_entry(self.my_queue, fn))
+            _, cov = self.execute(test)
+            if cov is None:
+                continue
+            self.virgin.has_new_bits(cov)
+            test.coverage = sparse(cov)
+            test.cksum = coverage_hash(cov)
+            self.keep(test, None, write=False)
+        print('Resumed {} tests'.format(len(self.tests)))
+
+    def maybe_cull(self):
+        if len(self.tests) >= self.cull_at:
+            self.cull()
+            self.cull_at = max(CULL_AT, 2 * len(self.tests))
+
+    def cull(self):
+        # cmin of the tests in memory, running those imported without a run
+        # first. The queue on disk stays as it is: the other instances sync
+        # from it by id.
+        tests = []
+        for test in self.tests:
+            if test.coverage is None:
+                _, cov = self.execute(test)
+                if cov is None:
+                    continue
+                test.coverage = sparse(cov)
+                test.cksum = coverage_hash(cov)
+            tests.append(test)
+        sizes = [sum(len(t) for t in test.tokens) for test in tests]
+        keep = corpus.cmin([test.coverage for test in tests], sizes)
+        print('Culled {} tests down to {}'.format(len(self.tests), len(keep)))
+        self.tests = [tests[i] for i in keep]
+
+    def maybe_sync(self):
+        if time.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        # Imports the queue entries the other instances (reflex or afl-fuzz)
+        # found since the last time. Entries of the instances sharing our
+        # virgin map are interesting by construction; the others are run.
+        self.last_sync = time.monotonic()
+        for name in sorted(os.listdir(self.sync_dir)):
+            queue = os.path.join(self.sync_dir, name, 'queue')
+            if name == self.name or not os.path.isdir(queue):
+                continue
+            last = self.synced.get(name, -1)
+            for i, fn in corpus.entries(queue):
+                if i <= last:
+                    continue
+                test = Testcase(corpus.read_entry(queue, fn))
+                how = 'sync:{},src:{:06d}'.format(name, i)
+                if name in self.siblings:
+                    # Already in a queue of ours, no need for another copy
+                    self.keep(test, how, write=False)
+                elif any(test.tokens):
+                    self.run_one(test, 'Imported {}/{}'.format(name, fn), how)
+                last = i
+            if name not in self.siblings and last != self.synced.get(name, -1):
+                corpus.write_synced(self.my_dir, name, last + 1)
+            self.synced[name] = last
+
+
+def load_regmap(regexps_path):
+    # A Sampler out of a directory of N_M.dfa.regexp files or a bundle of
+    # them. Without any regexp, the tokens come straight from the DFAs: a
+    # TokenPool out of a G.rdfa or a directory of N_M.dfa files.
+    if regexps_path.endswith('.rdfa') or (os.path.isdir(regexps_path) and
+                                          not glob.glob(os.path.join(regexps_path, '*.regexp'))):
+        return TokenPool(load_automata(regexps_path))
+    return Sampler.from_entries(re.load_regexps(regexps_path))
+
+
+def _input_file(directory, argv, file_path=None):
+    # The target reads `file_path`, or its own copy of the input in
+    # `directory` when its command line has @@
+    if '@@' not in shlex.split(argv):
+        return argv, file_path
+    file_path = os.path.join(directory, '.cur_input')
+    argv = ' '.join(shlex.quote(file_path if a == '@@' else a) for a in shlex.split(argv))
+    return argv, file_path
+
+
+def _worker(out_dir, regmap, argv, name, executor, siblings, virgin, seed):
+    random.seed(seed)
+    argv, file_path = _input_file(os.path.join(out_dir, name), argv)
+    virgin = VirginMap(buffer=virgin.buf)
+    fuzzer = Fuzzer(out_dir, regmap, argv, file_path, name, executor, virgin, siblings)
+    fuzzer.resume()
+    fuzzer.fuzz()
+
+
+def main(out_dir, file_path, argv, regexps_path, executor='forkserver', workers=1, name='bbz'):
     s = random.randint(0, 100000)
     random.seed(s)
     # random.seed(54136)
     print('SEED:', s)
 
-    regmap = collections.defaultdict(list)
-    for fn in sorted(glob.glob(os.path.join(regexps_path, '*.regexp')), key=lambda x: parse_file_name(x)):
-        with open(fn, 'r') as f:
-            rs = parse_file_name(fn)
-            regexp = re.load_regexp(f.read())
-            regmap[rs.state].append(regexp)
-
-    fuzzer = Fuzzer(out_dir, regmap, argv, file_path)
-    fuzzer.fuzz()
-
+    regmap = load_regmap(regexps_path)
+
+    if workers <= 1:
+        argv, file_path = _input_file(os.path.join(out_dir, name), argv, file_path)
+        fuzzer = Fuzzer(out_dir, regmap, argv, file_path, name=name, executor=executor)
+        fuzzer.resume()
+        fuzzer.fuzz()
+        return
+
+    if '@@' not in shlex.split(argv):
+        raise ValueError('several workers need @@ in the target command line')
+    # One virgin map for everybody, so that a path found by a worker is not
+    # new to the others (the updates race, which only costs a few duplicates)
+    virgin = shared_memory.SharedMemory(create=True, size=MAP_SIZE)
+    np.frombuffer(virgin.buf, dtype=np.uint8)[:] = 0xff
+    names = ['{}{}'.format(name, i) for i in range(workers)]
+    procs = [
+        multiprocessing.Process(target=_worker, args=(out_dir, regmap, argv, n, executor, names, virgin, s + i))
+        for i, n in enumerate(names)
+    ]
+    # Clean up the map on kill too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    try:
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+    finally:
+        for p in procs:
+            p.terminate()
+        virgin.close()
+        virgin.unlink()
+
+
+def cmin(in_queue, out_queue, argv, file_path='', executor='forkserver'):
+    # afl-cmin for queues: copies the smallest subset of in_queue covering
+    # the same bitmap (tokens included) to out_queue
+    os.makedirs(out_queue, exist_ok=True)
+    argv, file_path = _input_file(out_queue, argv, file_path)
+    if isinstance(executor, str):
+        executor = make_executor(executor, argv, file_path, os.path.join(out_queue, '.cur_coverage'))
+    names = []
+    tests = []
+    with executor:
+        for _, fn in corpus.entries(in_queue):
+            tokens = corpus.read_entry(in_queue, fn)
+            exitcode, cov = executor.run(b''.join(tokens))
+            if exitcode is None or exitcode < 0:
+                print('Skipping {} (crash or hang)'.format(fn))
+                continue
+            names.append(fn)
+            tests.append((tokens, sparse(classify(cov))))
+    keep = corpus.cmin([cov for _, cov in tests], [sum(len(t) for t in tokens) for tokens, _ in tests])
+    for i in keep:
+        corpus.write_entry(out_queue, names[i], tests[i][0])
+    print('Kept {} of {} entries'.format(len(keep), len(tests)))
+    return [names[i] for i in keep]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from .dfa import DFA
+
+
+def _inverse(t, n):
+    # Per class, CSR lists of the predecessors of every state
+    inv = []
+    for c in range(t.shape[1]):
+        order = np.argsort(t[:, c], kind='stable')
+        indptr = np.searchsorted(t[order, c], np.arange(n + 1))
+        inv.append((indptr, order))
+    return inv
+
+
+def _preimage(inv, c, block):
+    indptr, sources = inv[c]
+    starts = indptr[block]
+    lens = indptr[block + 1] - starts
+    total = int(lens.sum())
+    if total == 0:
+        return sources[:0]
+    # Gather all sources[starts[i]:starts[i] + lens[i]] at once
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lens)[:-1])), lens)
+    return sources[offsets + np.arange(total)]
+
+
+def minimize(dfa, nodes=None, accepts=None):
+    # Hopcroft's partition refinement over the equivalence classes of `dfa`,
+    # restricted to `nodes` (default: every state). States are told apart by
+    # their accept code (`accepts`, default: dfa.accepts); missing
+    # transitions go to an implicit dead state.
+    #
+    # Returns `rep`: for every state of the DFA the smallest state of its
+    # block, -1 for states outside of `nodes`.
+    n_states = dfa.n_states
+    nodes = np.arange(n_states) if nodes is None else np.asarray(nodes, dtype=np.int64)
+    accepts = dfa.accepts if accepts is None else np.asarray(accepts)
+    k = len(nodes)
+    dead = k
+
+    local = np.full(n_states + 1, dead, dtype=np.int64)
+    local[nodes] = np.arange(k)
+    cols = np.flatnonzero(dfa.classes.any(axis=1))
+    t = dfa.transitions[nodes][:, cols].astype(np.int64)
+    t[t == dfa.none] = n_states
+    t = np.vstack((local[t], np.full((1, len(cols)), dead)))
+    inv = _inverse(t, k + 1)
+
+    codes = np.concatenate((accepts[nodes], [0]))
+    _, block_of = np.unique(codes, return_inverse=True)
+    block_of = block_of.astype(np.int64)
+    blocks = [set(np.flatnonzero(block_of == b).tolist()) for b in range(block_of.max() + 1)]
+
+    work = set((b, c) for b in range(len(blocks)) for c in range(len(cols)))
+    while work:
+        b, c = work.pop()
+        x = _preimage(inv, c, np.fromiter(blocks[b], dtype=np.int64))
+        if x.size == 0:
+            continue
+        x = np.unique(x)
+        owners = block_of[x]
+        order = np.argsort(owners, kind='stable')
+        x, owners = x[order], owners[order]
+        bounds = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1], [True])))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            y = int(owners[lo])
+            if hi - lo == len(blocks[y]):
+                continue
+            inside = set(x[lo:hi].tolist())
+            outside = blocks[y] - inside
+            new = len(blocks)
+            # The new block keeps the smaller half
+            if len(inside) <= len(outside):
+                blocks[y], moved = outside, inside
+            else:
+                blocks[y], moved = inside, outside
+            blocks.append(moved)
+            block_of[np.fromiter(moved, dtype=np.int64)] = new
+            # Whether or not (y, d) is still pending, (new, d) is enough
+            for d in range(len(cols)):
+                work.add((new, d))
+
+    rep = np.full(n_states, -1, dtype=np.int64)
+    for members in blocks:
+        members = sorted(m for m in members if m != dead)
+        if members:
+            rep[nodes[members]] = nodes[members[0]]
+    return rep
+
+
+def quotient(dfa, rep, accepts=None, nodes=None):
+    # `dfa` with every state replaced by its representative. States that are
+    # not representatives (or have rep -1) are left without edges, and so
+    # are those outside of `nodes` when given: the rows of the other states
+    # are never looked at.
+    n = dfa.n_states
+    accepts = dfa.accepts if accepts is None else accepts
+    keep = rep == np.arange(n)
+    rows = np.flatnonzero(keep) if nodes is None else np.asarray(nodes, dtype=np.int64)
+    rows = rows[keep[rows]]
+
+    t = dfa.transitions[rows]
+    valid = t != dfa.none
+    sub = np.full(t.shape, dfa.none, dtype=dfa.transitions.dtype)
+    targets = rep[t[valid].astype(np.int64)]
+    sub[valid] = np.where(targets >= 0, targets, dfa.none)
+    transitions = np.full(dfa.transitions.shape, dfa.none, dtype=dfa.transitions.dtype)
+    transitions[rows] = sub
+    return DFA(transitions, np.where(keep, accepts, 0).astype(np.uint32), dfa.classes)
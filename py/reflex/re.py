@@ -1,38 +1,101 @@
+import glob
 import json
+import os
+
+from collections import namedtuple
+
+import numpy as np
+
+from .dfa import read_arrays
+from .dfa import write_arrays
+
+
+EMPTY = 0
+LITERAL = 1
+RESET = 2
+THEN = 3
+OR = 4
+STAR = 5
+PLUS = 6
+OPTIONAL = 7
+
+# Leaves hold bytes, the other nodes hold nodes
+LEAVES = (EMPTY, LITERAL, RESET)
+
+BUNDLE_MAGIC = b'RFLXREGX'
+BUNDLE_VERSION = 1
 
 
 class Regexp(object):
+    # Nodes are immutable: equal trees hash and compare equal (the hash is
+    # computed once, from the children's), so that an Interner can share
+    # the subtrees rules have in common
+    __slots__ = (
+        'contents',
+        '_hash',
+    )
+    tag = None
+
     def __init__(self, contents=None):
-        self.contents = contents
+        self.contents = tuple(contents) if contents is not None else ()
+        self._hash = hash((self.tag, self.contents))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Regexp):
+            return NotImplemented
+        # An explicit stack, like from_json(): comparing the contents tuples
+        # would recurse as deep as the trees go
+        stack = [(self, other)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if a.tag != b.tag or a._hash != b._hash or len(a.contents) != len(b.contents):
+                return False
+            if a.tag in LEAVES:
+                if a.contents != b.contents:
+                    return False
+            else:
+                stack.extend(zip(a.contents, b.contents))
+        return True
+
+    def __repr__(self):
+        return '{}{!r}'.format(self.__class__.__name__, self.contents)
 
     @classmethod
-    def from_json(clazz, j):
+    def from_json(clazz, j, interner=None):
         if not isinstance(j, dict):
             return j
-        tag = j['tag']
-        if tag == 'Then':
-            r = Then()
-        elif tag == 'Literal':
-            r = Literal()
-        elif tag == 'RESet':
-            r = RESet()
-        elif tag == 'Star':
-            r = Star()
-        elif tag == 'OneOrMore':
-            r = Plus()
-        elif tag == 'Or':
-            r = Or()
-        elif tag == 'Optional':
-            r = Optional()
-        else:
-            raise Exception(tag)
-        r.from_contents(j['contents'])
-        return r
-
-    def from_contents(self, c):
-        if not isinstance(c, list):
-            c = [c]
-        self.contents = [Regexp.from_json(ci) for ci in c]
+        intern = interner if interner is not None else _same
+        # Post-order walk with an explicit stack: rules can nest deep
+        done = []
+        stack = [(j, False)]
+        while stack:
+            j, expanded = stack.pop()
+            if not isinstance(j, dict):
+                done.append(j)
+                continue
+            node = JSON_TAGS.get(j['tag'])
+            if node is None:
+                raise ValueError('unknown tag {}'.format(j['tag']))
+            contents = j['contents']
+            if not isinstance(contents, list):
+                contents = [contents]
+            if node.tag in LEAVES:
+                done.append(intern(node(contents)))
+            elif expanded:
+                children = done[len(done) - len(contents):]
+                del done[len(done) - len(contents):]
+                done.append(intern(node(children)))
+            else:
+                stack.append((j, True))
+                stack.extend((c, False) for c in reversed(contents))
+        return done[0]
 
     def pp(self, indent=0):
         ret = []
@@ -53,78 +116,176 @@ class Regexp(object):
         return self.pp()
 
     def is_empty(self):
-        return False
+        return self.tag == EMPTY
 
     def is_literal(self):
-        return False
+        return self.tag == LITERAL
 
     def is_optional(self):
-        return False
+        return self.tag == OPTIONAL
 
     def is_or(self):
-        return False
+        return self.tag == OR
 
     def is_then(self):
-        return False
+        return self.tag == THEN
 
     def is_re_set(self):
-        return False
+        return self.tag == RESET
 
     def is_star(self):
-        return False
-    
+        return self.tag == STAR
+
     def is_plus(self):
-        return False
+        return self.tag == PLUS
 
     def is_leaf(self):
-        return self.is_re_set() or self.is_literal()
+        return self.tag == RESET or self.tag == LITERAL
 
 
 class Empty(Regexp):
-    def __init__(self):
-        pass
-
-    def is_empty(self):
-        return True
+    __slots__ = ()
+    tag = EMPTY
 
 
 class Optional(Regexp):
-    def is_optional(self):
-        return True
+    __slots__ = ()
+    tag = OPTIONAL
 
 
 class Or(Regexp):
-    def is_or(self):
-        return True
+    __slots__ = ()
+    tag = OR
 
 
 class Plus(Regexp):
-    def is_plus(self):
-        return True
+    __slots__ = ()
+    tag = PLUS
 
 
 class Then(Regexp):
-    def is_then(self):
-        return True
+    __slots__ = ()
+    tag = THEN
 
 
 class Literal(Regexp):
-    def is_literal(self):
-        return True
+    __slots__ = ()
+    tag = LITERAL
 
 
 class RESet(Regexp):
-    def is_re_set(self):
-        return True
+    __slots__ = ()
+    tag = RESET
 
 
 class Star(Regexp):
-    def is_star(self):
-        return True
+    __slots__ = ()
+    tag = STAR
+
 
+NODES = {c.tag: c for c in (Empty, Literal, RESet, Then, Or, Star, Plus, Optional)}
+JSON_TAGS = {
+    'Then': Then,
+    'Literal': Literal,
+    'RESet': RESet,
+    'Star': Star,
+    'OneOrMore': Plus,
+    'Or': Or,
+    'Optional': Optional,
+}
 
-def load_regexp(s):
+
+def _same(r):
+    return r
+
+
+class Interner(object):
+    # Hands out one object for all the equal (sub)trees it is given
+
+    def __init__(self):
+        self.nodes = {}
+
+    def __call__(self, r):
+        return self.nodes.setdefault(r, r)
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+def load_regexp(s, interner=None):
     j = json.loads(s)
-    o = Regexp.from_json(j)
+    o = Regexp.from_json(j, interner)
     return o
 
+
+RS = namedtuple('RS', ('rule', 'state'))
+
+
+def parse_file_name(fn):
+    _, fn = os.path.split(fn)
+    fn = fn.split('.')[0]
+    rule, state = fn.split('_')
+    return RS(int(rule), int(state))
+
+
+def save_bundle(path, entries):
+    # [(RS, Regexp)] -> one file holding every distinct subtree once, each
+    # node after its children: its tag and its bytes (leaves) or the
+    # indices of its children
+    ids = {}
+    tags = []
+    offsets = [0]
+    words = []
+    roots = []
+    for rs, r in entries:
+        stack = [(r, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in ids:
+                continue
+            if node.tag in LEAVES:
+                words.extend(node.contents)
+            elif expanded:
+                words.extend(ids[c] for c in node.contents)
+            else:
+                stack.append((node, True))
+                stack.extend((c, False) for c in reversed(node.contents))
+                continue
+            ids[node] = len(tags)
+            tags.append(node.tag)
+            offsets.append(len(words))
+        roots.append((rs.rule, rs.state, ids[r]))
+
+    write_arrays(path, BUNDLE_MAGIC, BUNDLE_VERSION, {
+        'tags': np.array(tags, dtype=np.uint8),
+        'offsets': np.array(offsets, dtype=np.uint32),
+        'words': np.array(words, dtype=np.uint32),
+        'roots': np.array(roots, dtype=np.uint32).reshape(-1, 3),
+    })
+
+
+def load_bundle(path, interner=None):
+    arrays = read_arrays(path, BUNDLE_MAGIC, BUNDLE_VERSION)
+    intern = interner if interner is not None else _same
+    offsets = arrays['offsets'].tolist()
+    words = arrays['words'].tolist()
+    nodes = []
+    for i, tag in enumerate(arrays['tags'].tolist()):
+        contents = words[offsets[i]:offsets[i + 1]]
+        if tag not in LEAVES:
+            contents = [nodes[k] for k in contents]
+        nodes.append(intern(NODES[tag](contents)))
+    return [(RS(rule, state), nodes[k]) for rule, state, k in arrays['roots'].tolist()]
+
+
+def load_regexps(path, interner=None):
+    # [(RS, Regexp)] sorted by rule and state, out of a bundle or a
+    # directory of N_M.dfa.regexp files
+    if os.path.isfile(path):
+        return sorted(load_bundle(path, interner), key=lambda e: e[0])
+    interner = Interner() if interner is None else interner
+    ret = []
+    for fn in glob.glob(os.path.join(path, '*.regexp')):
+        with open(fn, 'r') as f:
+            ret.append((parse_file_name(fn), load_regexp(f.read(), interner)))
+    return sorted(ret, key=lambda e: e[0])
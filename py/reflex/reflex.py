@@ -2,32 +2,29 @@
 
 import itertools
 import json
+import mmap
 import os
-import pickle
-import struct
 import types
 
-from collections import defaultdict
 from collections import namedtuple
 
 import cxxfilt
 import lief
-import networkx as nx
+import numpy as np
 
+from . import dot
+from .dfa import DFA
+from .exits import Exits
+from .minimize import minimize
+from .minimize import quotient
+from .stats import Progress
+from .stats import Stats
+from .transitions import Transitions
 
-def analyze_exits(G):
-    # map an accepting state into its exit values
-    exits = {}
-    for u, u_data in G.nodes(data=True):
-        if not u_data['accepts']:
-            continue
 
-        for _, v, data in G.edges(u, data=True):
-            # ee = set(chr(i) for i in range(0, 256)).difference(data['alphabet'])
-            ee = set(chr(i) for i in range(1, 256)).difference(data['alphabet'])
-            # assert ee
-            exits[u] = ''.join(sorted(ee))
-    return exits
+def analyze_exits(dfa):
+    # Map every accepting state into the bytes that make it stop matching
+    return Exits.from_dfa(dfa)
 
 
 SIZE_TO_FORMAT = {
@@ -42,7 +39,21 @@ SizedOffset = namedtuple(
     [
         'offset',
         'size',
-    ]
+        'count',
+    ],
+    # count=None means "infer the length of the table"
+    defaults=[None],
+)
+
+
+TABLES = (
+    'yy_accept',
+    'yy_base',
+    'yy_chk',
+    'yy_def',
+    'yy_ec',
+    'yy_meta',
+    'yy_nxt',
 )
 
 
@@ -62,154 +73,295 @@ Config = namedtuple(
         'yy_ec',
         'yy_meta',
         'yy_nxt',
-    ]
+        'decompress',
+        'minimize',
+        # Names from OUTPUTS, None for DEFAULT_OUTPUTS
+        'outputs',
+    ],
+    defaults=['vector', False, None],
 )
 
 
+# What reflex() can write into out_path
+OUTPUTS = {
+    'rdfa': 'G.rdfa',
+    'transitions': 'G.rtrans',
+    'exits': 'exits.rexits',
+    'dot': 'out.dot',
+    'start-dot': '1.dot',
+    'graphml': 'out.graphml',
+}
+DEFAULT_OUTPUTS = ('rdfa', 'transitions', 'exits', 'dot', 'start-dot')
+
+
 class Target(object):
 
-    def __init__(self, config):
-        self._bin = open(config.target, 'rb')
+    def __init__(self, config, mapped=None):
         self._cfg = config
         self._fmt = '<' if config.endianness == 'little' else '>'
-
-    def _read(self, w, i):
-        size   = w.size
-        offset = w.offset + i * size
-        fmt    = self._fmt + SIZE_TO_FORMAT[w.size]
-        self._bin.seek(offset)
-        data = self._bin.read(size)
-        return struct.unpack(fmt, data)[0]
+        # `mapped` lets several lexers of the same binary share one mapping
+        self._owned = mapped is None
+        if mapped is None:
+            with open(config.target, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._map = mapped
+        self.tables = {}
+        try:
+            for name in TABLES:
+                self.tables[name] = self._load(name)
+        except Exception:
+            # Bad offsets or a truncated file: no mapping left behind
+            self.close()
+            raise
+
+    def _count(self, name):
+        w = getattr(self._cfg, name)
+        if w.count is not None:
+            return w.count
+        if name == 'yy_ec':
+            return 256
+        # Assume the table runs until the next one (or the end of the file)
+        end = len(self._map)
+        for other in TABLES:
+            o = getattr(self._cfg, other)
+            if w.offset < o.offset < end:
+                end = o.offset
+        return (end - w.offset) // w.size
+
+    def _load(self, name):
+        w = getattr(self._cfg, name)
+        dtype = np.dtype(self._fmt + SIZE_TO_FORMAT[w.size])
+        count = self._count(name)
+        if w.offset + count * w.size > len(self._map):
+            raise ValueError('{} does not fit in {}'.format(name, self._cfg.target))
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=w.offset)
+
+    def close(self):
+        self.tables = {}
+        if self._owned:
+            self._map.close()
 
     def yy_accept(self, i):
-        return self._read(self._cfg.yy_accept, i)
+        return int(self.tables['yy_accept'][i])
 
     def yy_base(self, i):
-        return self._read(self._cfg.yy_base, i)
+        return int(self.tables['yy_base'][i])
 
     def yy_chk(self, i):
-        return self._read(self._cfg.yy_chk, i)
+        return int(self.tables['yy_chk'][i])
 
     def yy_def(self, i):
-        return self._read(self._cfg.yy_def, i)
+        return int(self.tables['yy_def'][i])
 
     def yy_ec(self, i):
-        return self._read(self._cfg.yy_ec, i)
+        return int(self.tables['yy_ec'][i])
 
     def yy_meta(self, i):
-        return self._read(self._cfg.yy_meta, i)
+        return int(self.tables['yy_meta'][i])
 
     def yy_nxt(self, i):
-        return self._read(self._cfg.yy_nxt, i)
-
+        return int(self.tables['yy_nxt'][i])
+
+
+def decompress(flex, max_state, classes, stats=None):
+    # Resolve the yy_def/yy_meta fallback chain of every (state, class) pair at
+    # once, the same way yylex() does it one pair at a time.
+    base = flex.tables['yy_base'].astype(np.int64)
+    chk = flex.tables['yy_chk'].astype(np.int64)
+    deff = flex.tables['yy_def'].astype(np.int64)
+    meta = flex.tables['yy_meta'].astype(np.int64)
+    nxt = flex.tables['yy_nxt'].astype(np.int64)
+
+    classes = np.asarray(sorted(classes), dtype=np.int64)
+    rows = np.arange(1, max_state, dtype=np.int64)
+    state = np.repeat(rows, len(classes))
+    clazz = np.tile(classes, len(rows))
+    origin = state.copy()
+
+    pending = np.arange(state.size)
+    lookups = hops = 0
+    # A chain longer than yy_def means we are looping
+    for _ in range(len(deff) + 1):
+        s = state[pending]
+        lookups += pending.size
+        pending = pending[chk[base[s] + clazz[pending]] != s]
+        if pending.size == 0:
+            break
+        hops += pending.size
+        state[pending] = deff[state[pending]]
+        template = pending[state[pending] >= max_state]
+        clazz[template] = meta[clazz[template]]
+    else:
+        raise ValueError('yy_def chains do not converge')
+
+    # -1 marks rows/columns that do not correspond to a state/class
+    table = np.full((max_state, int(classes.max()) + 1), -1, dtype=np.int64)
+    table[origin, np.tile(classes, len(rows))] = nxt[base[state] + clazz]
+    if stats is not None:
+        stats.count('chk_lookups', lookups)
+        stats.count('chain_hops', hops)
+    return table
+
+
+class ChainResolver(object):
+    # Scalar counterpart of decompress() that remembers every chain suffix it
+    # has already walked, keyed by (default/template state, class). States
+    # sharing a template only pay for walking it once.
+
+    def __init__(self, flex, max_state):
+        self._flex = flex
+        self._max_state = max_state
+        self._cache = {}
+        self.hops_taken = 0
+        self.hops_saved = 0
+
+    def resolve(self, state, clazz):
+        flex = self._flex
+        path = []
+        hops = 0
+        while flex.yy_chk(flex.yy_base(state) + clazz) != state:
+            state = flex.yy_def(state)
+            if state >= self._max_state:
+                clazz = flex.yy_meta(clazz)
 
-def reflex(config):
-    flex = Target(config)
+            hit = self._cache.get((state, clazz))
+            if hit is not None:
+                next_state, hops = hit
+                self.hops_taken += 1
+                self.hops_saved += hops
+                hops += 1
+                break
+
+            path.append((state, clazz))
+            self.hops_taken += 1
+            if len(path) > len(flex.tables['yy_def']):
+                raise ValueError('yy_def chain of {} does not converge'.format(path[0]))
+        else:
+            next_state = flex.yy_nxt(flex.yy_base(state) + clazz)
+            if path:
+                # The last state of the chain resolved the lookup itself
+                self._cache[path.pop()] = (next_state, 0)
+                hops = 1
+
+        for i, key in enumerate(reversed(path)):
+            self._cache[key] = (next_state, hops + i)
+        return next_state
+
+    def table(self, max_state, classes):
+        table = np.full((max_state, max(classes) + 1), -1, dtype=np.int64)
+        progress = Progress('states', max_state - 1)
+        for state in range(1, max_state):
+            for clazz in classes:
+                table[state, clazz] = self.resolve(state, clazz)
+            progress.update()
+        return table
+
+
+def reflex(config, mapped=None, stats=None):
+    # Returns the Stats of the run (phase timings and counters)
+    stats = Stats() if stats is None else stats
+    with stats.phase('load'):
+        flex = Target(config, mapped)
+    try:
+        return _reflex(flex, config, stats)
+    finally:
+        # Unmaps the binary, unless it came with `mapped`
+        flex.close()
+
+
+def _reflex(flex, config, stats):
+    stats.count('table_bytes', sum(t.nbytes for t in flex.tables.values()))
     max_state = config.max_state
     strip_states = config.states_to_strip
     strip_nulls = config.strip_nulls
     out_path = config.out_path
 
 
-    class2chars = defaultdict(set)
-    # for i in range(0, 256):
-    for i in range(1, 256):
-        class2chars[flex.yy_ec(i)].add(chr(i))
-
-
-    def class2string(c):
-        return ''.join(map(chr,sorted(class2chars[c])))
-
-
-    G = nx.DiGraph()
-    for state in range(max_state):
-        G.add_node(state, label='|' + str(state) + '|', accepts=flex.yy_accept(state))
-
-
-    def follow(H, state, clazz):
-        s = state
-        c = clazz
-        while flex.yy_chk(flex.yy_base(state) + clazz) != state:
-            # print(state)
-            state = flex.yy_def(state)
-            if state >= max_state:
-                clazz = flex.yy_meta(clazz)
-        next_state = flex.yy_nxt(flex.yy_base(state) + clazz)
+    with stats.phase('classes'):
+        # Byte 0 never gets a class of its own
+        ec = flex.tables['yy_ec'][:256].astype(np.int64)
+        classes = np.zeros((int(ec[1:].max()) + 1, 256), dtype=bool)
+        classes[ec[1:], np.arange(1, 256)] = True
+        present = np.flatnonzero(classes.any(axis=1)).tolist()
+    stats.count('classes', len(present))
 
-        if strip_states and next_state in strip_states:
-            return
 
-        # if (state, next_state) in H.edges:
-        if (s, next_state) in H.edges:
-            # H.edges[(state, next_state)]['alphabet'] = H.edges[(state, next_state)]['alphabet'].union(class2chars[c])
-            H.edges[(s, next_state)]['alphabet'] = H.edges[(s, next_state)]['alphabet'].union(class2chars[c])
+    with stats.phase('decompress'):
+        if config.decompress == 'memo':
+            resolver = ChainResolver(flex, max_state)
+            transitions = resolver.table(max_state, present)
+            print('chain hops taken: {} saved: {}'.format(resolver.hops_taken, resolver.hops_saved))
+            stats.count('chain_hops', resolver.hops_taken)
+            stats.count('chain_hops_saved', resolver.hops_saved)
         else:
-            # H.add_edge(state, next_state, alphabet=class2chars[c], accepts=flex.yy_accept[next_state])
-
-            if strip_nulls and c == 0:
-                return
-            H.add_edge(s, next_state, alphabet=class2chars[c])
-
-
-    for curr_state in range(1, max_state):
-        print(curr_state)
-        if flex.yy_accept(curr_state):
-            G.nodes[curr_state]['shape'] = 'doublecircle'
-
-        for clazz in class2chars:
-            follow(G, curr_state, clazz)
-
-        # if (curr_state, flex.yy_def[curr_state]) not in G.edges:
-            # G.add_edge(curr_state, flex.yy_def[curr_state], alphabet=set(), accepts=flex.yy_accept[curr_state])
-
-
-    for u, v, data in G.edges(data=True):
-        label = repr(''.join(sorted(data['alphabet']))) if data['alphabet'] else '•'
-        label = label.replace('\\', '\\\\')
-
-        if len(data['alphabet']) >= 255:
-            label = 'all'
-        elif len(data['alphabet']) > 50:
-            label = 'long'
-
-        data['label'] = label
-
-    # Remove nodes without label (AKA added by transitions and not by us)
-    # TODO(babush): properly tag them instead of relying on the label
-    to_remove = set()
-    for n, data in G.nodes(data=True):
-        if 'label' not in data:
-            to_remove.add(n)
-            continue
-
-        label = data['label']
-
-        if data['accepts']:
-            label += '/{}'.format(data['accepts'])
-
-        data['label'] = label
-
-    for n in to_remove:
-        G.remove_node(n)
-
-
-    import networkx.drawing.nx_agraph
-    networkx.drawing.nx_agraph.write_dot(G, os.path.join(out_path, 'out.dot'))
-    networkx.readwrite.gpickle.write_gpickle(G, os.path.join(out_path, 'G.gpickle'))
-
-    sub1 = nx.descendants(G, 1)
-    sub1.add(1)
-    sub1 = G.subgraph(sub1)
-    networkx.drawing.nx_agraph.write_dot(sub1, os.path.join(out_path, '1.dot'))
-
-    # Export DFA map
-    dfa_transitions = {}
-    for u, v, e_data in G.edges(data=True):
-        v_data = G.nodes[v]
-        for ch in e_data['alphabet']:
-            dfa_transitions[(u, ch)] = (v, v_data['accepts'])
-    pickle.dump(dfa_transitions, open(os.path.join(out_path, 'dfa_transitions.pickle'), 'wb'))
-
-    # Dump exits
-    pickle.dump(analyze_exits(G), open(os.path.join(out_path, 'exits.pickle'), 'wb'))
-
+            transitions = decompress(flex, max_state, present, stats)
+
+    with stats.phase('strip'):
+        before = int((transitions >= 0).sum())
+        # States outside of [0, max_state) are dropped together with their edges
+        transitions[transitions >= max_state] = -1
+        if strip_states:
+            transitions[np.isin(transitions, list(strip_states))] = -1
+        if strip_nulls:
+            # Class 0 never creates an edge on its own
+            alone = (transitions[:, 1:] != transitions[:, :1]).all(axis=1)
+            transitions[alone, 0] = -1
+        stats.count('transitions', int((transitions >= 0).sum()))
+        stats.count('transitions_stripped', before - stats.counters['transitions'])
+
+    with stats.phase('build'):
+        # A copy: the tables are views of the mapping, gone with the Target
+        dfa = DFA.from_table(transitions, flex.tables['yy_accept'][:max_state].copy(), classes)
+    stats.count('states', dfa.n_states)
+    states = None
+    if config.minimize:
+        with stats.phase('minimize'):
+            rep = minimize(dfa)
+            dfa = quotient(dfa, rep)
+            states = np.flatnonzero(rep == np.arange(dfa.n_states))
+        print('minimized: {} -> {} states'.format(dfa.n_states, len(states)))
+        stats.count('states_merged', dfa.n_states - len(states))
+    with stats.phase('build'):
+        # What the dot output would draw, written or not
+        stats.count('edges', dfa.n_edges())
+
+
+    outputs = DEFAULT_OUTPUTS if config.outputs is None else config.outputs
+
+    def output(name):
+        return os.path.join(out_path, OUTPUTS[name])
+
+    if 'dot' in outputs:
+        with stats.phase('write_dot'):
+            dot.write_dot(output('dot'), dfa, states)
+            stats.wrote(output('dot'))
+
+    if 'graphml' in outputs:
+        with stats.phase('write_graphml'):
+            dot.write_graphml(output('graphml'), dfa, states)
+            stats.wrote(output('graphml'))
+
+    if 'rdfa' in outputs:
+        with stats.phase('write_rdfa'):
+            dfa.save(output('rdfa'))
+            stats.wrote(output('rdfa'))
+
+    if 'start-dot' in outputs:
+        with stats.phase('write_dot'):
+            dot.write_dot(output('start-dot'), dfa, dfa.reachable_from(1))
+            stats.wrote(output('start-dot'))
+
+    if 'transitions' in outputs:
+        with stats.phase('write_tables'):
+            # Dense (state, byte) lookups, see reflex.transitions
+            Transitions.from_dfa(dfa).save(output('transitions'))
+            stats.wrote(output('transitions'))
+
+    if 'exits' in outputs:
+        with stats.phase('write_tables'):
+            exits = analyze_exits(dfa)
+            exits.save(output('exits'))
+            stats.count('exits', len(exits))
+            stats.wrote(output('exits'))
+
+    return stats
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+import random
+
+from collections import namedtuple
+
+from . import re
+
+
+# Regexps compiled into flat programs for sampling tokens, so that the
+# fuzzer does not walk the reflex.re tree for every token it makes.
+#
+#   LIT i         append literals[i]
+#   SET i         append a random byte of sets[i]
+#   CHANCE i, t   go to t unless random() < probs[i]
+#   ALT n, t...   go to one of the n targets, picked uniformly
+#   JMP t
+#   HALT
+LIT = 0
+SET = 1
+CHANCE = 2
+ALT = 3
+JMP = 4
+HALT = 5
+
+# Chance of taking an Optional and of going for another round of a Star or a
+# OneOrMore: the number of rounds is geometric
+Repeat = namedtuple('Repeat', ('optional', 'star', 'plus'))
+DEFAULT_REPEAT = Repeat(0.5, 0.7, 0.7)
+
+
+def _sequence(r):
+    # The children of nested Thens, left to right
+    ret = []
+    stack = [r]
+    while stack:
+        r = stack.pop()
+        if r.tag == re.THEN:
+            stack.extend(reversed(r.contents))
+        else:
+            ret.append(r)
+    return ret
+
+
+def _single_byte(r):
+    if r.tag == re.LITERAL and len(r.contents) == 1:
+        return r.contents[0]
+    return None
+
+
+class _Compiler(object):
+
+    def __init__(self, repeat):
+        for p in (repeat.star, repeat.plus):
+            if not 0 <= p < 1:
+                raise ValueError('repetitions need a chance below 1 to stop, not {}'.format(p))
+        self.repeat = repeat
+        self.code = []
+        self.literals = []
+        self.sets = []
+        self.probs = []
+        self._interned = {}
+
+    def intern(self, pool, value):
+        key = (id(pool), value)
+        if key not in self._interned:
+            self._interned[key] = len(pool)
+            pool.append(value)
+        return self._interned[key]
+
+    def prob(self, p):
+        return self.intern(self.probs, p)
+
+    def emit(self, r):
+        code = self.code
+        tag = r.tag
+        if tag == re.THEN:
+            pending = bytearray()
+            for c in _sequence(r):
+                if c.tag == re.LITERAL:
+                    pending += bytes(c.contents)
+                    continue
+                if pending:
+                    code += [LIT, self.intern(self.literals, bytes(pending))]
+                    pending = bytearray()
+                self.emit(c)
+            if pending:
+                code += [LIT, self.intern(self.literals, bytes(pending))]
+        elif tag == re.LITERAL:
+            code += [LIT, self.intern(self.literals, bytes(r.contents))]
+        elif tag == re.RESET:
+            if len(r.contents) == 1:
+                code += [LIT, self.intern(self.literals, bytes(r.contents))]
+            elif r.contents:
+                code += [SET, self.intern(self.sets, bytes(r.contents))]
+        elif tag == re.OR:
+            if not r.contents:
+                return
+            alternatives = [_single_byte(c) for c in r.contents]
+            if None not in alternatives:
+                # Same odds for every byte as for every branch
+                code += [SET, self.intern(self.sets, bytes(alternatives))]
+                return
+            code += [ALT, len(r.contents)]
+            targets = len(code)
+            code += [0] * len(r.contents)
+            jumps = []
+            for i, c in enumerate(r.contents):
+                code[targets + i] = len(code)
+                self.emit(c)
+                code += [JMP, 0]
+                jumps.append(len(code) - 1)
+            for j in jumps:
+                code[j] = len(code)
+        elif tag == re.OPTIONAL:
+            code += [CHANCE, self.prob(self.repeat.optional), 0]
+            skip = len(code) - 1
+            self.emit(r.contents[0])
+            code[skip] = len(code)
+        elif tag == re.STAR:
+            head = len(code)
+            code += [CHANCE, self.prob(self.repeat.star), 0]
+            done = len(code) - 1
+            self.emit(r.contents[0])
+            code += [JMP, head]
+            code[done] = len(code)
+        elif tag == re.PLUS:
+            head = len(code)
+            self.emit(r.contents[0])
+            code += [CHANCE, self.prob(1 - self.repeat.plus), head]
+        elif tag == re.EMPTY:
+            pass
+        else:
+            raise ValueError('cannot sample {}'.format(r.__class__.__name__))
+
+
+class Program(object):
+
+    def __init__(self, code, literals, sets, probs):
+        self.code = code
+        self.literals = literals
+        self.sets = sets
+        self.probs = probs
+
+    @classmethod
+    def compile(clazz, regexp, repeat=DEFAULT_REPEAT):
+        c = _Compiler(repeat)
+        c.emit(regexp)
+        c.code.append(HALT)
+        return clazz(c.code, c.literals, c.sets, c.probs)
+
+    def run(self, out):
+        # Appends one token to the bytearray `out`
+        code = self.code
+        literals = self.literals
+        sets = self.sets
+        probs = self.probs
+        rnd = random.random
+        pc = 0
+        while True:
+            op = code[pc]
+            if op == LIT:
+                out += literals[code[pc + 1]]
+                pc += 2
+            elif op == SET:
+                table = sets[code[pc + 1]]
+                out.append(table[int(rnd() * len(table))])
+                pc += 2
+            elif op == CHANCE:
+                pc = pc + 3 if rnd() < probs[code[pc + 1]] else code[pc + 2]
+            elif op == JMP:
+                pc = code[pc + 1]
+            elif op == ALT:
+                pc = code[pc + 2 + int(rnd() * code[pc + 1])]
+            else:
+                return out
+
+    def sample(self):
+        return bytes(self.run(bytearray()))
+
+    def batch(self, n):
+        # n tokens back to back, and where each of them ends
+        out = bytearray()
+        ends = []
+        for _ in range(n):
+            self.run(out)
+            ends.append(len(out))
+        return out, ends
+
+
+class Sampler(object):
+    # Tokens of a {state: [Regexp]} map: a random state, then one of its
+    # regexps. Every regexp is also a source that can be asked for by its
+    # index in `names` (`{state}/{i}` unless told otherwise).
+
+    def __init__(self, regmap, repeat=DEFAULT_REPEAT, names=None):
+        self.programs = []
+        self.entries = []
+        self.names = []
+        for state, regexps in regmap.items():
+            if not regexps:
+                continue
+            programs = [Program.compile(r, repeat) for r in regexps]
+            self.programs.append(programs)
+            self.entries += programs
+            self.names += names[state] if names else ['{}/{}'.format(state, i) for i in range(len(regexps))]
+
+    @classmethod
+    def from_entries(clazz, entries, repeat=DEFAULT_REPEAT):
+        # [(RS, Regexp)], as given by reflex.re.load_regexps(), with the
+        # regexps named N_M after their files
+        regmap = {}
+        names = {}
+        for rs, r in entries:
+            regmap.setdefault(rs.state, []).append(r)
+            names.setdefault(rs.state, []).append('{}_{}'.format(rs.rule, rs.state))
+        return clazz(regmap, repeat, names)
+
+    def batch(self, n, sources=None):
+        # With `sources`, the i-th token comes from entries[sources[i]]
+        out = bytearray()
+        ends = []
+        if sources is None:
+            choice = random.choice
+            for _ in range(n):
+                choice(choice(self.programs)).run(out)
+                ends.append(len(out))
+        else:
+            for i in sources[:n]:
+                self.entries[i].run(out)
+                ends.append(len(out))
+        return out, ends
+
+    def tokens(self, n, sources=None):
+        out, ends = self.batch(n, sources)
+        out = bytes(out)
+        start = 0
+        ret = []
+        for end in ends:
+            ret.append(out[start:end])
+            start = end
+        return ret
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import random
+
+import numpy as np
+
+
+# Every result makes the older ones count a bit less (half of it after
+# ~7000 results), so that arms that stopped finding anything lose their
+# edge and those that were left behind get another chance
+DECAY = 0.9999
+# Beta draws at most per pick(): past that, picks share draws
+MAX_DRAWS = 1 << 16
+
+
+class Bandit(object):
+    # Thompson sampling: every arm has a Beta(1 + hits, 1 + misses) belief
+    # on how often it finds new coverage; picking one draws from all the
+    # beliefs and takes the best. Also keeps the plain tallies of every arm
+    # (execs, finds, seconds) for the stats.
+
+    def __init__(self, names, decay=DECAY):
+        self.names = list(names)
+        self.decay = decay
+        n = len(self.names)
+        self.hits = np.zeros(n)
+        self.misses = np.zeros(n)
+        self.execs = [0] * n
+        self.finds = [0] * n
+        self.seconds = [0.0] * n
+        # Seeded from `random`, like everything else in the fuzzer
+        self._rng = np.random.default_rng(random.getrandbits(64))
+
+    def __len__(self):
+        return len(self.names)
+
+    def pick(self, n=None):
+        # One arm, or a list of n of them. With many arms, a batch is picked
+        # out of fewer rows of draws than n (the picks are each as likely
+        # as before, they just come in runs).
+        k = 1 if n is None else n
+        rows = min(k, max(1, MAX_DRAWS // len(self.names)))
+        draws = self._rng.beta(1 + self.hits, 1 + self.misses, size=(rows, len(self.names)))
+        picked = draws.argmax(axis=1)
+        if rows < k:
+            picked = picked[self._rng.integers(rows, size=k)]
+        return int(picked[0]) if n is None else picked.tolist()
+
+    def reward(self, arms, hit, seconds=0.0):
+        # The result of one exec that used `arms` (counted once each)
+        self.hits *= self.decay
+        self.misses *= self.decay
+        for i in set(arms):
+            self.execs[i] += 1
+            self.seconds[i] += seconds
+            if hit:
+                self.hits[i] += 1
+                self.finds[i] += 1
+            else:
+                self.misses[i] += 1
+
+    def report(self):
+        weights = (1 + self.hits) / (2 + self.hits + self.misses)
+        return {
+            name: {
+                'execs': self.execs[i],
+                'finds': self.finds[i],
+                'seconds': self.seconds[i],
+                'weight': float(weights[i]),
+            }
+            for i, name in enumerate(self.names)
+        }
@@ -1,97 +1,240 @@
 #!/usr/bin/env python3
 
-import functools
 import json
+import multiprocessing
 import os
 
-import networkx as nx
-import networkx.drawing.nx_agraph
+from collections import namedtuple
 
+import numpy as np
 
-def write_dfa(fp, g, start):
-    if len(g.edges) == 0:
-        print("NO EDGES")
-        return
-
-    with open(fp, 'w') as f:
-        alphabet = set()
-        for _, _, aa in g.edges(data=True):
-            alphabet.update(aa['alphabet'])
-
-        f.write('{}\n'.format(start))
-        f.write('{}\n'.format(len(g.nodes)))
-        for n, data in g.nodes(data=True):
-            f.write('{} {}\n'.format(n, 1 if data['accepts'] >= 1 else 0))
-
-        edges = []
-        for u, v, data in g.edges(data=True):
-            edges.append('{} {} {}'.format(
-                u,
-                v,
-                ' '.join(
-                    str(ord(c)) for c in data['alphabet']
-                )
-            ))
-
-        # print(alphabet)
-        f.write('{}\n'.format(len(edges)))
-        f.write('\n'.join(edges) + '\n')
-
-    with open(fp + '.nfa', 'w') as f:
-        f.write('{}\n'.format(start))
-        f.write('{}\n'.format(len(g.nodes)))
-        for n, data in g.nodes(data=True):
-            f.write('{} {}\n'.format(n, 1 if data['accepts'] >= 1 else 0))
-        f.write('{}\n'.format(len(g.edges)))
-        for u, v, data in g.edges(data=True):
-            f.write('{} {} {}\n'.format(
-                u,
-                v,
-                ' '.join(
-                    str(ord(c)) for c in data['alphabet']
-                )
-            ))
-
-
-def simplify(g_pickle_path, out_path):
-    G = nx.readwrite.gpickle.read_gpickle(g_pickle_path)
-    R = G.reverse(copy=True)
-
-    max_accepts = functools.reduce(lambda x, y: max(x, y[1]['accepts']), G.nodes(data=True), 0) + 1
-    print('max_accepts:', max_accepts)
+from . import dot
+from .dfa import DFA
+from .dfa import format_ranges
+from .dfa import to_ranges
+from .minimize import minimize as minimize_dfa
+from .minimize import quotient
+from .stats import Progress
+from .stats import Stats
+
+
+# .dfa files start with a version line. Version 1 (no version line) lists
+# every byte of an edge, version 2 lists inclusive `lo-hi` byte ranges.
+DFA_FILE_VERSION = 2
+
+# What simplify() can write: one .dot per rule, one .dfa per rule and start
+OUTPUTS = ('dot', 'dfa')
 
-    for out in range(1, max_accepts):
-        out_nodes = set()
-        r = R.copy()
-        for n, data in r.nodes(data=True):
-            if data['accepts'] == out:
-                out_nodes.add(n)
-
-        subnodes = set(out_nodes)
-        # print(subnodes)
-        for n in out_nodes:
-            r2 = nx.descendants(r, n)
-            subnodes.update(r2)
-
-        r2 = G.subgraph(subnodes).copy()
-
-        # print(r2.copy())
-        for n, data in r2.nodes(data=True):
-            accepts = data['accepts']
-            if accepts > 0 and accepts != out:
-                data['accepts'] = 0
-                data['label'] += '/None'
-                del data['shape']
-
-        # Write the simplified graph as dot-file
-        networkx.drawing.nx_agraph.write_dot(r2, os.path.join(out_path, '{}.dot'.format(out)))
-
-        # Dump the DFA for the Haskell part
-        sources = list(n for n, d in r2.in_degree() if d == 0)
-        # assert sources
-        for start in sources:
-            s = nx.descendants(r2, start)
-            s.add(start)
-            s = r2.subgraph(s).copy()
-            write_dfa(os.path.join(out_path, '{}_{}.dfa'.format(out, start)), s, start)
+DfaFile = namedtuple(
+    'DfaFile',
+    [
+        'start',
+        'accepting',
+        'edges',
+    ]
+)
 
+
+def write_dfa(fp, dfa, nodes, start, out, nfa=False):
+    inside = np.zeros(dfa.n_states, dtype=bool)
+    inside[nodes] = True
+    u, v, alphabets = dfa.edge_list(nodes)
+    keep = inside[v]
+    u, v, alphabets = u[keep], v[keep], alphabets[keep]
+
+    if len(u) == 0:
+        print("NO EDGES")
+        return []
+
+    edges = []
+    for a, b, ranges in zip(u.tolist(), v.tolist(), to_ranges(alphabets)):
+        edges.append('{} {} {}'.format(a, b, format_ranges(ranges)))
+
+    paths = [fp, fp + '.nfa'] if nfa else [fp]
+    for path in paths:
+        with open(path, 'w') as f:
+            f.write('reflex-dfa {}\n'.format(DFA_FILE_VERSION))
+            f.write('{}\n'.format(start))
+            f.write('{}\n'.format(len(nodes)))
+            for n in nodes:
+                f.write('{} {}\n'.format(n, 1 if dfa.accepts[n] == out else 0))
+
+            f.write('{}\n'.format(len(edges)))
+            f.write('\n'.join(edges) + '\n')
+    return paths
+
+
+def read_dfa(fp):
+    with open(fp, 'r') as f:
+        lines = f.read().split('\n')
+
+    it = iter(lines)
+    first = next(it).split()
+    if first[0] == 'reflex-dfa':
+        version = int(first[1])
+        start = int(next(it))
+    else:
+        version = 1
+        start = int(first[0])
+    if version not in {1, 2}:
+        raise ValueError('{}: unsupported .dfa version {}'.format(fp, version))
+
+    accepting = {}
+    for _ in range(int(next(it))):
+        n, a = next(it).split()
+        accepting[int(n)] = int(a) > 0
+
+    edges = []
+    for _ in range(int(next(it))):
+        tokens = next(it).split()
+        ranges = []
+        for t in tokens[2:]:
+            if version == 1:
+                ranges.append((int(t), int(t)))
+            else:
+                lo, _, hi = t.partition('-')
+                ranges.append((int(lo), int(hi or lo)))
+        edges.append((int(tokens[0]), int(tokens[1]), ranges))
+
+    return DfaFile(start, accepting, edges)
+
+
+def rule_reachability(dfa):
+    # For every state, a bitset of the accept codes reachable from it (itself
+    # included), computed in one sweep over the SCC condensation.
+    reach = [0] * dfa.n_states
+    for component in dfa.sccs():
+        bits = 0
+        for n in component:
+            bits |= 1 << int(dfa.accepts[n])
+            for m in dfa.successors(n):
+                bits |= reach[m]
+        for n in component:
+            reach[n] = bits
+    return reach
+
+
+def rule_sources(dfa, nodes):
+    # States of the subgraph without incoming edges from the subgraph itself
+    inside = np.zeros(dfa.n_states, dtype=bool)
+    inside[nodes] = True
+    targets = dfa.transitions[nodes].ravel()
+    targets = targets[targets != dfa.none]
+    has_pred = np.zeros(dfa.n_states, dtype=bool)
+    has_pred[targets[inside[targets]]] = True
+    return nodes[~has_pred[nodes]]
+
+
+def write_rule_dot(dfa, out, nodes, out_path):
+    # States accepting other rules are drawn as non-accepting
+    path = os.path.join(out_path, '{}.dot'.format(out))
+    dot.write_dot(path, dfa, nodes, rule=out)
+    return [path]
+
+
+def write_rule_dfa(dfa, out, start, nodes, out_path, nfa):
+    inside = np.zeros(dfa.n_states, dtype=bool)
+    inside[nodes] = True
+    s = dfa.reachable_from(start, inside)
+    return write_dfa(os.path.join(out_path, '{}_{}.dfa'.format(out, start)), dfa, s, start, out, nfa)
+
+
+# Workers open the DFA themselves (it is mmap'd, so they share its pages) and
+# only receive the rule number, the rule's states and the start states to
+# write. Minimized rules come whole, with which state stands for which among
+# the rule's states, so that their quotient is built once.
+_worker_dfa = None
+
+
+def _init_worker(dfa_path):
+    global _worker_dfa
+    _worker_dfa = DFA.load(dfa_path)
+
+
+def run_task(dfa, task):
+    # Returns [(kind, files written, bytes written)]
+    out, subnodes, starts, with_dot, merged, out_path, nfa = task
+    if merged is not None:
+        members, reps = merged
+        rep = np.full(dfa.n_states, -1, dtype=np.int64)
+        rep[members] = reps
+        dfa = quotient(dfa, rep, nodes=subnodes)
+    results = []
+    if with_dot:
+        results.append(('dot', write_rule_dot(dfa, out, subnodes, out_path)))
+    for start in starts:
+        results.append(('dfa', write_rule_dfa(dfa, out, start, subnodes, out_path, nfa)))
+    return [(kind, len(paths), sum(os.path.getsize(p) for p in paths)) for kind, paths in results]
+
+
+def _run_worker_task(task):
+    return run_task(_worker_dfa, task)
+
+
+def simplify(dfa_path, out_path, jobs=1, nfa=False, minimize=False, stats=None, outputs=OUTPUTS):
+    # Returns the Stats of the run (phase timings and counters)
+    stats = Stats() if stats is None else stats
+    with stats.phase('load'):
+        dfa = DFA.load(dfa_path)
+
+    max_accepts = int(dfa.accepts.max()) + 1
+    print('max_accepts:', max_accepts)
+    stats.count('rules', max_accepts - 1)
+
+    with stats.phase('reachability'):
+        reach = rule_reachability(dfa)
+
+    tasks = []
+    with stats.phase('partition'):
+        for out in range(1, max_accepts):
+            subnodes = np.array([n for n, bits in enumerate(reach) if bits >> out & 1], dtype=np.int64)
+
+            # Merge the states that are equivalent as far as this rule goes
+            # (a source may merge with a state that has predecessors, so the
+            # sources are picked before minimizing)
+            sources = rule_sources(dfa, subnodes)
+            merged = None
+            if minimize:
+                before = len(subnodes)
+                rep = minimize_dfa(dfa, subnodes, np.where(dfa.accepts == out, out, 0))
+                merged = (subnodes, rep[subnodes])
+                subnodes = subnodes[rep[subnodes] == subnodes]
+                sources = np.unique(rep[sources])
+                stats.count('states_merged', before - len(subnodes))
+            stats.count('subgraph_states', len(subnodes))
+
+            # The simplified graph as dot-file, and the DFAs for the Haskell
+            # part: one task per start state, or one for the whole rule when
+            # it needs its quotient
+            with_dot = 'dot' in outputs
+            starts = sources.tolist() if 'dfa' in outputs else []
+            if merged is not None:
+                tasks.append((out, subnodes, starts, with_dot, merged, out_path, nfa))
+                continue
+            if with_dot:
+                tasks.append((out, subnodes, [], True, None, out_path, nfa))
+            for start in starts:
+                tasks.append((out, subnodes, [start], False, None, out_path, nfa))
+
+    # The progress is about the subgraphs, the dot files go along
+    subgraphs = sum(len(task[2]) for task in tasks)
+    stats.count('subgraphs', subgraphs)
+    progress = Progress('subgraphs', subgraphs)
+
+    def done(results):
+        for kind, files, size in results:
+            stats.count('{}_files'.format(kind), files)
+            stats.count('bytes_written', size)
+            if kind == 'dfa':
+                progress.update()
+
+    with stats.phase('write'):
+        if jobs <= 1:
+            for task in tasks:
+                done(run_task(dfa, task))
+        else:
+            with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(dfa_path,)) as pool:
+                for result in pool.imap(_run_worker_task, tasks, chunksize=16):
+                    done(result)
+
+    return stats
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Stats(object):
+    # Wall time of every phase and a bag of counters for one run
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] += int(n)
+
+    def wrote(self, path):
+        self.count('bytes_written', os.path.getsize(path))
+
+    def merge(self, other):
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for name, n in other.counters.items():
+            self.counters[name] += n
+
+    def report(self):
+        return {
+            'seconds': sum(self.phases.values()),
+            'phases': dict(self.phases),
+            'counters': dict(self.counters),
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+
+class Progress(object):
+    # `label: done/total`, printed at most once every `interval` seconds
+    # (and once at the end) instead of once per item
+
+    def __init__(self, label, total, interval=1.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self._last = time.monotonic()
+
+    def update(self, n=1):
+        self.done += n
+        now = time.monotonic()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            print('{}: {}/{}'.format(self.label, self.done, self.total))
+
+
+# How often afl-fuzz rewrites fuzzer_stats and adds to plot_data
+STATS_INTERVAL = 60.0
+PLOT_INTERVAL = 5.0
+
+AFL_VERSION = 'reflex'
+PLOT_HEADER = ('# unix_time, cycles_done, cur_path, paths_total, pending_total, pending_favs, '
+               'map_size, unique_crashes, unique_hangs, max_depth, execs_per_sec\n')
+
+
+class AflStats(object):
+    # The fuzzer_stats and plot_data of an instance dir, in afl-fuzz's format
+    # so that afl-whatsup and afl-plot work on reflex instances too. The
+    # fields AFL has and reflex does not (favored and pending paths, depth,
+    # current path) are written as 0, and so is cycles_done: old tests are
+    # picked at random, there are no passes over the queue to count.
+
+    def __init__(self, directory, banner, command_line, stats_interval=STATS_INTERVAL,
+                 plot_interval=PLOT_INTERVAL):
+        self.stats_path = os.path.join(directory, 'fuzzer_stats')
+        self.plot_path = os.path.join(directory, 'plot_data')
+        self.banner = banner
+        self.command_line = command_line
+        self.stats_interval = stats_interval
+        self.plot_interval = plot_interval
+        self.start = time.time()
+        self.execs = 0
+        self.found = 0
+        self.imported = 0
+        self.crashes = 0
+        self.hangs = 0
+        self.last_path = 0
+        self.last_crash = 0
+        self.last_hang = 0
+        self._last_stats = self._last_plot = time.monotonic()
+        # Appended to across resumes, like afl-fuzz does
+        if not os.path.exists(self.plot_path):
+            with open(self.plot_path, 'w') as f:
+                f.write(PLOT_HEADER)
+
+    def path(self, imported=False):
+        if imported:
+            self.imported += 1
+        else:
+            self.found += 1
+        self.last_path = int(time.time())
+
+    def crash(self):
+        self.crashes += 1
+        self.last_crash = int(time.time())
+
+    def hang(self):
+        self.hangs += 1
+        self.last_hang = int(time.time())
+
+    def execs_per_sec(self):
+        return self.execs / max(time.time() - self.start, 1e-6)
+
+    def update(self, paths_total, coverage, force=False):
+        # Writes whatever is due; returns whether fuzzer_stats was.
+        # `coverage()` is the fraction of the map covered, only asked for
+        # when there is something to write.
+        now = time.monotonic()
+        plot = force or now - self._last_plot >= self.plot_interval
+        stats = force or now - self._last_stats >= self.stats_interval
+        if not (plot or stats):
+            return False
+        cvg = coverage()
+        if plot:
+            self._last_plot = now
+            self.write_plot(paths_total, cvg)
+        if stats:
+            self._last_stats = now
+            self.write_stats(paths_total, cvg)
+        return stats
+
+    def write_plot(self, paths_total, coverage):
+        with open(self.plot_path, 'a') as f:
+            f.write('{}, 0, 0, {}, 0, 0, {:.2f}%, {}, {}, 0, {:.2f}\n'.format(
+                int(time.time()), paths_total, coverage * 100, self.crashes, self.hangs,
+                self.execs_per_sec()))
+
+    def write_stats(self, paths_total, coverage):
+        fields = [
+            ('start_time', int(self.start)),
+            ('last_update', int(time.time())),
+            ('fuzzer_pid', os.getpid()),
+            ('cycles_done', 0),
+            ('execs_done', self.execs),
+            ('execs_per_sec', '{:.2f}'.format(self.execs_per_sec())),
+            ('paths_total', paths_total),
+            ('paths_favored', 0),
+            ('paths_found', self.found),
+            ('paths_imported', self.imported),
+            ('max_depth', 0),
+            ('cur_path', 0),
+            ('pending_favs', 0),
+            ('pending_total', 0),
+            ('bitmap_cvg', '{:.2f}%'.format(coverage * 100)),
+            ('unique_crashes', self.crashes),
+            ('unique_hangs', self.hangs),
+            ('last_path', self.last_path),
+            ('last_crash', self.last_crash),
+            ('last_hang', self.last_hang),
+            ('afl_banner', self.banner),
+            ('afl_version', AFL_VERSION),
+            ('target_mode', 'default'),
+            ('command_line', self.command_line),
+        ]
+        # Readers may look at it any time: never half written
+        tmp = self.stats_path + '.tmp'
+        with open(tmp, 'w') as f:
+            for name, value in fields:
+                f.write('{:<18}: {}\n'.format(name, value))
+        os.replace(tmp, self.stats_path)
+
+
+def read_fuzzer_stats(path):
+    ret = {}
+    with open(path, 'r') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            ret[name.strip()] = value.strip()
+    return ret
+
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+@contextmanager
+def profiled(kind, path):
+    # Runs the body under cProfile (pstats dump at `path`) or pyinstrument
+    # (text report at `path`); kind None runs it as is
+    if kind is None:
+        yield
+        return
+
+    if kind == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    elif kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ValueError('profiling with pyinstrument needs pyinstrument installed')
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, 'w') as f:
+                f.write(profiler.output_text())
+    else:
+        raise ValueError('unknown profiler {}'.format(kind))
+
+
+def profile_path(kind, directory):
+    return os.path.join(directory, 'profile.pstats' if kind == 'cprofile' else 'profile.txt')
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+import random
+import struct
+
+from collections import namedtuple
+
+import numpy as np
+
+from .reflex import SIZE_TO_FORMAT
+from .reflex import TABLES
+from .reflex import Config
+from .reflex import SizedOffset
+
+
+# Random DFAs compressed into flex-style tables, for tests and benchmarks.
+# States are numbered like flex does: 1 is the start state, the jam state is
+# max_state - 1 and the templates live right after it.
+Lexer = namedtuple(
+    'Lexer',
+    [
+        'max_state',
+        'tables',
+        # max_state x (n_classes + 1) array of what decompress() must return
+        'transitions',
+    ]
+)
+
+
+def sizes(lexer):
+    # The narrowest widths flex would pick for the tables: bytes for yy_ec
+    # and yy_meta, shorts or ints for the rest
+    ret = {}
+    for name in TABLES:
+        m = max(lexer.tables[name])
+        if name in ('yy_ec', 'yy_meta') and m < 0x100:
+            ret[name] = 1
+        else:
+            ret[name] = 2 if m < 0x8000 else 4
+    return ret
+
+
+class _Packer(object):
+    # First-fit packing of sparse rows into yy_chk/yy_nxt
+
+    WINDOW = 4096
+
+    def __init__(self):
+        self.chk = np.zeros(self.WINDOW, dtype=np.int64)
+        self.nxt = np.zeros(self.WINDOW, dtype=np.int64)
+        self.used = np.zeros(self.WINDOW, dtype=bool)
+        self.end = 0
+        # Everything below `low` is taken
+        self.low = 0
+
+    def _grow(self, n):
+        if n > len(self.used):
+            n = max(n, 2 * len(self.used))
+            for name in ('chk', 'nxt', 'used'):
+                a = getattr(self, name)
+                setattr(self, name, np.concatenate([a, np.zeros(n - len(a), dtype=a.dtype)]))
+
+    def place(self, owner, entries):
+        cols = np.array([c for c, _ in entries], dtype=np.int64)
+        start = max(0, self.low - int(cols.min())) if len(cols) else 0
+        while True:
+            self._grow(start + int(cols.max(initial=0)) + 2 * self.WINDOW)
+            free = np.ones(self.WINDOW, dtype=bool)
+            for c in cols:
+                free &= ~self.used[start + c:start + c + self.WINDOW]
+            hits = np.flatnonzero(free)
+            if len(hits):
+                b = start + int(hits[0])
+                break
+            start += self.WINDOW
+        where = b + cols
+        self.chk[where] = owner
+        self.nxt[where] = [v for _, v in entries]
+        self.used[where] = True
+        self.end = max(self.end, b + int(cols.max(initial=0)) + 1)
+        while self.used[self.low]:
+            self.low += 1
+        return b
+
+
+def make_lexer(n_states, n_classes=16, n_rules=10, n_meta=4, n_templates=2, seed=0, block=None):
+    # With `block`, rules are local like in real lexers: states 2.. come in
+    # blocks of that many states, all accepting the same rule, whose edges
+    # stay inside the block. The start state leads into the blocks and the
+    # templates only to the jam state. Without it, any state may lead
+    # anywhere (and reach nearly every rule).
+    assert 1 <= n_classes <= 255 and 1 <= n_meta <= n_classes
+    rnd = random.Random(seed)
+    jam = n_states + 1
+    max_state = n_states + 2
+
+    def first(s):
+        # The first state s can lead to, and the first one after its block
+        if block is None or s == 1:
+            return 1, n_states + 1
+        lo = 2 + (s - 2) // block * block
+        return lo, min(lo + block, n_states + 1)
+
+    ec = [0] * 256
+    for c in range(1, n_classes + 1):
+        ec[c] = c
+    for b in range(n_classes + 1, 256):
+        ec[b] = rnd.randint(1, n_classes)
+    meta = [0] + [rnd.randint(1, n_meta) for _ in range(n_classes)]
+    templates = [[0] + [jam if block else rnd.choice([jam, rnd.randint(1, n_states)]) for _ in range(n_meta)]
+                 for _ in range(n_templates)]
+
+    # Every state defaults to the jam state, a template or an earlier state
+    # and overrides a few classes of it
+    dense = np.full((max_state, n_classes + 1), -1, dtype=np.int64)
+    dense[jam, 1:] = jam
+    defaults = [0] * max_state
+    for s in range(1, n_states + 1):
+        lo, hi = first(s)
+        kind = rnd.random()
+        if kind < 0.3 and n_templates:
+            t = rnd.randrange(n_templates)
+            dense[s, 1:] = [templates[t][meta[c]] for c in range(1, n_classes + 1)]
+            defaults[s] = max_state + t
+        elif kind < 0.6 and s > lo:
+            defaults[s] = rnd.randint(lo, s - 1)
+            dense[s] = dense[defaults[s]]
+        else:
+            dense[s, 1:] = jam
+            defaults[s] = jam
+        for _ in range(rnd.randint(0, 4)):
+            # (nothing leads back to the start state of a blocked lexer)
+            dense[s, rnd.randint(1, n_classes)] = rnd.randint(2 if block and s == 1 else lo, hi - 1)
+    # ... and can be reached from an earlier one
+    for s in range(2, n_states + 1):
+        lo, _ = first(s)
+        dense[rnd.randint(lo, s - 1) if s > lo else 1, rnd.randint(1, n_classes)] = s
+
+    size = max_state + n_templates
+    base = [0] * size
+    deff = [0] * size
+    packer = _Packer()
+    base[jam] = packer.place(jam, [(c, jam) for c in range(1, n_classes + 1)])
+    for t, row in enumerate(templates):
+        base[max_state + t] = packer.place(max_state + t, list(enumerate(row))[1:])
+    for s in range(1, n_states + 1):
+        d = defaults[s]
+        deff[s] = d
+        if d >= max_state:
+            ref = [0] + [templates[d - max_state][meta[c]] for c in range(1, n_classes + 1)]
+        else:
+            ref = dense[d].tolist()
+        row = dense[s].tolist()
+        base[s] = packer.place(s, [(c, row[c]) for c in range(1, n_classes + 1) if row[c] != ref[c]])
+    # Lookups of any state never run past the end of the tables
+    end = max(packer.end, max(base) + n_classes + 1)
+    packer._grow(end)
+    chk = packer.chk[:end].tolist()
+    nxt = packer.nxt[:end].tolist()
+
+    # Dead ends must accept (flex would not have generated them otherwise)
+    accept = [0] * max_state
+    rules = {}
+    for s in range(2, n_states + 1):
+        if (dense[s, 1:] == jam).all() or rnd.random() < 0.3:
+            rule = rnd.randint(1, n_rules)
+            accept[s] = rules.setdefault(first(s)[0], rule) if block else rule
+
+    tables = {
+        'yy_accept': accept,
+        'yy_base': base,
+        'yy_chk': chk,
+        'yy_def': deff,
+        'yy_ec': ec,
+        'yy_meta': meta,
+        'yy_nxt': nxt,
+    }
+    return Lexer(max_state, tables, dense)
+
+
+def write_blob(path, lexer, widths=None, endianness='little', junk=64, seed=None):
+    # Returns {table: (offset, size)}. With a seed, the junk around and
+    # between the tables is random instead of 0xcc.
+    widths = sizes(lexer) if widths is None else widths
+    rnd = random.Random(seed) if seed is not None else None
+    fmt = '<' if endianness == 'little' else '>'
+
+    def fill(n):
+        if rnd is None:
+            return b'\xcc' * n
+        return bytes(rnd.getrandbits(8) for _ in range(n))
+
+    blob = bytearray(fill(junk))
+    layout = {}
+    for name in TABLES:
+        values = lexer.tables[name]
+        size = widths[name]
+        if max(values) >= 1 << (8 * size):
+            raise ValueError('{} does not fit in {} bytes'.format(name, size))
+        blob += b'\0' * (-len(blob) % size)
+        if rnd is not None and rnd.random() < 0.5:
+            blob += fill(rnd.randrange(0, 64, 4))
+        layout[name] = (len(blob), size)
+        blob += struct.pack(fmt + SIZE_TO_FORMAT[size] * len(values), *values)
+    blob += fill(junk)
+
+    with open(path, 'wb') as f:
+        f.write(blob)
+    return layout
+
+
+def to_config(path, out_path, lexer, layout, endianness='little', **kwargs):
+    tables = [SizedOffset(*layout[name]) for name in TABLES]
+    return Config(path, out_path, lexer.max_state, True, set(), endianness, *tables, **kwargs)
+
+
+def make_regexp(n_nodes, seed=0):
+    # A random regexp of about n_nodes nodes, in the JSON layout read by
+    # reflex.re.Regexp.from_json
+    rnd = random.Random(seed)
+
+    def leaf():
+        if rnd.random() < 0.5:
+            return {'tag': 'Literal', 'contents': rnd.randrange(256)}
+        return {'tag': 'RESet', 'contents': sorted(rnd.sample(range(256), rnd.randint(2, 16)))}
+
+    # Balanced, and the repetitions only wrap leaves so that solving it
+    # does not blow up
+    def gen(n):
+        if n <= 1:
+            return leaf()
+        if n == 2:
+            return {'tag': rnd.choice(('Star', 'OneOrMore', 'Optional')), 'contents': leaf()}
+        left = rnd.randint(max(1, n // 4), max(1, 3 * n // 4))
+        tag = 'Then' if rnd.random() < 0.7 else 'Or'
+        return {'tag': tag, 'contents': [gen(left), gen(max(1, n - 1 - left))]}
+
+    return gen(n_nodes)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+import collections
+import glob
+import heapq
+import os
+import random
+
+import numpy as np
+
+from .dfa import DFA
+from .re import RS
+from .re import parse_file_name
+from .simplify import read_dfa
+from .simplify import rule_reachability
+from .simplify import rule_sources
+
+
+# Tokens straight out of the DFAs, without going through regexps: the
+# shortest ones, the k shortest ones and random ones (uniform among the
+# tokens of a random length).
+MAX_LEN = 32
+POOL_SIZE = 256
+
+
+def _edges(dfa, nodes):
+    # [(u, v, bytes)] of the edges leaving `nodes`
+    u, v, alphabets = dfa.edge_list(nodes)
+    tables = [np.flatnonzero(a).astype(np.uint8).tobytes() for a in alphabets]
+    return list(zip(u.tolist(), v.tolist(), tables))
+
+
+class Graph(object):
+    # The states of a rule that can reach one of its accepting states,
+    # numbered 0..n-1 (`index` maps the original state numbers):
+    #  - edges: for every state, its edges as (target, bytes)
+    #  - dist: for every state, the length of its shortest way out
+    # Shared by the automata of the rule from all its start states.
+    __slots__ = (
+        'index',
+        'accepting',
+        'edges',
+        'dist',
+        '_counts',
+    )
+
+    def __init__(self, index, accepting, edges, dist):
+        self.index = index
+        self.accepting = accepting
+        self.edges = edges
+        self.dist = dist
+        self._counts = None
+
+    @classmethod
+    def build(clazz, accepting, edges):
+        # `edges` is [(u, v, bytes)] over any state labels, `accepting` a set
+        # of them
+        succ = collections.defaultdict(list)
+        pred = collections.defaultdict(list)
+        for u, v, table in edges:
+            if table:
+                succ[u].append((v, table))
+                pred[v].append(u)
+
+        # From the accepting states backwards
+        dist = {s: 0 for s in accepting}
+        frontier = list(dist)
+        while frontier:
+            nxt = []
+            for v in frontier:
+                for u in pred[v]:
+                    if u not in dist:
+                        dist[u] = dist[v] + 1
+                        nxt.append(u)
+            frontier = nxt
+
+        states = sorted(dist, key=lambda s: (dist[s], s))
+        index = {s: i for i, s in enumerate(states)}
+        return clazz(
+            index,
+            [s in accepting for s in states],
+            [[(index[v], table) for v, table in succ[s] if v in index] for s in states],
+            [dist[s] for s in states],
+        )
+
+    def counts(self, max_len):
+        # counts[l][s]: how many accepted strings of length l there are from
+        # s. Lists of floats: they grow like 256 ** l.
+        if self._counts is None or len(self._counts) <= max_len:
+            u = np.array([s for s, edges in enumerate(self.edges) for _ in edges], dtype=np.int64)
+            v = np.array([t for edges in self.edges for t, _ in edges], dtype=np.int64)
+            w = np.array([len(table) for edges in self.edges for _, table in edges], dtype=np.float64)
+            counts = [np.array(self.accepting, dtype=np.float64)]
+            for _ in range(max_len):
+                counts.append(np.bincount(u, weights=w * counts[-1][v], minlength=len(self.edges)))
+            self._counts = [c.tolist() for c in counts]
+        return self._counts
+
+
+class Automaton(object):
+    # A rule from one of its start states
+    __slots__ = (
+        'graph',
+        'start',
+    )
+
+    def __init__(self, graph, start):
+        self.graph = graph
+        self.start = start
+
+    @classmethod
+    def build(clazz, start, accepting, edges):
+        # None when nothing is accepted from `start`
+        graph = Graph.build(accepting, edges)
+        if start not in graph.index:
+            return None
+        return clazz(graph, graph.index[start])
+
+    @classmethod
+    def from_file(clazz, dfa_file):
+        # A DfaFile, as read by simplify.read_dfa()
+        edges = [(u, v, bytes(b for lo, hi in ranges for b in range(lo, hi + 1))) for u, v, ranges in dfa_file.edges]
+        accepting = {s for s, a in dfa_file.accepting.items() if a}
+        return clazz.build(dfa_file.start, accepting, edges)
+
+    @classmethod
+    def from_dfa(clazz, dfa, start, rule, within=None):
+        # The part of an in-memory DFA that `rule` can be matched through
+        # from `start`, like the N_M.dfa files of simplify
+        nodes = dfa.reachable_from(start, within)
+        accepting = set(nodes[dfa.accepts[nodes] == rule].tolist())
+        return clazz.build(start, accepting, _edges(dfa, nodes))
+
+
+def k_shortest(automaton, k, bytes_per_edge=1):
+    # The k shortest non-empty accepted strings, shortest first. Only the
+    # first `bytes_per_edge` bytes of every edge are tried (all of them with
+    # None), so that the k strings take k different paths by default.
+    #
+    # Breadth first, keeping at most as many prefixes as strings still
+    # needed: every prefix leads to at least one string, and those ending
+    # the soonest (by `dist`) are the ones worth keeping.
+    g = automaton.graph
+    ret = []
+    frontier = [(automaton.start, b'')]
+    while frontier and len(ret) < k:
+        ret += sorted(p for s, p in frontier if p and g.accepting[s])[:k - len(ret)]
+        need = k - len(ret)
+        candidates = []
+        for s, p in frontier:
+            for v, table in g.edges[s]:
+                for b in table[:bytes_per_edge]:
+                    candidates.append((g.dist[v], p + bytes((b,)), v))
+        frontier = [(v, p) for _, p, v in heapq.nsmallest(need, candidates)]
+    return ret
+
+
+def shortest(automaton):
+    ret = k_shortest(automaton, 1)
+    return ret[0] if ret else None
+
+
+def sample(automaton, max_len=MAX_LEN):
+    # A random non-empty accepted string: a random length among those with
+    # any string up to max_len, then a walk picking every edge by how many
+    # strings of that length go through it
+    g = automaton.graph
+    s = automaton.start
+    counts = g.counts(max_len)
+    lengths = [n for n in range(1, max_len + 1) if counts[n][s] > 0]
+    if not lengths:
+        return None
+    out = bytearray()
+    rnd = random.random
+    for left in range(random.choice(lengths), 0, -1):
+        edges = g.edges[s]
+        c = counts[left - 1]
+        weights = [len(table) * c[v] for v, table in edges]
+        x = rnd() * sum(weights)
+        for (v, table), w in zip(edges, weights):
+            # Never into a state without strings of the length left
+            if w:
+                picked = v, table
+                if x < w:
+                    break
+            x -= w
+        v, table = picked
+        out.append(table[int(rnd() * len(table))])
+        s = v
+    return bytes(out)
+
+
+def rule_automata(dfa):
+    # {RS(rule, start): Automaton}, split like simplify splits the DFA into
+    # .dfa files
+    reach = rule_reachability(dfa)
+    edges = _edges(dfa, np.arange(dfa.n_states))
+    u = np.array([e[0] for e in edges], dtype=np.int64)
+    v = np.array([e[1] for e in edges], dtype=np.int64)
+    ret = {}
+    for rule in range(1, int(dfa.accepts.max()) + 1):
+        nodes = np.array([n for n, bits in enumerate(reach) if bits >> rule & 1], dtype=np.int64)
+        inside = np.zeros(dfa.n_states, dtype=bool)
+        inside[nodes] = True
+        keep = np.flatnonzero(inside[u] & inside[v]).tolist()
+        accepting = set(nodes[dfa.accepts[nodes] == rule].tolist())
+        graph = Graph.build(accepting, [edges[i] for i in keep])
+        for start in rule_sources(dfa, nodes).tolist():
+            if start in graph.index:
+                ret[RS(rule, start)] = Automaton(graph, graph.index[start])
+    return ret
+
+
+def load_automata(path):
+    # Out of a G.rdfa or of a directory of N_M.dfa files
+    if os.path.isfile(path):
+        return rule_automata(DFA.load(path))
+    ret = {}
+    for fn in glob.glob(os.path.join(path, '*.dfa')):
+        a = Automaton.from_file(read_dfa(fn))
+        if a is not None:
+            ret[parse_file_name(fn)] = a
+    return ret
+
+
+class TokenPool(object):
+    # Up to `size` distinct tokens per rule, drawn like reflex.sampler does:
+    # a random start state, then one of its rules. A pool starts with the
+    # rule's shortest tokens and fills up with samples as it is drawn from;
+    # once full, a draw replaces a random token with a new sample now and
+    # then (`refresh` of the times). Every rule is also a source that can
+    # be asked for by its index in `names` (N_M, like the .dfa files).
+
+    def __init__(self, automata, size=POOL_SIZE, shortest=8, refresh=0.05, max_len=MAX_LEN):
+        self.automata = automata
+        self.size = size
+        self.shortest = shortest
+        self.refresh = refresh
+        self.max_len = max_len
+        states = collections.defaultdict(list)
+        # Rules matching nothing but the empty string have nothing to give
+        for rs in sorted(rs for rs, a in automata.items() if a.graph.edges[a.start]):
+            states[rs.state].append(rs)
+        self.rules = list(states.values())
+        self.entries = [rs for rules in self.rules for rs in rules]
+        self.names = ['{}_{}'.format(rs.rule, rs.state) for rs in self.entries]
+        self.pools = {}
+
+    def pool(self, rs):
+        if rs not in self.pools:
+            # At least one, for the rules with no token up to max_len
+            tokens = k_shortest(self.automata[rs], max(1, min(self.shortest, self.size)))
+            self.pools[rs] = (tokens, set(tokens))
+        return self.pools[rs]
+
+    def draw(self, rs):
+        tokens, seen = self.pool(rs)
+        full = len(tokens) >= self.size
+        if full and random.random() >= self.refresh:
+            return tokens[int(random.random() * len(tokens))]
+        t = sample(self.automata[rs], self.max_len)
+        if t is None:
+            # Nothing that short: the shortest tokens will have to do
+            return tokens[int(random.random() * len(tokens))]
+        if t not in seen:
+            if full:
+                i = int(random.random() * len(tokens))
+                seen.discard(tokens[i])
+                tokens[i] = t
+            else:
+                tokens.append(t)
+            seen.add(t)
+        return t
+
+    def tokens(self, n, sources=None):
+        if sources is not None:
+            return [self.draw(self.entries[i]) for i in sources[:n]]
+        choice = random.choice
+        return [self.draw(choice(choice(self.rules))) for _ in range(n)]
+
+
+def _escape(token):
+    ret = []
+    for b in token:
+        if b in b'"\\' or not 0x20 <= b < 0x7f:
+            ret.append('\\x{:02x}'.format(b))
+        else:
+            ret.append(chr(b))
+    return ''.join(ret)
+
+
+def write_dictionary(path, tokens):
+    # [(name, token)] as an AFL dictionary (afl-fuzz -x)
+    with open(path, 'w') as f:
+        for name, token in tokens:
+            f.write('{}="{}"\n'.format(name, _escape(token)))
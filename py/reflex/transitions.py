@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from .dfa import read_arrays
+from .dfa import write_arrays
+
+
+TRANSITIONS_MAGIC = b'RFLXTRAN'
+TRANSITIONS_VERSION = 1
+
+
+class Transitions(object):
+    # Dense (state, byte) -> (next state, accept code of the next state)
+    # lookups, straight out of an mmap'd file:
+    #  - next: n_states x 256 matrix of next states (`none` = no transition)
+    #  - accepts: accept code of every state (0 = not accepting)
+    __slots__ = (
+        'next',
+        'accepts',
+    )
+
+    def __init__(self, next, accepts):
+        self.next = next
+        self.accepts = accepts
+
+    @classmethod
+    def from_dfa(clazz, dfa):
+        # Class of every byte, or an extra all-`none` column for the bytes
+        # that belong to no class
+        owned = dfa.classes.any(axis=0)
+        clazz_of = np.where(owned, dfa.classes.argmax(axis=0), dfa.n_classes)
+        padded = np.full((dfa.n_states, dfa.n_classes + 1), dfa.none, dtype=dfa.transitions.dtype)
+        padded[:, :-1] = dfa.transitions
+        return clazz(padded[:, clazz_of], dfa.accepts)
+
+    def save(self, path):
+        write_arrays(path, TRANSITIONS_MAGIC, TRANSITIONS_VERSION, {
+            'next': self.next,
+            'accepts': self.accepts,
+        })
+
+    @classmethod
+    def load(clazz, path):
+        arrays = read_arrays(path, TRANSITIONS_MAGIC, TRANSITIONS_VERSION)
+        return clazz(arrays['next'], arrays['accepts'])
+
+    @property
+    def none(self):
+        return np.iinfo(self.next.dtype).max
+
+    @property
+    def n_states(self):
+        return self.next.shape[0]
+
+    def step(self, state, byte):
+        # (next state, accept code) or None if there is no transition
+        v = int(self.next[state, byte])
+        if v == self.none:
+            return None
+        return v, int(self.accepts[v])
+
+    def lookup(self, states, data):
+        # Vectorized step() over arrays of states and bytes (broadcast against
+        # each other). Missing transitions give `none` and accept code 0.
+        v = self.next[states, data]
+        missing = v == self.none
+        accepts = self.accepts[np.where(missing, 0, v)]
+        return v, np.where(missing, 0, accepts)
+
+    def walk(self, data, state=1):
+        # The states visited while reading `data` from `state`, stopping at the
+        # first missing transition
+        visited = []
+        for b in bytes(data):
+            state = int(self.next[state, b])
+            if state == self.none:
+                break
+            visited.append(state)
+        return visited
+
+    def longest_match(self, data, state=1):
+        # (length, accept code) of the longest accepted prefix of `data`, like
+        # yylex() would find it, or (0, 0)
+        ret = (0, 0)
+        for i, s in enumerate(self.walk(data, state)):
+            if self.accepts[s]:
+                ret = (i + 1, int(self.accepts[s]))
+        return ret
@@ -4,14 +4,28 @@ import argparse
 import os
 
 import reflex.simplify
+import reflex.stats
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('graph', metavar='graph.gpickle', type=str, nargs=1)
+    parser.add_argument('graph', metavar='G.rdfa', type=str, nargs=1)
     parser.add_argument('out_path', metavar="out-path", type=str, nargs=1)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--nfa', action='store_true', help='also write a .dfa.nfa copy of every .dfa')
+    parser.add_argument('--minimize', action='store_true', help='minimize every rule subgraph')
+    parser.add_argument('--report', metavar='report.json', type=str, help='write phase timings and counters')
+    parser.add_argument('--profile', type=str, choices=reflex.stats.PROFILERS,
+                        help='profile the run into out-path/profile.*')
+    parser.add_argument('--outputs', metavar='a,b', type=str, default=','.join(reflex.simplify.OUTPUTS),
+                        help='what to write, among {} (default: all)'.format(', '.join(reflex.simplify.OUTPUTS)))
     args = parser.parse_args()
 
+    selected = tuple(n for n in args.outputs.split(',') if n)
+    unknown = set(selected) - set(reflex.simplify.OUTPUTS)
+    if unknown:
+        parser.error('--outputs: unknown {}'.format(', '.join(sorted(unknown))))
+
     graph = args.graph[0]
     graph = os.path.abspath(graph)
 
@@ -19,7 +33,10 @@ def main():
     out_path = os.path.abspath(out_path)
     os.makedirs(out_path, exist_ok=True)
 
-    reflex.simplify.simplify(graph, out_path)
+    with reflex.stats.profiled(args.profile, reflex.stats.profile_path(args.profile, out_path)):
+        stats = reflex.simplify.simplify(graph, out_path, args.jobs, args.nfa, args.minimize, outputs=selected)
+    if args.report:
+        stats.dump(args.report)
 
 
 if __name__ == '__main__':
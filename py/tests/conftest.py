@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from reflex.dfa import DFA
+
+
+def _make_dfa(alphabets, edges, accepts):
+    # Class c + 1 matches the bytes of alphabets[c] (class 0 matches none),
+    # `edges` are (state, class, next state) and `accepts` has the accept
+    # code of every state
+    classes = np.zeros((len(alphabets) + 1, 256), dtype=bool)
+    for c, alphabet in enumerate(alphabets, 1):
+        classes[c, list(alphabet)] = True
+    table = np.full((len(accepts), len(alphabets) + 1), -1)
+    for u, c, v in edges:
+        table[u, c] = v
+    return DFA.from_table(table, accepts, classes)
+
+
+@pytest.fixture
+def make_dfa():
+    return _make_dfa
+
+
+@pytest.fixture
+def ident_dfa():
+    # 1 -[a-z]-> 2 -[0-9]-> 3, 2 -[a-z]-> 2; 2 and 3 accept
+    return _make_dfa(
+        [range(ord('a'), ord('z') + 1), range(ord('0'), ord('9') + 1)],
+        [(1, 1, 2), (2, 1, 2), (2, 2, 3)],
+        [0, 0, 1, 2],
+    )
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Stand-in for an instrumented target: speaks the AFL forkserver protocol on
+# fds 198/199 and, for the testcase in argv[1], bumps one map entry per
+# prefix of the input. Crashes on inputs starting with b'crash' and hangs on
+# inputs starting with b'hang'.
+
+import ctypes
+import os
+import struct
+import sys
+import time
+import zlib
+
+
+def main():
+    libc = ctypes.CDLL(None)
+    libc.shmat.argtypes = (ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+    libc.shmat.restype = ctypes.c_void_p
+    size = 1 << 16
+    cov = (ctypes.c_uint8 * size).from_address(libc.shmat(int(os.environ['__AFL_SHM_ID']), None, 0))
+
+    os.write(199, struct.pack('I', 0))
+    while len(os.read(198, 4)) == 4:
+        pid = os.fork()
+        if pid == 0:
+            with open(sys.argv[1], 'rb') as f:
+                data = f.read()
+            for i in range(len(data)):
+                cov[zlib.crc32(data[:i + 1]) % size] += 1
+            if data.startswith(b'crash'):
+                os.kill(os.getpid(), 11)
+            if data.startswith(b'hang'):
+                time.sleep(60)
+            os._exit(len(data) % 7)
+        os.write(199, struct.pack('I', pid))
+        _, status = os.waitpid(pid, 0)
+        os.write(199, struct.pack('I', status))
+
+
+if __name__ == '__main__':
+    main()
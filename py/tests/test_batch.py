@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from reflex import batch
+from reflex.reflex import SizedOffset
+
+
+TABLES = {
+    'accept': ['0x100', 2],
+    'base': ['0x200', 2],
+    'chk': ['0x300', 2, 64],
+    'def': [1024, 2],
+    'ec': ['0x500', 1],
+    'meta': ['0x600', 1],
+    'nxt': ['0x700', 2],
+}
+
+
+def test_load_json(tmp_path):
+    path = tmp_path / 'm.json'
+    path.write_text(json.dumps({
+        'defaults': {'endianness': 'big'},
+        'lexers': [
+            {'target': 'a.bin', 'out': 'out/a', 'max_state': '0x10', 'tables': TABLES},
+            {'target': 'a.bin', 'out': 'out/b', 'max_state': 7, 'tables': TABLES, 'endianness': 'little',
+             'outputs': 'rdfa,exits'},
+        ],
+    }))
+
+    a, b = batch.load_manifest(str(path))
+    assert a.target == str(tmp_path / 'a.bin')
+    assert a.out_path == str(tmp_path / 'out' / 'a')
+    assert a.max_state == 16
+    assert a.endianness == 'big'
+    assert b.endianness == 'little'
+    assert a.yy_chk == SizedOffset(0x300, 2, 64)
+    assert a.yy_def == SizedOffset(1024, 2)
+    assert a.decompress == 'vector' and a.strip_nulls
+    assert a.outputs is None and b.outputs == ('rdfa', 'exits')
+
+
+def test_load_toml(tmp_path):
+    pytest.importorskip('tomllib')
+    path = tmp_path / 'm.toml'
+    tables = ''.join('{} = {}\n'.format(k, json.dumps(v)) for k, v in TABLES.items())
+    path.write_text('[[lexers]]\ntarget = "/x.bin"\nout = "o"\nmax_state = 9\nminimize = true\n'
+                    '[lexers.tables]\n' + tables)
+
+    c, = batch.load_manifest(str(path))
+    assert c.target == '/x.bin'
+    assert c.minimize
+    assert c.yy_ec == SizedOffset(0x500, 1)
+
+
+def test_load_errors(tmp_path):
+    path = tmp_path / 'm.json'
+    lexer = {'target': 'a', 'out': 'o', 'max_state': 3, 'tables': TABLES}
+
+    path.write_text(json.dumps({'lexers': [dict(lexer, max_states=4)]}))
+    with pytest.raises(ValueError, match='unknown keys max_states'):
+        batch.load_manifest(str(path))
+
+    path.write_text(json.dumps({'lexers': [dict(lexer, tables=dict(TABLES, nxt=[1]))]}))
+    with pytest.raises(ValueError, match='nxt expects'):
+        batch.load_manifest(str(path))
+
+    path.write_text(json.dumps({'lexers': [dict(lexer, outputs=['dot', 'pdf'])]}))
+    with pytest.raises(ValueError, match='unknown outputs pdf'):
+        batch.load_manifest(str(path))
+
+    path.write_text(json.dumps({'lexers': [lexer, lexer]}))
+    with pytest.raises(ValueError, match='same out directory'):
+        batch.load_manifest(str(path))
+
+
+def test_mapped_once(tmp_path):
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'\0' * 16)
+    assert batch.mapped(str(path)) is batch.mapped(str(path))
@@ -0,0 +1,163 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from reflex import fuzzer as F
+from reflex import simplify as S
+from reflex import synth
+from reflex.dfa import DFA
+from reflex.re import Regexp
+from reflex.reflex import Target
+from reflex.reflex import decompress
+from reflex.reflex import reflex
+from reflex.sampler import Program
+from reflex.transitions import Transitions
+
+pytest.importorskip('pytest_benchmark')
+
+# Run with `pytest tests/test_bench.py` (or skip them with --benchmark-skip)
+# and compare runs with --benchmark-autosave / --benchmark-compare
+SIZES = [100, 1000, 10000]
+# States per rule block of the synthetic lexers: rules are local, as in real
+# lexers, instead of every state reaching every rule
+BLOCK = 64
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda n: '{}-states'.format(n))
+def blob(request, tmp_path_factory):
+    lexer = synth.make_lexer(request.param, seed=request.param, block=BLOCK)
+    root = tmp_path_factory.mktemp('lexer')
+    path = str(root / 'lexer.bin')
+    layout = synth.write_blob(path, lexer)
+    return lexer, synth.to_config(path, str(root), lexer, layout)
+
+
+@pytest.fixture(scope='module')
+def dfa(blob, tmp_path_factory):
+    lexer, _ = blob
+    ec = lexer.tables['yy_ec']
+    classes = np.zeros((lexer.transitions.shape[1], 256), dtype=bool)
+    classes[ec[1:], np.arange(1, 256)] = True
+    transitions = lexer.transitions.copy()
+    transitions[transitions >= lexer.max_state] = -1
+    path = str(tmp_path_factory.mktemp('dfa') / 'G.rdfa')
+    DFA.from_table(transitions, lexer.tables['yy_accept'], classes).save(path)
+    return path
+
+
+def test_target_load(benchmark, blob):
+    _, config = blob
+    benchmark(lambda: Target(config).close())
+
+
+def test_target_reads(benchmark, blob):
+    lexer, config = blob
+    flex = Target(config)
+
+    # One chk probe per (state, class), through the scalar accessors
+    def walk():
+        for s in range(1, lexer.max_state):
+            b = flex.yy_base(s)
+            for c in range(1, lexer.transitions.shape[1]):
+                flex.yy_chk(b + c)
+
+    benchmark(walk)
+    flex.close()
+
+
+def test_decompress(benchmark, blob):
+    lexer, config = blob
+    flex = Target(config)
+    classes = set(range(1, lexer.transitions.shape[1]))
+    table = benchmark(decompress, flex, lexer.max_state, classes)
+    assert np.array_equal(table, lexer.transitions)
+    flex.close()
+
+
+@pytest.mark.parametrize('mode', ['vector', 'memo'])
+def test_reflex(benchmark, blob, mode):
+    _, config = blob
+    benchmark(reflex, config._replace(decompress=mode))
+
+
+def test_simplify(benchmark, dfa, tmp_path):
+    benchmark(S.simplify, dfa, str(tmp_path))
+
+
+def test_write_dfa(benchmark, dfa, tmp_path):
+    d = DFA.load(dfa)
+    nodes = d.reachable_from(1)
+    benchmark(S.write_dfa, str(tmp_path / '1_1.dfa'), d, nodes, 1, 1)
+
+
+def solve_regex(r):
+    # The recursive sampler the fuzzer used before reflex.sampler, kept as
+    # the baseline of test_sample
+    if r.is_re_set():
+        return random.choice(r.contents),
+    elif r.is_literal():
+        return r.contents
+    elif r.is_then():
+        return itertools.chain(solve_regex(r.contents[0]), solve_regex(r.contents[1]))
+    elif r.is_or():
+        return solve_regex(random.choice(r.contents))
+    elif r.is_optional():
+        if random.random() >= 0.5:
+            return solve_regex(random.choice(r.contents))
+        return []
+    elif r.is_star():
+        ret = []
+        while random.random() >= 0.3:
+            ret = itertools.chain(ret, solve_regex(r.contents[0]))
+        return ret
+    elif r.is_plus():
+        ret = solve_regex(r.contents[0])
+        while random.random() >= 0.3:
+            ret = itertools.chain(ret, solve_regex(r.contents[0]))
+        return ret
+    raise ValueError('cannot sample {}'.format(r.__class__.__name__))
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_solve_regex(benchmark, size):
+    r = Regexp.from_json(synth.make_regexp(size, seed=size))
+    random.seed(size)
+    benchmark(lambda: list(solve_regex(r)))
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_sample(benchmark, size):
+    program = Program.compile(Regexp.from_json(synth.make_regexp(size, seed=size)))
+    random.seed(size)
+    benchmark(program.sample)
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda n: '{}-tokens'.format(n))
+def testcases(request):
+    rm = {1: [Regexp.from_json(synth.make_regexp(20, seed=i)) for i in range(10)]}
+    generate_one = F.mk_generate_one(rm)
+    random.seed(request.param)
+    tokens = [list(generate_one()) for _ in range(request.param)]
+    return generate_one, tokens, tokens[::-1]
+
+
+@pytest.mark.parametrize('transform', F.get_transforms()[0], ids=lambda t: t.__name__)
+def test_transform1(benchmark, testcases, transform):
+    generate_one, tokens, _ = testcases
+    benchmark(lambda: list(transform(generate_one, tokens)))
+
+
+@pytest.mark.parametrize('transform', F.get_transforms()[1], ids=lambda t: t.__name__)
+def test_transform2(benchmark, testcases, transform):
+    _, aa, bb = testcases
+    benchmark(lambda: list(transform(aa, bb)))
+
+
+def test_transitions_lookup(benchmark, dfa):
+    t = Transitions.from_dfa(DFA.load(dfa))
+    rnd = np.random.default_rng(0)
+    states = rnd.integers(0, t.n_states, 1 << 20)
+    data = rnd.integers(0, 256, 1 << 20)
+    benchmark(t.lookup, states, data)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from reflex import corpus
+from reflex.coverage import sparse
+
+
+def test_entries(tmp_path):
+    q = str(tmp_path)
+    corpus.write_entry(q, 'id:000001,src:000000,op:token', [b'ab', [99], b'', b'd'])
+    (tmp_path / 'id:000000,orig:seed').write_bytes(b'seed')
+    (tmp_path / 'README.txt').write_bytes(b'')
+    (tmp_path / '.state').mkdir()
+
+    assert corpus.entries(q) == [(0, 'id:000000,orig:seed'), (1, 'id:000001,src:000000,op:token')]
+    assert (tmp_path / 'id:000001,src:000000,op:token').read_bytes() == b'abcd'
+    assert corpus.read_entry(q, 'id:000001,src:000000,op:token') == [b'ab', b'c', b'', b'd']
+    # Nobody recorded the tokens of afl-fuzz's entries
+    assert corpus.read_entry(q, 'id:000000,orig:seed') == [b'seed']
+    # ... nor those of entries rewritten behind our back
+    (tmp_path / 'id:000001,src:000000,op:token').write_bytes(b'abcde')
+    assert corpus.read_entry(q, 'id:000001,src:000000,op:token') == [b'abcde']
+
+
+def test_synced(tmp_path):
+    assert corpus.read_synced(str(tmp_path)) == {}
+    corpus.write_synced(str(tmp_path), 'afl1', 3)
+    corpus.write_synced(str(tmp_path), 'afl1', 5)
+    corpus.write_synced(str(tmp_path), 'bbz', 0)
+    assert corpus.read_synced(str(tmp_path)) == {'afl1': 5, 'bbz': 0}
+
+
+def trace(*hits):
+    t = np.zeros(64, dtype=np.uint8)
+    for i, v in hits:
+        t[i] = v
+    return sparse(t)
+
+
+def test_cmin():
+    traces = [
+        trace((1, 1), (2, 1)),
+        trace((1, 1)),
+        trace((1, 1), (2, 1), (3, 1)),
+        # Same tuple, another bucket
+        trace((1, 2)),
+        trace((2, 1)),
+    ]
+    sizes = [5, 1, 10, 100, 2]
+    assert corpus.cmin(traces, sizes, 64) == [1, 2, 3, 4]
+    # Ties go to the first one
+    assert corpus.cmin([trace((1, 1)), trace((1, 1))], [1, 1], 64) == [0]
@@ -0,0 +1,37 @@
+import numpy as np
+
+from reflex.coverage import NEW_HIT_COUNT
+from reflex.coverage import NEW_TUPLE
+from reflex.coverage import NO_NEW_BITS
+from reflex.coverage import VirginMap
+from reflex.coverage import classify
+from reflex.coverage import coverage_hash
+
+
+def trace(**hits):
+    t = np.zeros(64, dtype=np.uint8)
+    for k, v in hits.items():
+        t[int(k[1:])] = v
+    return t
+
+
+def test_classify():
+    t = np.array([0, 1, 2, 3, 4, 7, 8, 15, 16, 31, 32, 127, 128, 255, 0, 0], dtype=np.uint8)
+    assert classify(t) is t
+    assert t.tolist() == [0, 1, 2, 4, 8, 8, 16, 16, 32, 32, 64, 64, 128, 128, 0, 0]
+
+
+def test_virgin():
+    virgin = VirginMap(64)
+    assert virgin.has_new_bits(classify(trace(e3=1))) == NEW_TUPLE
+    assert virgin.has_new_bits(classify(trace(e3=1))) == NO_NEW_BITS
+    # Same tuple, new bucket
+    assert virgin.has_new_bits(classify(trace(e3=5))) == NEW_HIT_COUNT
+    assert virgin.has_new_bits(classify(trace(e3=6))) == NO_NEW_BITS
+    assert virgin.has_new_bits(classify(trace(e3=1, e40=2))) == NEW_TUPLE
+    assert virgin.coverage() == 2 / 64
+
+
+def test_hash():
+    assert coverage_hash(trace(e1=1)) == coverage_hash(trace(e1=1))
+    assert coverage_hash(trace(e1=1)) != coverage_hash(trace(e1=2))
@@ -0,0 +1,77 @@
+import json
+import re
+
+from reflex import dfa2re as D
+from reflex import re as R
+
+
+def to_python(j):
+    tag, c = j['tag'], j['contents']
+    if tag == 'Literal':
+        return re.escape(chr(c))
+    elif tag == 'RESet':
+        return '[' + ''.join(re.escape(chr(x)) for x in c) + ']'
+    elif tag == 'Then':
+        return '(?:{}{})'.format(to_python(c[0]), to_python(c[1]))
+    elif tag == 'Or':
+        return '(?:{}|{})'.format(to_python(c[0]), to_python(c[1]))
+    elif tag == 'Star':
+        return '(?:{})*'.format(to_python(c))
+    elif tag == 'OneOrMore':
+        return '(?:{})+'.format(to_python(c))
+    elif tag == 'Optional':
+        return '(?:{})?'.format(to_python(c))
+
+
+def test_keyword():
+    r = D.dfa_to_regex(1, {1: False, 2: False, 3: True}, [(1, 2, [(105, 105)]), (2, 3, [(102, 102)])])
+    assert D.to_json(r) == {'tag': 'Then', 'contents': [
+        {'tag': 'Literal', 'contents': 105},
+        {'tag': 'Literal', 'contents': 102},
+    ]}
+
+
+def test_loops():
+    # return[ \t]*\n, with a second way out through ';'
+    edges = [
+        (1, 2, [(114, 114)]),
+        (2, 2, [(9, 9), (32, 32)]),
+        (2, 3, [(10, 10), (59, 59)]),
+        (3, 4, [(48, 57)]),
+        (4, 4, [(48, 57)]),
+    ]
+    r = D.dfa_to_regex(1, {1: False, 2: False, 3: True, 4: True}, edges)
+    j = json.loads(json.dumps(D.to_json(r)))
+    assert R.Regexp.from_json(j) is not None
+
+    p = re.compile(to_python(j))
+    for s in ['r\n', 'r \t ;', 'r;0', 'r\n123']:
+        assert p.fullmatch(s)
+    for s in ['', 'r', 'r0', 'r;;', 'r\n1a']:
+        assert not p.fullmatch(s)
+
+
+def test_empty_language():
+    assert D.dfa_to_regex(1, {1: False, 2: False}, [(1, 2, [(97, 97)])]) is None
+
+
+def test_convert(tmp_path):
+    fp = tmp_path / '3_1.dfa'
+    fp.write_text('reflex-dfa 2\n1\n2\n1 0\n2 1\n2\n1 2 97-99\n2 2 48-57\n')
+    assert D.convert(str(fp), str(fp) + '.regexp')
+    with open(str(fp) + '.regexp') as f:
+        regexp = R.load_regexp(f.read())
+    assert regexp.is_then()
+
+
+def test_bundle(tmp_path):
+    files = []
+    for name, text in [('3_1.dfa', '1 2 97-99\n'), ('4_1.dfa', '1 2 48-57\n'), ('5_2.dfa', '')]:
+        fp = tmp_path / name
+        fp.write_text('reflex-dfa 2\n1\n2\n1 0\n2 1\n{}\n{}'.format(len(text.splitlines()), text))
+        files.append(str(fp))
+    bundle = str(tmp_path / 'regexps.rregex')
+    assert D.main(files, bundle=bundle) == [True, True, False]
+    entries = R.load_regexps(bundle)
+    assert [rs for rs, _ in entries] == [(3, 1), (4, 1)]
+    assert entries[0][1] == R.RESet([97, 98, 99])
@@ -0,0 +1,107 @@
+import keyword
+import struct
+
+from reflex.discover import discover
+from reflex.discover import to_args
+
+
+def keyword_lexer():
+    # Python keywords (rule 1) and identifiers (rule 2) over [a-z], with the
+    # states numbered breadth first like flex does
+    words = [w for w in keyword.kwlist if w.islower()]
+    letters = sorted(set(''.join(words)))
+    ec = [0] * 256
+    for b in range(1, 256):
+        ec[b] = len(letters) + 2
+    for b in range(ord('a'), ord('z') + 1):
+        ec[b] = len(letters) + 1
+    for i, c in enumerate(letters):
+        ec[ord(c)] = i + 1
+    numecs = len(letters) + 2
+
+    trie = {'': 1}
+    ident = 2
+    order = ['']
+    for prefix in order:
+        for c in letters:
+            if any(w.startswith(prefix + c) for w in words) and prefix + c not in trie:
+                trie[prefix + c] = len(trie) + 2
+                order.append(prefix + c)
+    jam = len(trie) + 2
+    max_state = jam + 1
+
+    rows = {ident: {c: ident for c in range(1, numecs)}}
+    for prefix, s in trie.items():
+        rows[s] = {c: ident for c in range(1, numecs)}
+        for c in letters:
+            if prefix + c in trie:
+                rows[s][ec[ord(c)]] = trie[prefix + c]
+    rows[jam] = {c: jam for c in range(1, numecs + 1)}
+
+    accept = [0] * max_state
+    accept[ident] = 2
+    for prefix, s in trie.items():
+        if prefix:
+            accept[s] = 1 if prefix in words else 2
+
+    # Every state but the jam state defaults to it
+    base = [0] * max_state
+    deff = [jam] * max_state
+    deff[jam] = 0
+    chk = [0]
+    nxt = [0]
+    for s in [jam] + sorted(set(rows) - {jam}):
+        b = 0
+        while any(b + c < len(chk) and chk[b + c] for c in rows[s]):
+            b += 1
+        for c, t in rows[s].items():
+            while len(chk) <= b + c:
+                chk.append(0)
+                nxt.append(0)
+            chk[b + c] = s
+            nxt[b + c] = t
+        base[s] = b
+    pad = max(base) + numecs + 1 - len(chk)
+    chk += [0] * pad
+    nxt += [0] * pad
+
+    meta = [0] + [1] * numecs
+    return max_state, {
+        'yy_accept': (accept, 2),
+        'yy_meta': (meta, 1),
+        'yy_nxt': (nxt, 2),
+        'yy_ec': (ec, 1),
+        'yy_chk': (chk, 4),
+        'yy_def': (deff, 2),
+        'yy_base': (base, 4),
+    }
+
+
+def write_blob(path, tables, endianness):
+    fmt = '<' if endianness == 'little' else '>'
+    blob = bytearray(b'\xcc' * 100)
+    offsets = {}
+    for name, (values, size) in tables.items():
+        blob += b'\0' * (-len(blob) % 4) + b'\xaa' * 8
+        offsets[name] = len(blob)
+        blob += struct.pack(fmt + {1: 'B', 2: 'H', 4: 'I'}[size] * len(values), *values)
+    blob += b'\xcc' * 100
+    path.write_bytes(bytes(blob))
+    return offsets
+
+
+def test_discover(tmp_path):
+    max_state, tables = keyword_lexer()
+    for endianness in ('little', 'big'):
+        path = tmp_path / endianness
+        offsets = write_blob(path, tables, endianness)
+
+        layout = discover(str(path))[0]
+        assert layout.endianness == endianness
+        assert layout.max_state == max_state
+        for name, (_, size) in tables.items():
+            assert layout.tables[name][:2] == (offsets[name], size), name
+
+        args = to_args(layout)
+        assert '--max-state {}'.format(max_state) in args
+        assert ('--endianness big' in args) == (endianness == 'big')
@@ -0,0 +1,40 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from reflex import dot
+
+
+@pytest.fixture
+def dfa(make_dfa):
+    # 1 -[a-c]-> 2 -["\\]-> 3, 2 accepts rule 1 and 3 rule 2
+    return make_dfa([b'abc', b'"\\'], [(1, 1, 2), (2, 2, 3)], [0, 0, 1, 2])
+
+
+def test_write_dot(tmp_path, dfa):
+    path = str(tmp_path / 'out.dot')
+    assert dot.write_dot(path, dfa, [1, 2, 3], rule=1) == 2
+    with open(path) as f:
+        assert f.read() == (
+            'strict digraph {\n'
+            '\t1\t[accepts=0, label="|1|"];\n'
+            '\t2\t[accepts=1, label="|2|/1", shape=doublecircle];\n'
+            '\t3\t[accepts=0, label="|3|/None"];\n'
+            '\t1 -> 2\t[alphabet="97-99", label="\'abc\'"];\n'
+            '\t2 -> 3\t[alphabet="34 92", label="\'\\"\\\\\\\\\'"];\n'
+            '}\n'
+        )
+
+    # Edges leaving the selected states are dropped
+    assert dot.write_dot(path, dfa, [1]) == 0
+
+
+def test_write_graphml(tmp_path, dfa):
+    path = str(tmp_path / 'out.graphml')
+    assert dot.write_graphml(path, dfa) == 2
+    ns = {'g': 'http://graphml.graphdrawing.org/xmlns'}
+    graph = ET.parse(path).getroot().find('g:graph', ns)
+    assert [n.get('id') for n in graph.findall('g:node', ns)] == ['0', '1', '2', '3']
+    edge = graph.findall('g:edge', ns)[1]
+    assert (edge.get('source'), edge.get('target')) == ('2', '3')
+    assert [d.text for d in edge.findall('g:data', ns)] == [repr('"\\'), '34 92']
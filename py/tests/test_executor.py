@@ -0,0 +1,41 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+from reflex.executor import ForkserverExecutor
+from reflex.executor import SharedMap
+
+TARGET = os.path.join(os.path.dirname(__file__), 'forkserver_target.py')
+
+
+def test_shared_map():
+    m = SharedMap(4096)
+    m.array[:] = 7
+    assert m.array.sum() == 7 * 4096
+    m.close()
+    m.close()
+
+
+def test_forkserver(tmp_path):
+    argv = [sys.executable, TARGET, '@@']
+    with ForkserverExecutor(argv, str(tmp_path / 'input'), qemu=False, timeout=0.5) as executor:
+        for _ in range(3):
+            code, cov = executor.run(b'abc')
+            assert code == 3
+            assert np.flatnonzero(cov).tolist() == sorted(zlib.crc32(p) % len(cov) for p in (b'a', b'ab', b'abc'))
+
+        # The map is cleared between runs
+        code, cov = executor.run(b'x')
+        assert code == 1 and cov.sum() == 1
+
+        assert executor.run(b'crash') == (-11, None)
+        assert executor.run(b'hang') == (None, None)
+        assert executor.run(b'abcdefg')[0] == 0
+
+
+def test_forkserver_missing(tmp_path):
+    with pytest.raises(RuntimeError, match='did not start a forkserver'):
+        ForkserverExecutor([sys.executable, '-c', 'pass'], str(tmp_path / 'input'), qemu=False)
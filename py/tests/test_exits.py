@@ -0,0 +1,40 @@
+import numpy as np
+
+from reflex.dfa import pack_alphabets
+from reflex.dfa import unpack_alphabets
+from reflex.exits import Exits
+
+
+def test_pack():
+    masks = np.zeros((2, 256), dtype=bool)
+    masks[0, [0, 63, 64, 255]] = True
+    words = pack_alphabets(masks)
+    assert words.shape == (2, 4)
+    assert words[0].tolist() == [1 | 1 << 63, 1, 0, 1 << 63]
+    assert np.array_equal(unpack_alphabets(words), masks)
+
+
+def test_exits(tmp_path, ident_dfa):
+    exits = Exits.from_dfa(ident_dfa)
+    assert list(exits) == [2, 3]
+    assert 1 not in exits
+
+    # Every edge counts, not only the last one
+    everything = set(range(1, 256))
+    assert set(exits.bytes(2)) == everything - set(b'abcdefghijklmnopqrstuvwxyz0123456789')
+    assert set(exits.bytes(3)) == everything
+    assert not exits.exits_on(2, ord('a')) and exits.exits_on(2, ord('!'))
+    assert exits.states_on(ord('5')).tolist() == [3]
+    assert exits.states_on(0).tolist() == []
+
+    path = str(tmp_path / 'exits.rexits')
+    exits.save(path)
+    loaded = Exits.load(path)
+    assert loaded.to_dict() == exits.to_dict()
+
+
+def test_empty(tmp_path):
+    path = str(tmp_path / 'exits.rexits')
+    Exits(np.zeros(0, np.uint32), np.zeros((0, 4), np.uint64)).save(path)
+    loaded = Exits.load(path)
+    assert list(loaded) == [] and loaded.to_dict() == {}
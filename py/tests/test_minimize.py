@@ -0,0 +1,38 @@
+import numpy as np
+
+from reflex.dfa import DFA
+from reflex.minimize import minimize
+from reflex.minimize import quotient
+
+
+def test_minimize():
+    # Two copies of [0-9]+ hanging off state 1: 1 -a-> 2 -d-> 3 -d-> 3
+    #                                             1 -b-> 4 -d-> 5 -d-> 5
+    classes = np.zeros((4, 256), dtype=bool)
+    classes[1, ord('a')] = True
+    classes[2, ord('b')] = True
+    classes[3, [ord(c) for c in '0123456789']] = True
+    table = np.full((6, 4), -1)
+    table[1, 1] = 2
+    table[1, 2] = 4
+    table[2, 3] = 3
+    table[3, 3] = 3
+    table[4, 3] = 5
+    table[5, 3] = 5
+    dfa = DFA.from_table(table, [0, 0, 0, 7, 0, 7], classes)
+
+    rep = minimize(dfa)
+    assert list(rep) == [0, 1, 2, 3, 2, 3]
+
+    q = quotient(dfa, rep)
+    assert list(q.successors(1)) == [2]
+    assert list(q.successors(4)) == []
+    assert list(q.reachable_from(1)) == [1, 2, 3]
+
+    # Telling accept codes apart keeps the copies separate
+    rep = minimize(dfa, accepts=[0, 0, 0, 7, 0, 8])
+    assert list(rep) == [0, 1, 2, 3, 4, 5]
+
+    # Outside of `nodes` there is only the dead state
+    rep = minimize(dfa, nodes=[2, 3, 4])
+    assert list(rep) == [-1, -1, 2, 3, 4, -1]
@@ -0,0 +1,67 @@
+import json
+
+from reflex import re as R
+from reflex import synth
+
+
+WS = {'tag': 'Star', 'contents': {'tag': 'RESet', 'contents': [9, 32]}}
+
+
+def test_structural():
+    a = R.Regexp.from_json({'tag': 'Then', 'contents': [WS, {'tag': 'Literal', 'contents': 97}]})
+    b = R.load_regexp(json.dumps({'tag': 'Then', 'contents': [WS, {'tag': 'Literal', 'contents': 97}]}))
+    assert a is not b and a == b and hash(a) == hash(b)
+    assert a.is_then() and a.contents[0].is_star() and a.contents[1].contents == (97,)
+    # Same contents, other tag
+    assert R.Literal([97]) != R.RESet([97])
+    assert len({a, b, a.contents[0]}) == 2
+
+
+def test_interner():
+    interner = R.Interner()
+    rules = [{'tag': 'Then', 'contents': [WS, synth.make_regexp(10, seed=i)]} for i in range(3)]
+    a, b, c = [R.Regexp.from_json(j, interner) for j in rules]
+    assert a.contents[0] is b.contents[0] is c.contents[0]
+    assert R.Regexp.from_json(rules[0], interner) is a
+
+
+def test_deep(tmp_path):
+    j = {'tag': 'Literal', 'contents': 97}
+    for _ in range(50000):
+        j = {'tag': 'Then', 'contents': [{'tag': 'Literal', 'contents': 98}, j]}
+    assert R.Regexp.from_json(j).is_then()
+
+    # Equal without being the same objects, down to the leaves
+    a, b = R.Literal([97]), R.Literal([97])
+    for _ in range(5000):
+        a, b = R.Star([a]), R.Star([b])
+    assert a == b and a != R.Star([a])
+    c = R.Literal([98])
+    for _ in range(5000):
+        c = R.Star([c])
+    assert a != c
+
+    # ... and so can go in a bundle without being interned
+    R.save_bundle(str(tmp_path / 'deep.rregex'), [(R.RS(1, 1), a), (R.RS(2, 1), b)])
+    (_, x), (_, y) = R.load_bundle(str(tmp_path / 'deep.rregex'))
+    assert x is y and x == a
+
+
+def test_bundle(tmp_path):
+    for i in range(5):
+        j = {'tag': 'Then', 'contents': [WS, synth.make_regexp(20, seed=i)]}
+        (tmp_path / '{}_{}.dfa.regexp'.format(i, i % 2)).write_text(json.dumps(j))
+    entries = R.load_regexps(str(tmp_path))
+    assert [rs for rs, _ in entries] == [(i, i % 2) for i in range(5)]
+
+    path = str(tmp_path / 'regexps.rregex')
+    R.save_bundle(path, entries)
+    interner = R.Interner()
+    loaded = R.load_regexps(path, interner)
+    assert loaded == entries
+    # Shared subtrees are stored (and loaded) once
+    assert loaded[0][1].contents[0] is loaded[4][1].contents[0]
+
+    # An empty bundle too (what dfa2re writes when every rule fails)
+    R.save_bundle(path, [])
+    assert R.load_bundle(path) == []
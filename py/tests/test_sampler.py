@@ -0,0 +1,98 @@
+import random
+import re
+
+import pytest
+
+from reflex import synth
+from reflex.re import RS
+from reflex.re import Regexp
+from reflex.sampler import HALT
+from reflex.sampler import Program
+from reflex.sampler import Repeat
+from reflex.sampler import Sampler
+
+
+def to_python(j):
+    tag, c = j['tag'], j['contents']
+    if tag == 'Literal':
+        return re.escape(bytes([c]))
+    elif tag == 'RESet':
+        return b'[' + b''.join(re.escape(bytes([x])) for x in c) + b']'
+    elif tag == 'Then':
+        return b'(?:' + to_python(c[0]) + to_python(c[1]) + b')'
+    elif tag == 'Or':
+        return b'(?:' + to_python(c[0]) + b'|' + to_python(c[1]) + b')'
+    elif tag == 'Star':
+        return b'(?:' + to_python(c) + b')*'
+    elif tag == 'OneOrMore':
+        return b'(?:' + to_python(c) + b')+'
+    elif tag == 'Optional':
+        return b'(?:' + to_python(c) + b')?'
+
+
+def lit(s):
+    return [{'tag': 'Literal', 'contents': c} for c in s]
+
+
+def then(*rs):
+    ret = rs[-1]
+    for r in reversed(rs[:-1]):
+        ret = {'tag': 'Then', 'contents': [r, ret]}
+    return ret
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches(seed):
+    j = synth.make_regexp(30, seed=seed)
+    python = re.compile(to_python(j), re.DOTALL)
+    program = Program.compile(Regexp.from_json(j))
+    random.seed(seed)
+    for _ in range(50):
+        assert python.fullmatch(program.sample())
+
+
+def test_compile():
+    # Literal runs end up in one instruction, and so do Ors of bytes
+    j = then(*lit(b'if'), {'tag': 'Or', 'contents': lit(b'(')[0:1] + lit(b' ')}, *lit(b'x'))
+    program = Program.compile(Regexp.from_json(j))
+    assert len(program.code) == 7 and program.code[-1] == HALT
+    assert program.literals == [b'if', b'x']
+    assert program.sets == [b'( ']
+    assert {program.sample() for _ in range(100)} == {b'if(x', b'if x'}
+
+
+def test_repeat():
+    j = {'tag': 'Star', 'contents': {'tag': 'Literal', 'contents': 97}}
+    random.seed(0)
+    program = Program.compile(Regexp.from_json(j), Repeat(0.5, 0.9, 0.5))
+    out, ends = program.batch(10000)
+    assert ends[-1] == len(out) == out.count(b'a')
+    # Geometric, 0.9 / (1 - 0.9) rounds on average
+    assert 8 < len(out) / 10000 < 10
+
+    with pytest.raises(ValueError):
+        Program.compile(Regexp.from_json(j), Repeat(0.5, 1.0, 0.5))
+
+
+def test_sampler():
+    rm = {
+        1: [Regexp.from_json(then(*lit(b'ab')))],
+        2: [Regexp.from_json({'tag': 'OneOrMore', 'contents': {'tag': 'RESet', 'contents': [48, 49]}})],
+        3: [],
+    }
+    random.seed(0)
+    tokens = Sampler(rm).tokens(1000)
+    assert len(tokens) == 1000
+    assert b'ab' in tokens
+    assert all(t == b'ab' or re.fullmatch(b'[01]+', t) for t in tokens)
+
+
+def test_sources():
+    entries = [
+        (RS(1, 0), Regexp.from_json(then(*lit(b'ab')))),
+        (RS(4, 0), Regexp.from_json(then(*lit(b'cd')))),
+        (RS(2, 5), Regexp.from_json(then(*lit(b'ef')))),
+    ]
+    sampler = Sampler.from_entries(entries)
+    assert sampler.names == ['1_0', '4_0', '2_5']
+    assert sampler.tokens(3, [2, 0, 2]) == [b'ef', b'ab', b'ef']
@@ -0,0 +1,35 @@
+import random
+
+from reflex.schedule import Bandit
+
+
+def test_bandit():
+    random.seed(1)
+    bandit = Bandit(['dud', 'good', 'meh'])
+    odds = [0.0, 0.5, 0.1]
+    for _ in range(2000):
+        arm = bandit.pick()
+        bandit.reward([arm], random.random() < odds[arm], 0.001)
+    picks = bandit.pick(1000)
+    assert picks.count(1) > 800
+
+    report = bandit.report()
+    assert sum(r['execs'] for r in report.values()) == 2000
+    assert report['good']['execs'] > report['dud']['execs']
+    assert report['good']['finds'] > 0 and report['dud']['finds'] == 0
+    assert report['good']['weight'] > report['meh']['weight'] > report['dud']['weight']
+
+
+def test_reward_counts_arms_once():
+    bandit = Bandit(['a', 'b'], decay=1.0)
+    bandit.reward([0, 0, 0], True, 2.0)
+    report = bandit.report()
+    assert report['a'] == {'execs': 1, 'finds': 1, 'seconds': 2.0, 'weight': 2 / 3}
+    assert report['b']['execs'] == 0
+
+
+def test_many_arms():
+    bandit = Bandit(str(i) for i in range(10000))
+    picks = bandit.pick(256)
+    assert len(picks) == 256
+    assert all(0 <= i < 10000 for i in picks)
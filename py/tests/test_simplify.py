@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from reflex import simplify as S
+
+
+@pytest.fixture
+def dfa(make_dfa):
+    # 1 -[a-c]-> 2 -[0-9]-> 2, 2 accepts rule 1
+    return make_dfa([b'abc', b'0123456789'], [(1, 1, 2), (2, 2, 2)], [0, 0, 1])
+
+
+def test_to_ranges():
+    alphabets = np.zeros((3, 256), dtype=bool)
+    alphabets[0, [1, 2, 3, 7, 255]] = True
+    alphabets[2, :] = True
+    assert S.to_ranges(alphabets) == [[(1, 3), (7, 7), (255, 255)], [], [(0, 255)]]
+
+
+def test_write_read_dfa(tmp_path, dfa):
+    fp = str(tmp_path / '1_1.dfa')
+    S.write_dfa(fp, dfa, [1, 2], 1, 1)
+
+    with open(fp) as f:
+        assert f.read() == 'reflex-dfa 2\n1\n2\n1 0\n2 1\n2\n1 2 97-99\n2 2 48-57\n'
+    assert not (tmp_path / '1_1.dfa.nfa').exists()
+
+    d = S.read_dfa(fp)
+    assert d.start == 1
+    assert d.accepting == {1: False, 2: True}
+    assert d.edges == [(1, 2, [(97, 99)]), (2, 2, [(48, 57)])]
+
+
+def test_read_dfa_v1(tmp_path):
+    fp = tmp_path / 'old.dfa'
+    fp.write_text('1\n2\n1 0\n2 1\n1\n1 2 97 98\n')
+    d = S.read_dfa(str(fp))
+    assert d.edges == [(1, 2, [(97, 97), (98, 98)])]
+
+
+def test_simplify_counts(tmp_path, dfa):
+    path = str(tmp_path / 'G.rdfa')
+    dfa.save(path)
+    out = tmp_path / 'out'
+    out.mkdir()
+    stats = S.simplify(path, str(out))
+    # One subgraph (rule 1 from state 1), its dot file does not count
+    assert stats.counters['subgraphs'] == 1
+    assert stats.counters['dfa_files'] == 1 and stats.counters['dot_files'] == 1
@@ -0,0 +1,72 @@
+import json
+import pstats
+
+from reflex.stats import AflStats
+from reflex.stats import Progress
+from reflex.stats import Stats
+from reflex.stats import profile_path
+from reflex.stats import profiled
+from reflex.stats import read_fuzzer_stats
+
+
+def test_stats(tmp_path):
+    stats = Stats()
+    with stats.phase('load'):
+        stats.count('states', 3)
+    with stats.phase('load'):
+        stats.count('states')
+    path = tmp_path / 'blob'
+    path.write_bytes(b'x' * 10)
+    stats.wrote(str(path))
+
+    other = Stats()
+    other.count('states', 2)
+    stats.merge(other)
+
+    report_path = tmp_path / 'report.json'
+    stats.dump(str(report_path))
+    report = json.loads(report_path.read_text())
+    assert set(report['phases']) == {'load'}
+    assert report['counters'] == {'states': 6, 'bytes_written': 10}
+    assert report['seconds'] >= report['phases']['load'] >= 0
+
+
+def test_progress(capsys):
+    progress = Progress('states', 1000, interval=3600)
+    for _ in range(1000):
+        progress.update()
+    assert capsys.readouterr().out == 'states: 1000/1000\n'
+
+
+def test_profiled(tmp_path):
+    with profiled(None, None):
+        pass
+
+    path = profile_path('cprofile', str(tmp_path))
+    with profiled('cprofile', path):
+        sum(range(100))
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_afl_stats(tmp_path):
+    asked = []
+
+    def coverage():
+        asked.append(1)
+        return 0.5
+
+    stats = AflStats(str(tmp_path), 'bbz', 'target @@')
+    stats.execs = 10
+    stats.path()
+    # Nothing due yet: the coverage is not even looked at
+    assert not stats.update(1, coverage)
+    assert not asked and not (tmp_path / 'fuzzer_stats').exists()
+
+    assert stats.update(1, coverage, force=True)
+    assert len(asked) == 1
+    fields = read_fuzzer_stats(str(tmp_path / 'fuzzer_stats'))
+    assert fields['execs_done'] == '10' and fields['paths_found'] == '1'
+    assert fields['bitmap_cvg'] == '50.00%'
+    for name in ('paths_favored', 'max_depth', 'cur_path', 'pending_favs', 'pending_total'):
+        assert fields[name] == '0'
+    assert len((tmp_path / 'plot_data').read_text().splitlines()) == 2
@@ -0,0 +1,109 @@
+import os
+import sys
+
+from reflex.coverage import VirginMap
+from reflex import fuzzer as F
+from reflex.stats import read_fuzzer_stats
+
+TARGET = os.path.join(os.path.dirname(__file__), 'forkserver_target.py')
+
+
+def queue(fuzzer):
+    return [fn for _, fn in F.corpus.entries(fuzzer.my_queue)]
+
+
+def mk_fuzzer(sync_dir, name, virgin=None, siblings=()):
+    argv = '{} {} @@'.format(sys.executable, TARGET)
+    file_path = str(sync_dir / name / '.cur_input')
+    return F.Fuzzer(str(sync_dir), {}, argv, file_path, name, 'native', virgin, siblings)
+
+
+def test_sync(tmp_path):
+    afl = tmp_path / 'afl1' / 'queue'
+    afl.mkdir(parents=True)
+    (afl / 'id:000000,orig:seed').write_bytes(b'abc')
+    (afl / 'id:000001,src:000000,op:havoc').write_bytes(b'abc')
+    (afl / '.state').mkdir()
+
+    fuzzer = mk_fuzzer(tmp_path, 'bbz')
+    fuzzer.sync()
+    # The second copy brings nothing new
+    assert queue(fuzzer) == ['id:000000,sync:afl1,src:000000,+cov']
+    assert [t.tokens for t in fuzzer.tests] == [[b'abc']]
+
+    (afl / 'id:000002,src:000000,op:havoc').write_bytes(b'abd')
+    fuzzer.sync()
+    assert queue(fuzzer)[1] == 'id:000001,sync:afl1,src:000002,+cov'
+    assert len(fuzzer.tests) == 2
+    fuzzer.executor.close()
+
+
+def test_siblings(tmp_path):
+    virgin = VirginMap()
+    a = mk_fuzzer(tmp_path, 'bbz0', virgin, ['bbz0', 'bbz1'])
+    b = mk_fuzzer(tmp_path, 'bbz1', virgin, ['bbz0', 'bbz1'])
+
+    assert a.run_one(F.Testcase([b'xy']), 'new', 'op:token')
+    # Same map: what a found is not new to b, but b can import it for free
+    assert not b.run_one(F.Testcase([b'xy']), 'new', 'op:token')
+    b.sync()
+    assert [t.tokens for t in b.tests] == [[b'xy']]
+    assert queue(b) == []
+
+    # ... and a does not import it back
+    a.sync()
+    assert len(a.tests) == 1
+    a.executor.close()
+    b.executor.close()
+
+
+def test_resume(tmp_path):
+    afl = tmp_path / 'afl1' / 'queue'
+    afl.mkdir(parents=True)
+    (afl / 'id:000000,orig:seed').write_bytes(b'abc')
+
+    fuzzer = mk_fuzzer(tmp_path, 'bbz')
+    assert fuzzer.run_one(F.Testcase([b'x', [121], iter(b'z')]), 'new', 'op:token')
+    fuzzer.sync()
+    fuzzer.executor.close()
+
+    fuzzer = mk_fuzzer(tmp_path, 'bbz')
+    fuzzer.resume()
+    assert [t.tokens for t in fuzzer.tests] == [[b'x', b'y', b'z'], [b'abc']]
+    assert fuzzer.queued == 2 and fuzzer.synced == {'afl1': 0}
+    # Nothing is new after a resume
+    assert not fuzzer.run_one(F.Testcase([b'xyz']), 'new', 'op:token')
+    fuzzer.sync()
+    assert fuzzer.queued == 2
+    fuzzer.executor.close()
+
+
+def test_cmin(tmp_path):
+    queue = tmp_path / 'queue'
+    queue.mkdir()
+    (queue / 'id:000000,orig:a').write_bytes(b'ab')
+    (queue / 'id:000001,orig:b').write_bytes(b'abc')
+    (queue / 'id:000002,orig:c').write_bytes(b'ab')
+    (queue / 'id:000003,orig:d').write_bytes(b'crash')
+    argv = '{} {} @@'.format(sys.executable, TARGET)
+    kept = F.cmin(str(queue), str(tmp_path / 'out'), argv, executor='native')
+    assert kept == ['id:000000,orig:a', 'id:000001,orig:b']
+    assert [fn for _, fn in F.corpus.entries(str(tmp_path / 'out'))] == kept
+
+
+def test_stats(tmp_path):
+    fuzzer = mk_fuzzer(tmp_path, 'bbz')
+    assert fuzzer.run_one(F.Testcase([b'xy']), 'new', 'op:token')
+    assert not fuzzer.run_one(F.Testcase([b'xy']), 'new', 'op:token')
+    fuzzer.write_stats(force=True)
+    fuzzer.executor.close()
+
+    stats = read_fuzzer_stats(str(tmp_path / 'bbz' / 'fuzzer_stats'))
+    assert stats['execs_done'] == '2'
+    assert stats['paths_total'] == stats['paths_found'] == '1'
+    assert stats['afl_banner'] == 'bbz'
+    assert stats['bitmap_cvg'].endswith('%')
+    plot = (tmp_path / 'bbz' / 'plot_data').read_text().splitlines()
+    assert plot[0].startswith('# unix_time') and len(plot) == 2
+    assert len(plot[1].split(', ')) == 11
+    assert (tmp_path / 'bbz' / 'reflex_stats.json').exists()
@@ -0,0 +1,83 @@
+import mmap
+
+import numpy as np
+import pytest
+
+from reflex import dot
+from reflex import synth
+from reflex.dfa import DFA
+from reflex.reflex import ChainResolver
+from reflex.reflex import SizedOffset
+from reflex.reflex import Target
+from reflex.reflex import decompress
+from reflex.reflex import reflex
+
+
+def test_roundtrip(tmp_path):
+    lexer = synth.make_lexer(300, n_classes=20, seed=7)
+    classes = set(range(1, lexer.transitions.shape[1]))
+    for endianness in ('little', 'big'):
+        path = str(tmp_path / endianness)
+        layout = synth.write_blob(path, lexer, endianness=endianness, seed=1)
+        flex = Target(synth.to_config(path, str(tmp_path), lexer, layout, endianness))
+
+        assert flex.yy_chk(flex.yy_base(lexer.max_state - 1) + 1) == lexer.max_state - 1
+        assert np.array_equal(decompress(flex, lexer.max_state, classes), lexer.transitions)
+        resolved = ChainResolver(flex, lexer.max_state).table(lexer.max_state, classes)
+        assert np.array_equal(resolved, lexer.transitions)
+        flex.close()
+
+
+def test_sizes():
+    lexer = synth.make_lexer(100, seed=1)
+    assert synth.sizes(lexer) == dict(synth.sizes(lexer), yy_ec=1, yy_meta=1, yy_chk=2)
+    lexer.tables['yy_nxt'][0] = 0x8000
+    assert synth.sizes(lexer)['yy_nxt'] == 4
+
+
+def test_blocks(tmp_path):
+    lexer = synth.make_lexer(1000, seed=3, block=64)
+    path = str(tmp_path / 'lexer.bin')
+    layout = synth.write_blob(path, lexer)
+    flex = Target(synth.to_config(path, str(tmp_path), lexer, layout))
+    classes = set(range(1, lexer.transitions.shape[1]))
+    assert np.array_equal(decompress(flex, lexer.max_state, classes), lexer.transitions)
+    flex.close()
+
+    # Every state but the start one reaches (at most) the rule of its block
+    t = lexer.transitions
+    accept = np.array(lexer.tables['yy_accept'])
+    for s in range(2, 1001):
+        targets = t[s][(t[s] > 0) & (t[s] < 1001)]
+        assert ((targets - 2) // 64 == (s - 2) // 64).all()
+    for lo in range(2, 1001, 64):
+        assert len(set(accept[lo:lo + 64].tolist()) - {0}) <= 1
+
+
+def test_edges_counted(tmp_path):
+    lexer = synth.make_lexer(300, seed=5, block=32)
+    path = str(tmp_path / 'lexer.bin')
+    layout = synth.write_blob(path, lexer)
+    for minimize in (False, True):
+        # Without the dot output too, and the same as the dot would draw
+        config = synth.to_config(path, str(tmp_path), lexer, layout, outputs=('rdfa',), minimize=minimize)
+        edges = reflex(config).counters['edges']
+        # (the merged states are left without edges in G.rdfa)
+        dfa = DFA.load(str(tmp_path / 'G.rdfa'))
+        assert edges == dot.write_dot(str(tmp_path / 'G.dot'), dfa) > 0
+
+
+def test_target_closes_on_error(tmp_path, monkeypatch):
+    lexer = synth.make_lexer(100, seed=1)
+    path = str(tmp_path / 'lexer.bin')
+    layout = synth.write_blob(path, lexer)
+    config = synth.to_config(path, str(tmp_path), lexer, layout)
+    # More of yy_nxt than the file has
+    config = config._replace(yy_nxt=SizedOffset(*layout['yy_nxt'], 1 << 20))
+
+    maps = []
+    real = mmap.mmap
+    monkeypatch.setattr(mmap, 'mmap', lambda *args, **kwargs: maps.append(real(*args, **kwargs)) or maps[-1])
+    with pytest.raises(ValueError, match='does not fit'):
+        Target(config)
+    assert len(maps) == 1 and maps[0].closed
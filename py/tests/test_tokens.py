@@ -0,0 +1,97 @@
+import collections
+import random
+import re
+
+import numpy as np
+
+from reflex import synth
+from reflex import tokens as T
+from reflex.dfa import DFA
+from reflex.simplify import read_dfa
+
+
+def automaton(tmp_path, text):
+    fp = tmp_path / '3_1.dfa'
+    fp.write_text(text)
+    return T.Automaton.from_file(read_dfa(str(fp)))
+
+
+# [a-c][0-9]* and a dead end
+ID = 'reflex-dfa 2\n1\n3\n1 0\n2 1\n3 0\n3\n1 2 97-99\n2 2 48-57\n1 3 100\n'
+
+
+def test_shortest(tmp_path):
+    a = automaton(tmp_path, ID)
+    # The dead end is gone
+    assert sorted(a.graph.index) == [1, 2]
+    assert T.shortest(a) == b'a'
+    assert T.k_shortest(a, 3) == [b'a', b'a0', b'a00']
+    assert T.k_shortest(a, 5, bytes_per_edge=None) == [b'a', b'b', b'c', b'a0', b'a1']
+
+    # Finite languages run out
+    a = automaton(tmp_path, 'reflex-dfa 2\n1\n2\n1 0\n2 1\n1\n1 2 120-121\n')
+    assert T.k_shortest(a, 10, bytes_per_edge=None) == [b'x', b'y']
+    assert automaton(tmp_path, 'reflex-dfa 2\n1\n2\n1 0\n2 0\n1\n1 2 120\n') is None
+
+
+def test_sample(tmp_path):
+    a = automaton(tmp_path, ID)
+    random.seed(0)
+    samples = [T.sample(a, max_len=3) for _ in range(3000)]
+    assert all(re.fullmatch(b'[a-c][0-9]{0,2}', s) for s in samples)
+    # Lengths are picked uniformly, then strings of that length
+    lengths = collections.Counter(len(s) for s in samples)
+    assert all(900 < lengths[n] < 1100 for n in (1, 2, 3))
+    firsts = collections.Counter(s[:1] for s in samples)
+    assert all(900 < firsts[c] < 1100 for c in (b'a', b'b', b'c'))
+
+
+def test_rule_automata():
+    lexer = synth.make_lexer(200, seed=1)
+    ec = lexer.tables['yy_ec']
+    classes = np.zeros((lexer.transitions.shape[1], 256), dtype=bool)
+    classes[ec[1:], np.arange(1, 256)] = True
+    transitions = lexer.transitions.copy()
+    transitions[transitions >= lexer.max_state] = -1
+    # Like flex's start states, nothing goes back to 1
+    transitions[transitions == 1] = -1
+    dfa = DFA.from_table(transitions, lexer.tables['yy_accept'], classes)
+
+    automata = T.rule_automata(dfa)
+    assert automata
+    random.seed(0)
+    for rs, a in automata.items():
+        for token in T.k_shortest(a, 3) + [T.sample(a, 8) for _ in range(5)]:
+            s = rs.state
+            for b in token:
+                s = int(dfa.transitions[s, ec[b]])
+            assert dfa.accepts[s] == rs.rule
+
+
+def test_pool(tmp_path):
+    a = automaton(tmp_path, ID)
+    pool = T.TokenPool({T.RS(3, 1): a}, size=20, shortest=4)
+    random.seed(0)
+    drawn = pool.tokens(1000)
+    tokens, seen = pool.pools[T.RS(3, 1)]
+    assert len(tokens) == len(seen) == 20
+    assert set(tokens) <= set(drawn)
+    assert pool.names == ['3_1']
+    assert len(pool.tokens(5, [0] * 5)) == 5
+
+
+def test_longer_than_max_len(tmp_path):
+    # A 40-byte literal, longer than MAX_LEN
+    word = b'x' * 40
+    edges = ''.join('{} {} 120\n'.format(i, i + 1) for i in range(1, 41))
+    a = automaton(tmp_path, 'reflex-dfa 2\n1\n41\n{}{}\n40\n{}'.format(
+        ''.join('{} 0\n'.format(i) for i in range(1, 41)), '41 1', edges))
+    assert T.sample(a) is None
+    pool = T.TokenPool({T.RS(3, 1): a}, shortest=0)
+    assert pool.tokens(3) == [word] * 3
+
+
+def test_dictionary(tmp_path):
+    path = tmp_path / 'tokens.dict'
+    T.write_dictionary(str(path), [('r1_1_0', b'if'), ('r2_1_0', b'"\\\n\xff')])
+    assert path.read_text() == 'r1_1_0="if"\nr2_1_0="\\x22\\x5c\\x0a\\xff"\n'
@@ -0,0 +1,24 @@
+import numpy as np
+
+from reflex.transitions import Transitions
+
+
+def test_transitions(tmp_path, ident_dfa):
+    path = str(tmp_path / 'G.rtrans')
+    Transitions.from_dfa(ident_dfa).save(path)
+    t = Transitions.load(path)
+
+    assert t.next.shape == (4, 256)
+    assert t.step(1, ord('q')) == (2, 1)
+    assert t.step(2, ord('7')) == (3, 2)
+    assert t.step(1, ord('7')) is None
+    assert t.step(2, 0) is None
+
+    v, accepts = t.lookup(np.array([1, 1, 2, 3]), np.frombuffer(b'a0a0', dtype=np.uint8))
+    assert v.tolist() == [2, t.none, 2, t.none]
+    assert accepts.tolist() == [1, 0, 1, 0]
+
+    assert t.walk(b'ab1!') == [2, 2, 3]
+    assert t.longest_match(b'ab1!') == (3, 2)
+    assert t.longest_match(b'ab!') == (2, 1)
+    assert t.longest_match(b'1') == (0, 0)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+
+import reflex.tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tokens of every rule, straight from the DFAs, as an AFL dictionary')
+    parser.add_argument('dfa', metavar='G.rdfa|simple/', type=str, help='the whole DFA or the N_M.dfa files of simplify.py')
+    parser.add_argument('-o', '--output', metavar='tokens.dict', type=str, required=True)
+    parser.add_argument('-k', '--shortest', metavar='K', type=int, default=1, help='the K shortest tokens of every rule')
+    parser.add_argument('-s', '--samples', metavar='N', type=int, default=0, help='N more random tokens of every rule')
+    parser.add_argument('--max-len', type=int, default=reflex.tokens.MAX_LEN, help='of the random tokens')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    automata = reflex.tokens.load_automata(args.dfa)
+    entries = []
+    for rs in sorted(automata):
+        a = automata[rs]
+        tokens = reflex.tokens.k_shortest(a, args.shortest)
+        seen = set(tokens)
+        for _ in range(args.samples if tokens else 0):
+            t = reflex.tokens.sample(a, args.max_len)
+            # None when the rule has nothing up to --max-len
+            if t is not None and t not in seen:
+                seen.add(t)
+                tokens.append(t)
+        for i, t in enumerate(tokens):
+            entries.append(('r{}_{}_{}'.format(rs.rule, rs.state, i), t))
+    reflex.tokens.write_dictionary(args.output, entries)
+    print('{} tokens of {} rules'.format(len(entries), len(automata)))
+
+
+if __name__ == '__main__':
+    main()
@@ -154,7 +154,11 @@ object Main {
 
     val stateMap: util.Map[String, State] = new util.HashMap[String, State]
 
-    val start: String = lines.next
+    // Version 1 files have no header and list every single character,
+    // version 2 files start with "reflex-dfa 2" and list `lo-hi` ranges.
+    val first: String = lines.next
+    val version: Int = if (first.startsWith("reflex-dfa")) first.split("\\s+")(1).toInt else 1
+    val start: String = if (version == 1) first else lines.next
     val noNodes: Int = lines.next.toInt
 
     var ctr: Int = 0
@@ -181,9 +185,16 @@ object Main {
       val end    = stateMap.get(tokens(1))
       // Iterate on chars (skip first two as they are the node indices)
       util.Arrays.stream(tokens).skip(2).forEach((ch: String) => {
-        val chars: Array[Char] = Character.toChars(ch.toInt)
-        assert(chars.length == 1)
-        beg.addTransition(new Transition(chars(0), end))
+        if (version == 1) {
+          val chars: Array[Char] = Character.toChars(ch.toInt)
+          assert(chars.length == 1)
+          beg.addTransition(new Transition(chars(0), end))
+        } else {
+          val bounds: Array[String] = ch.split("-")
+          val lo: Char = bounds(0).toInt.toChar
+          val hi: Char = bounds(bounds.length - 1).toInt.toChar
+          beg.addTransition(new Transition(lo, hi, end))
+        }
       })
 
       edge += 1
@@ -17,13 +17,15 @@ echo "=== STAGE 0 ==="
   ../flex/sleigh/stage0/
 
 ./py/simplify.py \
-  ../flex/sleigh/stage0/G.gpickle \
+  ../flex/sleigh/stage0/G.rdfa \
   ../flex/sleigh/out/
 
 echo "=== STAGE 1 ==="
 
-echo "SCALA"
-parallel -j 12 echo print {} ';' ./scala/jreflex.sh print "{}.regexp" "{}" ::: ../flex/sleigh/out/*.dfa
+echo "REGEXPS"
+./py/dfa2re.py -j 12 ../flex/sleigh/out/*.dfa
+#echo "SCALA"
+#parallel -j 12 echo print {} ';' ./scala/jreflex.sh print "{}.regexp" "{}" ::: ../flex/sleigh/out/*.dfa
 
 #echo "PROTO"
 #./scala/jreflex.sh proto ../flex/sleigh/out/out.proto ../flex/sleigh/out/*.dfa